@@ -1,42 +1,137 @@
 from fastapi import Request, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from functools import lru_cache
+from typing import Optional
+from services import user_cache
+from services.cache import TTLCache
+import hashlib
+import time
 import jwt
 import os
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 JWT_SECRET = os.environ.get("JWT_SECRET", "green_basket_secret_key_v1")
 JWT_ALGORITHM = "HS256"
+ACCESS_TOKEN_TTL = int(os.environ.get("ACCESS_TOKEN_TTL_MINUTES", "60")) * 60
+# /api/auth/refresh still accepts a token this long after it expired, e.g. a tab left asleep
+REFRESH_GRACE_SECONDS = int(os.environ.get("REFRESH_GRACE_MINUTES", "60")) * 60
+# Tokens issued before expiry existed carry no exp/iat. Accepted until they are all refreshed;
+# set to 0 to force everyone still holding one to log in again.
+ACCEPT_LEGACY_TOKENS = os.environ.get("ACCEPT_LEGACY_TOKENS", "1") == "1"
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "50000"))
+
+# sha256(token) -> verified claims, so repeat requests skip the HMAC check and claim parsing
+_verified_tokens = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+# user_id -> revoked_at (epoch seconds). Tokens issued at or before that instant are refused.
+_revoked = {}
 
 
 def create_token(user_id: str, role: str, city: str, status: str, phone: str):
+    now = int(time.time())
     payload = {
         "user_id": user_id,
         "role": role,
         "city": city,
         "status": status,
         "phone": phone,
+        "iat": now,
+        "exp": now + ACCESS_TOKEN_TTL,
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
-def decode_token(token: str):
+def _decode(token: str, leeway: int = 0):
+    required = ["user_id"] if ACCEPT_LEGACY_TOKENS else ["user_id", "exp", "iat"]
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        return jwt.decode(
+            token, JWT_SECRET, algorithms=[JWT_ALGORITHM], leeway=leeway, options={"require": required}
+        )
+    except jwt.ExpiredSignatureError:
+        # Distinct from "Invalid token" so the client refreshes instead of logging out
+        raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+def decode_token(token: str):
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = _verified_tokens.get(digest)
+    if payload is not None:
+        return payload
+
+    payload = _decode(token)
+
+    # Never let a cached entry outlive the token itself
+    ttl = TOKEN_CACHE_TTL if "exp" not in payload else min(TOKEN_CACHE_TTL, payload["exp"] - time.time())
+    _verified_tokens.set(digest, payload, ttl=ttl)
+    return payload
+
+
+def revoke_user(user_id: str, revoked_at: float = None):
+    _revoked[user_id] = time.time() if revoked_at is None else revoked_at
+
+
+def restore_user(user_id: str):
+    _revoked.pop(user_id, None)
+
+
+def replace_revocations(revocations: dict):
+    global _revoked
+    _revoked = dict(revocations)
+
+
+def is_revoked(payload: dict):
+    revoked_at = _revoked.get(payload.get("user_id"))
+    return revoked_at is not None and payload.get("iat", 0) <= revoked_at
+
+
+def authenticate(token: str):
+    payload = decode_token(token)
+    if payload.get("status") == "SUSPENDED" or is_revoked(payload):
+        raise HTTPException(status_code=403, detail="Account suspended")
+    return payload
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    payload = decode_token(credentials.credentials)
-    if payload.get("status") == "SUSPENDED":
+    return authenticate(credentials.credentials)
+
+
+async def get_refresh_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # Uncached: only refresh honours the grace window, and it is called once per token lifetime
+    payload = _decode(credentials.credentials, leeway=REFRESH_GRACE_SECONDS)
+    if payload.get("status") == "SUSPENDED" or is_revoked(payload):
         raise HTTPException(status_code=403, detail="Account suspended")
     return payload
 
 
+async def get_stream_user(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+):
+    # EventSource can't set headers, so streams also accept ?token=
+    if credentials:
+        return authenticate(credentials.credentials)
+    if token:
+        return authenticate(token)
+    raise HTTPException(status_code=403, detail="Not authenticated")
+
+
+# Memoized so every Depends(require_role(x)) in a request shares one resolved dependency
+@lru_cache(maxsize=None)
 def require_role(required_role: str):
     async def role_checker(user=Depends(get_current_user)):
         if user.get("role") != required_role:
             raise HTTPException(status_code=403, detail=f"Access denied. Required role: {required_role}")
         return user
     return role_checker
+
+
+@lru_cache(maxsize=None)
+def current_user_doc(required_role: str):
+    async def user_doc_loader(user=Depends(require_role(required_role))):
+        return await user_cache.get_user(user["user_id"])
+    return user_doc_loader
@@ -80,3 +80,12 @@ class RejectRequest(BaseModel):
 
 class SuspendRequest(BaseModel):
     reason: Optional[str] = ""
+
+class ProductReviewRequest(BaseModel):
+    product_ids: List[str]
+
+class PayoutRequest(BaseModel):
+    role: Optional[str] = None  # SELLER or DELIVERY; all roles when omitted
+    user_ids: Optional[List[str]] = None
+    created_before: Optional[str] = None  # ISO timestamp
+    all_pending: bool = False  # required to pay out with none of the filters above
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends
-from middleware import require_role
-from models import RejectRequest, SuspendRequest, gen_id, now_iso
+from middleware import require_role, current_user_doc
+from models import RejectRequest, SuspendRequest, PayoutRequest, ProductReviewRequest, now_iso
+from services import catalog, revocation, stats, earnings as earnings_service, audit, db_pool, assignment
+from services.user_cache import invalidate_user
+from services.pagination import PageParams
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,40 +17,46 @@ def set_db(database):
     db = database
 
 
+async def _update_user(user_id, changes):
+    before = await db.users.find_one_and_update(
+        {"id": user_id}, {"$set": {**changes, "updated_at": now_iso()}}, projection={"_id": 0}
+    )
+    invalidate_user(user_id)
+    if before:
+        await stats.record_user_change(before, {**before, **changes})
+    return before
+
+
 @router.get("/dashboard")
 async def dashboard(user=Depends(require_role("ADMIN"))):
     today = now_iso()[:10]
 
-    total_orders = await db.orders.count_documents({"created_at": {"$regex": f"^{today}"}})
-    active_orders = await db.orders.count_documents({"status": {"$in": ["CREATED", "ASSIGNED", "ACCEPTED", "READY_FOR_PICKUP", "OUT_FOR_DELIVERY"]}})
-    delivered_orders = await db.orders.count_documents({"status": "DELIVERED"})
-    active_sellers = await db.users.count_documents({"role": "SELLER", "approval_status": "APPROVED", "status": "ACTIVE"})
-    active_delivery = await db.users.count_documents({"role": "DELIVERY", "approval_status": "APPROVED", "status": "ACTIVE"})
-    pending_approvals = await db.users.count_documents({"approval_status": "PENDING", "role": {"$in": ["SELLER", "DELIVERY"]}})
+    counters, today_counters = await stats.get_dashboard_counters(today)
+    orders = counters.get("orders", {})
+    users = counters.get("users", {})
 
     recent_logs = await db.audit_logs.find(
         {}, {"_id": 0}
-    ).sort("created_at", -1).to_list(10)
+    ).sort("created_at", -1).limit(10).to_list(10)
 
     return {
-        "total_orders_today": total_orders,
-        "active_orders": active_orders,
-        "delivered_orders": delivered_orders,
-        "active_sellers": active_sellers,
-        "active_delivery_partners": active_delivery,
-        "pending_approvals": pending_approvals,
+        "total_orders_today": today_counters.get("orders_created", 0),
+        "active_orders": sum(orders.get(status, 0) for status in stats.ACTIVE_ORDER_STATUSES),
+        "delivered_orders": orders.get("DELIVERED", 0),
+        "active_sellers": users.get("active_sellers", 0),
+        "active_delivery_partners": users.get("active_delivery_partners", 0),
+        "pending_approvals": users.get("pending_approvals", 0),
         "recent_activity": recent_logs,
     }
 
 
 @router.get("/sellers")
-async def get_sellers(status: str = "all", user=Depends(require_role("ADMIN"))):
+async def get_sellers(status: str = "all", page: PageParams = Depends(), user=Depends(require_role("ADMIN"))):
     query = {"role": "SELLER"}
     if status != "all":
         query["approval_status"] = status.upper()
 
-    sellers = await db.users.find(query, {"_id": 0}).to_list(1000)
-    return {"sellers": sellers}
+    return await page.respond(db.users, query, "sellers", default_limit=1000)
 
 
 @router.post("/sellers/{seller_id}/approve")
@@ -56,21 +65,17 @@ async def approve_seller(seller_id: str, user=Depends(require_role("ADMIN"))):
     if not seller:
         raise HTTPException(status_code=404, detail="Seller not found")
 
-    await db.users.update_one(
-        {"id": seller_id},
-        {"$set": {"approval_status": "APPROVED", "status": "ACTIVE"}}
-    )
+    await _update_user(seller_id, {"approval_status": "APPROVED", "status": "ACTIVE"})
+    await revocation.restore_user(seller_id)
 
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "ADMIN",
-        "action": "SELLER_APPROVED",
-        "entity": "user",
-        "entity_id": seller_id,
-        "details": f"Seller {seller.get('shop_name', seller_id)} approved",
-        "created_at": now_iso(),
-    })
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="ADMIN",
+        action="SELLER_APPROVED",
+        entity="user",
+        entity_id=seller_id,
+        details=f"Seller {seller.get('shop_name', seller_id)} approved",
+    )
 
     return {"success": True}
 
@@ -81,193 +86,199 @@ async def reject_seller(seller_id: str, req: RejectRequest, user=Depends(require
     if not seller:
         raise HTTPException(status_code=404, detail="Seller not found")
 
-    await db.users.update_one(
-        {"id": seller_id},
-        {"$set": {"approval_status": "REJECTED"}}
-    )
+    await _update_user(seller_id, {"approval_status": "REJECTED"})
 
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "ADMIN",
-        "action": "SELLER_REJECTED",
-        "entity": "user",
-        "entity_id": seller_id,
-        "details": f"Seller rejected. Reason: {req.reason}",
-        "created_at": now_iso(),
-    })
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="ADMIN",
+        action="SELLER_REJECTED",
+        entity="user",
+        entity_id=seller_id,
+        details=f"Seller rejected. Reason: {req.reason}",
+    )
 
     return {"success": True}
 
 
 @router.post("/sellers/{seller_id}/suspend")
 async def suspend_seller(seller_id: str, req: SuspendRequest, user=Depends(require_role("ADMIN"))):
-    await db.users.update_one(
-        {"id": seller_id},
-        {"$set": {"approval_status": "SUSPENDED", "status": "SUSPENDED"}}
+    await _update_user(seller_id, {"approval_status": "SUSPENDED", "status": "SUSPENDED"})
+    await revocation.revoke_user(seller_id)
+
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="ADMIN",
+        action="SELLER_SUSPENDED",
+        entity="user",
+        entity_id=seller_id,
+        details=f"Seller suspended. Reason: {req.reason}",
     )
 
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "ADMIN",
-        "action": "SELLER_SUSPENDED",
-        "entity": "user",
-        "entity_id": seller_id,
-        "details": f"Seller suspended. Reason: {req.reason}",
-        "created_at": now_iso(),
-    })
+    return {"success": True}
 
+
+@router.post("/stats/reconcile")
+async def reconcile_stats(full: bool = False, user=Depends(require_role("ADMIN"))):
+    # full recounts every day in history, not just the recent STATS_RECONCILE_DAYS
+    await stats.reconcile(days=None if full else stats.STATS_RECONCILE_DAYS)
     return {"success": True}
 
 
 @router.get("/delivery-partners")
-async def get_delivery_partners(status: str = "all", user=Depends(require_role("ADMIN"))):
+async def get_delivery_partners(status: str = "all", page: PageParams = Depends(), user=Depends(require_role("ADMIN"))):
     query = {"role": "DELIVERY"}
     if status != "all":
         query["approval_status"] = status.upper()
 
-    partners = await db.users.find(query, {"_id": 0}).to_list(1000)
-    return {"delivery_partners": partners}
+    return await page.respond(db.users, query, "delivery_partners", default_limit=1000)
 
 
 @router.post("/delivery-partners/{partner_id}/approve")
 async def approve_delivery(partner_id: str, user=Depends(require_role("ADMIN"))):
-    await db.users.update_one(
-        {"id": partner_id},
-        {"$set": {"approval_status": "APPROVED", "status": "ACTIVE"}}
+    await _update_user(partner_id, {"approval_status": "APPROVED", "status": "ACTIVE"})
+    await revocation.restore_user(partner_id)
+
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="ADMIN",
+        action="DELIVERY_PARTNER_APPROVED",
+        entity="user",
+        entity_id=partner_id,
+        details=f"Delivery partner {partner_id} approved",
     )
 
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "ADMIN",
-        "action": "DELIVERY_PARTNER_APPROVED",
-        "entity": "user",
-        "entity_id": partner_id,
-        "details": f"Delivery partner {partner_id} approved",
-        "created_at": now_iso(),
-    })
-
     return {"success": True}
 
 
 @router.post("/delivery-partners/{partner_id}/suspend")
 async def suspend_delivery(partner_id: str, req: SuspendRequest, user=Depends(require_role("ADMIN"))):
-    await db.users.update_one(
-        {"id": partner_id},
-        {"$set": {"approval_status": "SUSPENDED", "status": "SUSPENDED"}}
+    await _update_user(partner_id, {"approval_status": "SUSPENDED", "status": "SUSPENDED"})
+    await revocation.revoke_user(partner_id)
+
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="ADMIN",
+        action="DELIVERY_PARTNER_SUSPENDED",
+        entity="user",
+        entity_id=partner_id,
+        details=f"Delivery partner suspended. Reason: {req.reason}",
     )
 
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "ADMIN",
-        "action": "DELIVERY_PARTNER_SUSPENDED",
-        "entity": "user",
-        "entity_id": partner_id,
-        "details": f"Delivery partner suspended. Reason: {req.reason}",
-        "created_at": now_iso(),
-    })
-
     return {"success": True}
 
 
 @router.get("/orders")
-async def get_orders(status: str = "all", user=Depends(require_role("ADMIN"))):
+async def get_orders(status: str = "all", page: PageParams = Depends(), user=Depends(require_role("ADMIN"))):
     query = {}
     if status != "all":
         query["status"] = status.upper()
 
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return {"orders": orders}
+    return await page.respond(db.orders, query, "orders", default_limit=1000)
 
 
 @router.get("/earnings")
-async def get_earnings(role: str = "all", user=Depends(require_role("ADMIN"))):
+async def get_earnings(role: str = "all", page: PageParams = Depends(), user=Depends(require_role("ADMIN"))):
     query = {}
     if role != "all":
         query["role"] = role.upper()
 
-    earnings = await db.earnings.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-
-    total = sum(e["amount"] for e in earnings)
-    paid = sum(e["amount"] for e in earnings if e["status"] == "PAID")
-    pending = sum(e["amount"] for e in earnings if e["status"] == "PENDING")
+    summary = None
+    if page.format == "json":
+        summary = await earnings_service.summarize_by_role(query.get("role"))
+        summary.pop("by_role")
+    return await page.respond(db.earnings, query, "earnings", default_limit=1000, extra=summary)
+
+
+@router.get("/earnings/summary")
+async def get_earnings_summary(role: str = "all", user=Depends(require_role("ADMIN"))):
+    return await earnings_service.summarize_by_role(None if role == "all" else role.upper())
+
+
+@router.post("/earnings/payout")
+async def payout_earnings(req: PayoutRequest, user=Depends(require_role("ADMIN"))):
+    try:
+        batch = await earnings_service.payout(
+            role=req.role.upper() if req.role else None,
+            user_ids=req.user_ids,
+            created_before=req.created_before,
+            all_pending=req.all_pending,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if batch is None:
+        return {"success": True, "batch": None, "message": "No pending earnings matched"}
+
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="ADMIN",
+        action="EARNINGS_PAID_OUT",
+        entity="payout_batch",
+        entity_id=batch["id"],
+        details=f"Paid out ₹{batch['amount']} across {batch['transactions']} transactions to {batch['payees']} payees",
+    )
 
-    return {"total": total, "paid": paid, "pending": pending, "earnings": earnings}
+    return {"success": True, "batch": batch}
 
 
 @router.get("/users")
-async def get_users(role: str = "all", user=Depends(require_role("ADMIN"))):
+async def get_users(role: str = "all", page: PageParams = Depends(), user=Depends(require_role("ADMIN"))):
     query = {}
     if role != "all":
         query["role"] = role.upper()
 
-    users = await db.users.find(query, {"_id": 0}).to_list(1000)
-    return {"users": users}
+    return await page.respond(db.users, query, "users", default_limit=1000)
 
 
 @router.post("/users/{user_id}/suspend")
 async def suspend_user(user_id: str, req: SuspendRequest, user=Depends(require_role("ADMIN"))):
-    await db.users.update_one(
-        {"id": user_id},
-        {"$set": {"status": "SUSPENDED"}}
+    await _update_user(user_id, {"status": "SUSPENDED"})
+    await revocation.revoke_user(user_id)
+
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="ADMIN",
+        action="USER_SUSPENDED",
+        entity="user",
+        entity_id=user_id,
+        details=f"User suspended. Reason: {req.reason}",
     )
 
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "ADMIN",
-        "action": "USER_SUSPENDED",
-        "entity": "user",
-        "entity_id": user_id,
-        "details": f"User suspended. Reason: {req.reason}",
-        "created_at": now_iso(),
-    })
-
     return {"success": True}
 
 
 @router.post("/users/{user_id}/reactivate")
 async def reactivate_user(user_id: str, user=Depends(require_role("ADMIN"))):
-    await db.users.update_one(
-        {"id": user_id},
-        {"$set": {"status": "ACTIVE"}}
+    await _update_user(user_id, {"status": "ACTIVE"})
+    await revocation.restore_user(user_id)
+
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="ADMIN",
+        action="USER_REACTIVATED",
+        entity="user",
+        entity_id=user_id,
+        details=f"User {user_id} reactivated",
     )
 
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "ADMIN",
-        "action": "USER_REACTIVATED",
-        "entity": "user",
-        "entity_id": user_id,
-        "details": f"User {user_id} reactivated",
-        "created_at": now_iso(),
-    })
-
     return {"success": True}
 
 
 @router.get("/audit-logs")
-async def get_audit_logs(role: str = "all", user=Depends(require_role("ADMIN"))):
+async def get_audit_logs(role: str = "all", page: PageParams = Depends(), user=Depends(require_role("ADMIN"))):
     query = {}
     if role != "all":
         query["actor_role"] = role.upper()
 
-    logs = await db.audit_logs.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return {"logs": logs}
+    return await page.respond(db.audit_logs, query, "logs", default_limit=1000)
 
 
 @router.get("/products")
-async def get_products(status: str = "all", user=Depends(require_role("ADMIN"))):
+async def get_products(status: str = "all", page: PageParams = Depends(), user=Depends(require_role("ADMIN"))):
     query = {}
     if status != "all":
         query["status"] = status.upper()
 
-    products = await db.products.find(query, {"_id": 0}).to_list(1000)
-    return {"products": products}
+    return await page.respond(db.products, query, "products", default_limit=1000)
 
 
 @router.post("/products/{product_id}/approve")
@@ -276,17 +287,16 @@ async def approve_product(product_id: str, user=Depends(require_role("ADMIN"))):
         {"id": product_id},
         {"$set": {"status": "APPROVED"}}
     )
-
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "ADMIN",
-        "action": "PRODUCT_APPROVED",
-        "entity": "product",
-        "entity_id": product_id,
-        "details": f"Product {product_id} approved",
-        "created_at": now_iso(),
-    })
+    await catalog.refresh_products([product_id])
+
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="ADMIN",
+        action="PRODUCT_APPROVED",
+        entity="product",
+        entity_id=product_id,
+        details=f"Product {product_id} approved",
+    )
 
     return {"success": True}
 
@@ -297,12 +307,53 @@ async def reject_product(product_id: str, user=Depends(require_role("ADMIN"))):
         {"id": product_id},
         {"$set": {"status": "REJECTED"}}
     )
+    await catalog.refresh_products([product_id])
     return {"success": True}
 
 
+async def _review_products(product_ids, status, user, action):
+    # One update_many for the whole selection; the catalog is refreshed once for all touched listings
+    product_ids = list(dict.fromkeys(product_ids))
+    result = await db.products.update_many(
+        {"id": {"$in": product_ids}, "status": {"$ne": status}},
+        {"$set": {"status": status}}
+    )
+    await catalog.refresh_products(product_ids)
+
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="ADMIN",
+        action=action,
+        entity="product",
+        entity_id="",
+        details=f"{result.modified_count} of {len(product_ids)} products marked {status}",
+    )
+
+    return {"success": True, "matched": result.matched_count, "modified": result.modified_count}
+
+
+@router.post("/products/bulk-approve")
+async def bulk_approve_products(req: ProductReviewRequest, user=Depends(require_role("ADMIN"))):
+    return await _review_products(req.product_ids, "APPROVED", user, "PRODUCTS_APPROVED")
+
+
+@router.post("/products/bulk-reject")
+async def bulk_reject_products(req: ProductReviewRequest, user=Depends(require_role("ADMIN"))):
+    return await _review_products(req.product_ids, "REJECTED", user, "PRODUCTS_REJECTED")
+
+
+@router.get("/metrics/pool")
+async def pool_metrics(user=Depends(require_role("ADMIN"))):
+    return db_pool.pool_metrics.snapshot()
+
+
+@router.get("/metrics/assignment")
+async def assignment_metrics(user=Depends(require_role("ADMIN"))):
+    return await assignment.snapshot()
+
+
 @router.get("/profile")
-async def get_profile(user=Depends(require_role("ADMIN"))):
-    admin = await db.users.find_one({"id": user["user_id"]}, {"_id": 0})
+async def get_profile(admin=Depends(current_user_doc("ADMIN"))):
     if not admin:
         raise HTTPException(status_code=404, detail="Admin not found")
     return {
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Request
 from models import SendOTPRequest, VerifyOTPRequest, gen_id, now_iso
-from middleware import create_token
-import random
+from middleware import create_token, get_refresh_user
+from services.user_cache import get_user
+from services import stats, audit, otp as otp_service, rate_limit
 import os
 import logging
 
@@ -11,8 +12,18 @@ router = APIRouter(prefix="/api/auth", tags=["auth"])
 # Will be set from server.py
 db = None
 
-OTP_MODE = os.environ.get("OTP_MODE", "development")
-DEV_OTP = "123456"
+# "<requests>/<seconds>" token buckets; see services.rate_limit.parse_limit
+OTP_SEND_PHONE_LIMIT = os.environ.get("OTP_SEND_PHONE_LIMIT", "5/900")
+OTP_SEND_IP_LIMIT = os.environ.get("OTP_SEND_IP_LIMIT", "30/900")
+OTP_VERIFY_IP_LIMIT = os.environ.get("OTP_VERIFY_IP_LIMIT", "60/900")
+# Only behind a proxy that appends to X-Forwarded-For; otherwise clients could pick their own IP.
+# Entries left of the ones our proxies added are client-supplied, so count hops from the right.
+TRUST_FORWARDED_FOR = os.environ.get("TRUST_FORWARDED_FOR", "0") == "1"
+TRUSTED_PROXY_HOPS = max(1, int(os.environ.get("TRUSTED_PROXY_HOPS", "1")))
+
+_send_phone_limit = rate_limit.limiter("otp-send-phone", OTP_SEND_PHONE_LIMIT)
+_send_ip_limit = rate_limit.limiter("otp-send-ip", OTP_SEND_IP_LIMIT)
+_verify_ip_limit = rate_limit.limiter("otp-verify-ip", OTP_VERIFY_IP_LIMIT)
 
 
 def set_db(database):
@@ -20,44 +31,53 @@ def set_db(database):
     db = database
 
 
+def client_ip(request: Request):
+    forwarded = request.headers.get("x-forwarded-for") if TRUST_FORWARDED_FOR else None
+    if forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        # The address our outermost trusted proxy saw; shorter headers didn't pass through all of them
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else ""
+
+
+async def enforce(limit, key, detail):
+    allowed, retry_after = await limit.hit(key)
+    if not allowed:
+        raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
 @router.post("/send-otp")
-async def send_otp(req: SendOTPRequest):
+async def send_otp(req: SendOTPRequest, request: Request):
     phone = req.phone.strip()
     if not phone or len(phone) < 10:
         raise HTTPException(status_code=400, detail="Invalid phone number")
 
-    if OTP_MODE == "development":
-        otp = DEV_OTP
-    else:
-        otp = str(random.randint(100000, 999999))
+    await enforce(_send_ip_limit, client_ip(request), "Too many OTP requests. Please try again later.")
+    await enforce(_send_phone_limit, phone, "Too many OTP requests for this number. Please try again later.")
 
-    await db.otp_store.update_one(
-        {"phone": phone},
-        {"$set": {"phone": phone, "otp": otp, "created_at": now_iso()}},
-        upsert=True
-    )
+    otp = await otp_service.issue(phone)
 
     logger.info(f"OTP for {phone}: {otp}")
     return {"success": True, "message": "OTP sent successfully"}
 
 
 @router.post("/verify-otp")
-async def verify_otp(req: VerifyOTPRequest):
+async def verify_otp(req: VerifyOTPRequest, request: Request):
     phone = req.phone.strip()
     role = req.role.upper()
 
     if role not in ["CUSTOMER", "SELLER", "DELIVERY", "ADMIN"]:
         raise HTTPException(status_code=400, detail="Invalid role")
 
-    stored = await db.otp_store.find_one({"phone": phone}, {"_id": 0})
-    if not stored:
-        raise HTTPException(status_code=400, detail="OTP not found. Please request a new one.")
+    await enforce(_verify_ip_limit, client_ip(request), "Too many attempts. Please try again later.")
 
-    if stored["otp"] != req.otp:
+    result = await otp_service.verify(phone, req.otp.strip())
+    if result == otp_service.EXPIRED:
+        raise HTTPException(status_code=400, detail="OTP not found. Please request a new one.")
+    if result == otp_service.INVALID:
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
-    await db.otp_store.delete_one({"phone": phone})
-
     user = await db.users.find_one({"phone": phone, "role": role}, {"_id": 0})
 
     if not user:
@@ -88,17 +108,16 @@ async def verify_otp(req: VerifyOTPRequest):
             "created_at": now_iso(),
         }
         await db.users.insert_one({**user})
+        await stats.record_user_change(None, user)
 
-        await db.audit_logs.insert_one({
-            "id": gen_id(),
-            "actor_id": user_id,
-            "actor_role": role,
-            "action": "USER_REGISTERED",
-            "entity": "user",
-            "entity_id": user_id,
-            "details": f"New {role} registered with phone {phone}",
-            "created_at": now_iso(),
-        })
+        await audit.record(
+            actor_id=user_id,
+            actor_role=role,
+            action="USER_REGISTERED",
+            entity="user",
+            entity_id=user_id,
+            details=f"New {role} registered with phone {phone}",
+        )
 
     token = create_token(user["id"], user["role"], user.get("city", ""), user["status"], user["phone"])
 
@@ -109,6 +128,19 @@ async def verify_otp(req: VerifyOTPRequest):
     return {"token": token, "user": safe_user, "redirect": redirect}
 
 
+@router.post("/refresh")
+async def refresh_token(user=Depends(get_refresh_user)):
+    # Re-issue from the stored user so role, city and status claims pick up admin changes
+    current = await get_user(user["user_id"])
+    if not current:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if current["status"] == "SUSPENDED":
+        raise HTTPException(status_code=403, detail="Account suspended")
+
+    token = create_token(current["id"], current["role"], current.get("city", ""), current["status"], current["phone"])
+    return {"token": token}
+
+
 @router.get("/me")
 async def get_me(user=None):
     from middleware import get_current_user
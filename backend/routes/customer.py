@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
-from middleware import require_role
-from models import LocationRequest, CheckoutRequest, gen_id, now_iso
-import random
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response
+from middleware import require_role, current_user_doc
+from models import LocationRequest, CheckoutRequest, now_iso
+from services import catalog, stats, dispatch, audit, order_ids, events, idempotency, assignment
+from services.user_cache import invalidate_user
+from services.pagination import PageParams
+from typing import Optional
 import os
 import logging
 
@@ -23,59 +26,65 @@ async def set_location(req: LocationRequest, user=Depends(require_role("CUSTOMER
         {"$set": {
             "latitude": req.latitude,
             "longitude": req.longitude,
+            "location": dispatch.geo_point(req.latitude, req.longitude),
             "address": req.address,
             "city": req.city,
             "house": req.house,
             "area": req.area,
             "pincode": req.pincode,
             "location_set": True,
+            "updated_at": now_iso(),
         }}
     )
+    invalidate_user(user["user_id"])
     return {"success": True, "redirect": "/customer/home"}
 
 
 @router.get("/products")
-async def get_products(user=Depends(require_role("CUSTOMER"))):
-    customer = await db.users.find_one({"id": user["user_id"]}, {"_id": 0})
+async def get_products(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = catalog.DEFAULT_PAGE_SIZE,
+    customer=Depends(current_user_doc("CUSTOMER")),
+):
     if not customer or not customer.get("location_set"):
         raise HTTPException(status_code=400, detail="Location not set")
 
-    products = await db.products.find(
-        {"status": "APPROVED"}, {"_id": 0}
-    ).to_list(1000)
-
-    customer_products = []
-    seen = {}
-    for p in products:
-        key = f"{p['name']}_{p['unit']}"
-        if key not in seen:
-            available = p.get("stock", 0) > 0
-            customer_products.append({
-                "id": p["id"],
-                "name": p["name"],
-                "unit": p["unit"],
-                "price": p["seller_price"],
-                "available": available,
-                "category": p.get("category", "General"),
-            })
-            seen[key] = True
-
-    return {"products": customer_products}
+    limit = max(1, min(limit, catalog.MAX_PAGE_SIZE))
+    try:
+        etag, body = await catalog.get_page(cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    return body
 
 
 @router.post("/cart/checkout")
-async def checkout(req: CheckoutRequest, user=Depends(require_role("CUSTOMER"))):
-    customer = await db.users.find_one({"id": user["user_id"]}, {"_id": 0})
+@idempotency.idempotent
+async def checkout(
+    req: CheckoutRequest,
+    idempotency_key: Optional[str] = Header(None),
+    user=Depends(require_role("CUSTOMER")),
+    customer=Depends(current_user_doc("CUSTOMER")),
+):
     if not customer or not customer.get("location_set"):
         raise HTTPException(status_code=400, detail="Location not set")
 
     order_items = []
     total_amount = 0
 
+    products = await db.products.find(
+        {"id": {"$in": [c.product_id for c in req.items]}, "status": "APPROVED"}, {"_id": 0}
+    ).to_list(None)
+    products_by_id = {p["id"]: p for p in products}
+
     for cart_item in req.items:
-        product = await db.products.find_one(
-            {"id": cart_item.product_id, "status": "APPROVED"}, {"_id": 0}
-        )
+        product = products_by_id.get(cart_item.product_id)
         if not product:
             raise HTTPException(status_code=400, detail=f"Product {cart_item.product_id} not available")
         if product.get("stock", 0) < cart_item.quantity:
@@ -94,95 +103,47 @@ async def checkout(req: CheckoutRequest, user=Depends(require_role("CUSTOMER")))
 
     delivery_fee = 0 if total_amount >= 500 else 40
 
-    # Find best seller - has all items by name+unit in stock, approved, same city
-    assigned_seller = None
-    today = now_iso()[:10]
-
-    # Get all approved active sellers who confirmed stock today
-    eligible_sellers = await db.users.find({
-        "role": "SELLER",
-        "approval_status": "APPROVED",
-        "status": "ACTIVE",
-        "daily_stock_date": today,
-    }, {"_id": 0}).to_list(1000)
-
-    for seller in eligible_sellers:
-        has_all = True
-        seller_products_map = {}
-        for item in order_items:
-            prod = await db.products.find_one({
-                "seller_id": seller["id"],
-                "name": item["name"],
-                "unit": item["unit"],
-                "status": "APPROVED",
-            }, {"_id": 0})
-            if not prod or prod.get("stock", 0) < item["quantity"]:
-                has_all = False
-                break
-            seller_products_map[item["name"]] = prod
-
-        if has_all:
-            assigned_seller = seller
-            # Remap product_ids to seller's actual product IDs
-            for item in order_items:
-                sp = seller_products_map.get(item["name"])
-                if sp:
-                    item["product_id"] = sp["id"]
-            break
-
-        if has_all:
-            assigned_seller = seller
-            # Remap product_ids to seller's actual product IDs
-            for item in order_items:
-                sp = seller_products_map.get(item["name"])
-                if sp:
-                    item["product_id"] = sp["id"]
-            break
-
-    order_num = random.randint(1000, 9999)
-    order_id = f"ORD-{order_num}"
+    order_id = await order_ids.next_order_id()
 
     order = {
         "id": order_id,
         "customer_id": user["user_id"],
-        "seller_id": assigned_seller["id"] if assigned_seller else "",
+        "seller_id": "",
         "delivery_partner_id": "",
         "items": order_items,
-        "status": "ASSIGNED" if assigned_seller else "CREATED",
+        # A seller is matched in the background by services.assignment
+        "status": "CREATED",
         "delivery_address": req.delivery_address,
         "delivery_otp": "",
         "total_amount": total_amount + delivery_fee,
         "delivery_fee": delivery_fee,
         "payment_method": "COD",
+        "stock_reserved": False,
         "created_at": now_iso(),
         "updated_at": now_iso(),
+        **assignment.queue_fields(),
     }
 
     await db.orders.insert_one({**order})
+    assignment.notify()
+    await stats.record_order_created(order["status"])
+    await events.publish_order(order)
+
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="CUSTOMER",
+        action="ORDER_CREATED",
+        entity="order",
+        entity_id=order_id,
+        details=f"Order {order_id} created with {len(order_items)} items, total ₹{total_amount + delivery_fee}",
+    )
 
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "CUSTOMER",
-        "action": "ORDER_CREATED",
-        "entity": "order",
-        "entity_id": order_id,
-        "details": f"Order {order_id} created with {len(order_items)} items, total ₹{total_amount + delivery_fee}",
-        "created_at": now_iso(),
-    })
-
-    if not assigned_seller:
-        return {"success": True, "order": order, "message": "Order created but no seller available currently"}
-
-    return {"success": True, "order": order}
+    return {"success": True, "order": order, "message": "Order placed; finding a seller"}
 
 
 @router.get("/orders")
-async def get_orders(user=Depends(require_role("CUSTOMER"))):
-    orders = await db.orders.find(
-        {"customer_id": user["user_id"]}, {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    return {"orders": orders}
+async def get_orders(page: PageParams = Depends(), user=Depends(require_role("CUSTOMER"))):
+    return await page.respond(db.orders, {"customer_id": user["user_id"]}, "orders", default_limit=100)
 
 
 @router.get("/orders/{order_id}")
@@ -196,8 +157,7 @@ async def get_order(order_id: str, user=Depends(require_role("CUSTOMER"))):
 
 
 @router.get("/profile")
-async def get_profile(user=Depends(require_role("CUSTOMER"))):
-    customer = await db.users.find_one({"id": user["user_id"]}, {"_id": 0})
+async def get_profile(customer=Depends(current_user_doc("CUSTOMER"))):
     if not customer:
         raise HTTPException(status_code=404, detail="User not found")
     return {
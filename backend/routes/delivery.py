@@ -1,12 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends
-from middleware import require_role
-from models import AvailabilityRequest, DeliveryOTPRequest, gen_id, now_iso
+from fastapi import APIRouter, HTTPException, Depends, Header
+from middleware import require_role, current_user_doc
+from models import AvailabilityRequest, DeliveryOTPRequest, now_iso
+from services.user_cache import get_user, invalidate_user
+from services import dispatch, earnings as earnings_service, audit, order_state, idempotency
+from services.pagination import PageParams
 from pydantic import BaseModel
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/delivery", tags=["delivery"])
 
+SELLER_SHARE = 0.85
+DELIVERY_SHARE = 0.10
+
 db = None
 
 
@@ -16,15 +23,24 @@ def set_db(database):
 
 
 @router.post("/availability")
-async def set_availability(req: AvailabilityRequest, user=Depends(require_role("DELIVERY"))):
-    delivery = await db.users.find_one({"id": user["user_id"]}, {"_id": 0})
+async def set_availability(
+    req: AvailabilityRequest,
+    user=Depends(require_role("DELIVERY")),
+    delivery=Depends(current_user_doc("DELIVERY")),
+):
     if not delivery or delivery.get("approval_status") != "APPROVED":
         raise HTTPException(status_code=403, detail="Not approved")
 
     await db.users.update_one(
         {"id": user["user_id"]},
-        {"$set": {"is_available": req.is_available}}
+        {"$set": {"is_available": req.is_available, "updated_at": now_iso()}}
     )
+    invalidate_user(user["user_id"])
+
+    # Coming online picks up the oldest order that was waiting for a partner in this city
+    assigned_order_id = await dispatch.assign_queued(user["user_id"]) if req.is_available else None
+    if assigned_order_id:
+        return {"success": True, "is_available": False, "assigned_order_id": assigned_order_id}
     return {"success": True, "is_available": req.is_available}
 
 
@@ -38,7 +54,7 @@ async def get_active_order(user=Depends(require_role("DELIVERY"))):
     if not order:
         return {"order": None}
 
-    seller = await db.users.find_one({"id": order.get("seller_id", "")}, {"_id": 0})
+    seller = await get_user(order.get("seller_id", ""))
     seller_info = {
         "name": seller.get("shop_name", "Seller") if seller else "Seller",
         "address": seller.get("address", "") if seller else "",
@@ -55,101 +71,92 @@ async def get_active_order(user=Depends(require_role("DELIVERY"))):
 
 
 @router.post("/orders/{order_id}/pickup")
-async def start_pickup(order_id: str, user=Depends(require_role("DELIVERY"))):
-    order = await db.orders.find_one({
-        "id": order_id,
-        "delivery_partner_id": user["user_id"],
-    }, {"_id": 0})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    if order["status"] != "READY_FOR_PICKUP":
-        raise HTTPException(status_code=400, detail="Order not ready for pickup")
-
-    await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {"status": "OUT_FOR_DELIVERY", "updated_at": now_iso()}}
+@idempotency.idempotent
+async def start_pickup(order_id: str, idempotency_key: Optional[str] = Header(None),
+                       user=Depends(require_role("DELIVERY"))):
+    match = {"delivery_partner_id": user["user_id"]}
+    order, applied = await order_state.transition(
+        order_id, "READY_FOR_PICKUP", "OUT_FOR_DELIVERY", match=match, idempotency_key=idempotency_key
     )
-
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "DELIVERY",
-        "action": "PICKUP_STARTED",
-        "entity": "order",
-        "entity_id": order_id,
-        "details": f"Delivery partner picked up order {order_id}",
-        "created_at": now_iso(),
-    })
-
-    return {"success": True}
-
-
-@router.post("/orders/{order_id}/verify-otp")
-async def verify_delivery_otp(order_id: str, req: DeliveryOTPRequest, user=Depends(require_role("DELIVERY"))):
-    order = await db.orders.find_one({
-        "id": order_id,
-        "delivery_partner_id": user["user_id"],
-    }, {"_id": 0})
     if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    if order["status"] != "OUT_FOR_DELIVERY":
-        raise HTTPException(status_code=400, detail="Order not out for delivery")
-
-    if order.get("delivery_otp", "") != req.otp:
-        raise HTTPException(status_code=400, detail="Invalid OTP")
+        await order_state.reject(order_id, match, "Order not ready for pickup")
+
+    if applied:
+        await audit.record(
+            actor_id=user["user_id"],
+            actor_role="DELIVERY",
+            action="PICKUP_STARTED",
+            entity="order",
+            entity_id=order_id,
+            details=f"Delivery partner picked up order {order_id}",
+        )
 
-    # Mark delivered
-    await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {"status": "DELIVERED", "updated_at": now_iso()}}
-    )
+    return {"success": True}
 
-    # Create earnings
-    seller_earning = order.get("total_amount", 0) * 0.85
-    delivery_earning = order.get("total_amount", 0) * 0.10
 
-    await db.earnings.insert_one({
-        "id": gen_id(),
-        "user_id": order.get("seller_id", ""),
+def _earning(order, user_id, role, share):
+    # One row per order and payee role; the fixed id makes recording it again a no-op
+    return {
+        "id": f"{order['id']}:{role}",
+        "user_id": user_id,
         "user_name": "",
-        "role": "SELLER",
-        "order_id": order_id,
-        "amount": round(seller_earning, 2),
+        "role": role,
+        "order_id": order["id"],
+        "amount": round(order.get("total_amount", 0) * share, 2),
         "status": "PENDING",
         "created_at": now_iso(),
-    })
+    }
 
-    await db.earnings.insert_one({
-        "id": gen_id(),
-        "user_id": user["user_id"],
-        "user_name": "",
-        "role": "DELIVERY",
-        "order_id": order_id,
-        "amount": round(delivery_earning, 2),
-        "status": "PENDING",
-        "created_at": now_iso(),
-    })
 
-    # Reset delivery partner availability
-    await db.users.update_one(
-        {"id": user["user_id"]},
-        {"$set": {"is_available": False}}
-    )
+@router.post("/orders/{order_id}/verify-otp")
+@idempotency.idempotent
+async def verify_delivery_otp(order_id: str, req: DeliveryOTPRequest, idempotency_key: Optional[str] = Header(None),
+                              user=Depends(require_role("DELIVERY"))):
+    partner_id = user["user_id"]
 
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "DELIVERY",
-        "action": "ORDER_DELIVERED",
-        "entity": "order",
-        "entity_id": order_id,
-        "details": f"Order {order_id} delivered via OTP verification",
-        "created_at": now_iso(),
-    })
+    async def settle(order, session):
+        # Earnings for both payees and the partner's release commit with the DELIVERED status
+        await earnings_service.record_earnings([
+            _earning(order, order.get("seller_id", ""), "SELLER", SELLER_SHARE),
+            _earning(order, partner_id, "DELIVERY", DELIVERY_SHARE),
+        ], session=session)
+        await db.users.update_one(
+            {"id": partner_id, "current_order_id": {"$in": [order_id, None]}},
+            {"$set": {"is_available": False, "current_order_id": "", "updated_at": now_iso()}},
+            session=session,
+        )
+
+    match = {"delivery_partner_id": partner_id, "delivery_otp": req.otp}
+    order, applied = await order_state.transition(
+        order_id, "OUT_FOR_DELIVERY", "DELIVERED",
+        match=match,
+        idempotency_key=idempotency_key,
+        effects=settle,
+    )
+    if not order:
+        current = await db.orders.find_one(
+            {"id": order_id, "delivery_partner_id": partner_id}, {"_id": 0, "status": 1}
+        )
+        if not current:
+            raise HTTPException(status_code=404, detail="Order not found")
+        if current["status"] != "OUT_FOR_DELIVERY":
+            raise HTTPException(status_code=400, detail="Order not out for delivery")
+        raise HTTPException(status_code=400, detail="Invalid OTP")
+    invalidate_user(partner_id)
+
+    if applied:
+        await audit.record(
+            actor_id=partner_id,
+            actor_role="DELIVERY",
+            action="ORDER_DELIVERED",
+            entity="order",
+            entity_id=order_id,
+            details=f"Order {order_id} delivered via OTP verification",
+        )
 
     return {
         "success": True,
-        "delivery_earning": round(delivery_earning, 2),
+        "delivery_earning": round(order.get("total_amount", 0) * DELIVERY_SHARE, 2),
     }
 
 
@@ -163,9 +170,12 @@ class DeliveryRegisterRequest(BaseModel):
 
 
 @router.post("/register")
-async def register_delivery(req: DeliveryRegisterRequest, user=Depends(require_role("DELIVERY"))):
+async def register_delivery(
+    req: DeliveryRegisterRequest,
+    user=Depends(require_role("DELIVERY")),
+    partner=Depends(current_user_doc("DELIVERY")),
+):
     partner_id = user["user_id"]
-    partner = await db.users.find_one({"id": partner_id}, {"_id": 0})
     if partner and partner.get("city"):
         return {"success": True, "message": "Already registered", "redirect": "/delivery/approval-status"}
 
@@ -176,50 +186,55 @@ async def register_delivery(req: DeliveryRegisterRequest, user=Depends(require_r
             "address": req.address,
             "latitude": req.latitude,
             "longitude": req.longitude,
+            "location": dispatch.geo_point(req.latitude, req.longitude),
             "vehicle_type": req.vehicle_type,
             "vehicle_number": req.vehicle_number,
+            "updated_at": now_iso(),
         }}
     )
-
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": partner_id,
-        "actor_role": "DELIVERY",
-        "action": "DELIVERY_PARTNER_REGISTERED",
-        "entity": "user",
-        "entity_id": partner_id,
-        "details": f"Delivery partner submitted registration in {req.city}",
-        "created_at": now_iso(),
-    })
+    invalidate_user(partner_id)
+
+    await audit.record(
+        actor_id=partner_id,
+        actor_role="DELIVERY",
+        action="DELIVERY_PARTNER_REGISTERED",
+        entity="user",
+        entity_id=partner_id,
+        details=f"Delivery partner submitted registration in {req.city}",
+    )
 
     return {"success": True, "redirect": "/delivery/approval-status"}
 
 
 @router.get("/earnings")
-async def get_earnings(user=Depends(require_role("DELIVERY"))):
-    earnings = await db.earnings.find(
-        {"user_id": user["user_id"]}, {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
+async def get_earnings(page: PageParams = Depends(), user=Depends(require_role("DELIVERY"))):
+    balance = await earnings_service.get_balance(user["user_id"]) if page.format == "json" else None
+    return await page.respond(db.earnings, {"user_id": user["user_id"]}, "transactions", default_limit=1000, extra=balance)
+
+
+@router.get("/earnings/balance")
+async def get_earnings_balance(user=Depends(require_role("DELIVERY"))):
+    return await earnings_service.get_balance(user["user_id"])
 
-    total = sum(e["amount"] for e in earnings)
-    paid = sum(e["amount"] for e in earnings if e["status"] == "PAID")
-    pending = sum(e["amount"] for e in earnings if e["status"] == "PENDING")
 
-    return {"total": total, "paid": paid, "pending": pending, "transactions": earnings}
+@router.get("/earnings/transactions")
+async def get_earnings_transactions(page: PageParams = Depends(), user=Depends(require_role("DELIVERY"))):
+    return await page.respond(db.earnings, {"user_id": user["user_id"]}, "transactions", default_limit=100)
 
 
 @router.get("/history")
-async def get_history(user=Depends(require_role("DELIVERY"))):
-    orders = await db.orders.find({
-        "delivery_partner_id": user["user_id"],
-        "status": "DELIVERED"
-    }, {"_id": 0}).sort("updated_at", -1).to_list(100)
-    return {"deliveries": orders}
+async def get_history(page: PageParams = Depends(), user=Depends(require_role("DELIVERY"))):
+    return await page.respond(
+        db.orders,
+        {"delivery_partner_id": user["user_id"], "status": "DELIVERED"},
+        "deliveries",
+        sort_field="updated_at",
+        default_limit=100,
+    )
 
 
 @router.get("/profile")
-async def get_profile(user=Depends(require_role("DELIVERY"))):
-    delivery = await db.users.find_one({"id": user["user_id"]}, {"_id": 0})
+async def get_profile(delivery=Depends(current_user_doc("DELIVERY"))):
     if not delivery:
         raise HTTPException(status_code=404, detail="User not found")
     return {
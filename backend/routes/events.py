@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from middleware import get_stream_user
+from services import events
+import asyncio
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+
+async def _event_stream(request: Request, sub):
+    # One get() stays pending across heartbeats: cancelling a timed-out wait_for(get()) can swallow an event
+    getter = None
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(sub.queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=EVENTS_HEARTBEAT_SECONDS)
+            if not done:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+            event, getter = getter.result(), None
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        if getter is not None:
+            getter.cancel()
+        events.unsubscribe(sub)
+
+
+@router.get("/stream")
+async def stream(request: Request, user=Depends(get_stream_user)):
+    """Server-sent events for the caller's orders, replacing order polling."""
+    channels = [events.user_channel(user["user_id"])]
+    if user.get("role") == "ADMIN":
+        channels.append(events.ADMIN_CHANNEL)
+    sub = events.subscribe(channels)
+    return StreamingResponse(
+        _event_stream(request, sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,15 +1,30 @@
-from fastapi import APIRouter, HTTPException, Depends
-from middleware import require_role, get_current_user
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from middleware import require_role, get_current_user, current_user_doc
 from models import (
     BulkProductRequest, PriceUpdateRequest,
     StockConfirmRequest, StockAdjustRequest, gen_id, now_iso
 )
+from services.stock import reserve_stock, release_stock, commit_stock, confirm_levels, new_hold_id, hold_id
+from services import catalog, earnings as earnings_service, dispatch, audit, order_state, product_ingest, idempotency
+from services.cache import TTLCache
+from services.pagination import PageParams
+from services.user_cache import get_user, invalidate_user
+from pymongo import ReturnDocument
 from pydantic import BaseModel as PydanticBaseModel
+from datetime import date, timedelta
+from typing import Optional
+import asyncio
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/seller", tags=["seller"])
 
+SELLER_DASHBOARD_CACHE_TTL = float(os.environ.get("SELLER_DASHBOARD_CACHE_TTL", "5"))
+
+# seller id -> dashboard payload; a few seconds of staleness is fine for a summary screen
+_dashboard_cache = TTLCache(maxsize=10000, ttl=SELLER_DASHBOARD_CACHE_TTL)
+
 db = None
 
 
@@ -22,84 +37,127 @@ def seller_dep():
     return require_role("SELLER")
 
 
+def on_order_change(event):
+    # Keep dashboards fresh when another worker moves one of the seller's orders
+    seller_id = (event.document or {}).get("seller_id")
+    if seller_id:
+        _dashboard_cache.pop(seller_id)
+    elif event.operation == "invalidate":
+        _dashboard_cache.clear()
+
+
 @router.get("/dashboard")
 async def dashboard(user=Depends(require_role("SELLER"))):
     seller_id = user["user_id"]
-    today = now_iso()[:10]
-
-    orders = await db.orders.find(
-        {"seller_id": seller_id}, {"_id": 0}
-    ).to_list(1000)
-
-    today_orders = [o for o in orders if o.get("created_at", "")[:10] == today]
-    assigned = len([o for o in today_orders if o["status"] == "ASSIGNED"])
-    accepted = len([o for o in today_orders if o["status"] in ["ACCEPTED", "READY_FOR_PICKUP"]])
-
-    products = await db.products.find(
-        {"seller_id": seller_id, "status": "APPROVED"}, {"_id": 0}
-    ).to_list(1000)
-
-    healthy = len([p for p in products if p.get("stock", 0) > 10])
-    low = len([p for p in products if 0 < p.get("stock", 0) <= 10])
-    out = len([p for p in products if p.get("stock", 0) == 0])
-
-    earnings_list = await db.earnings.find(
-        {"user_id": seller_id}, {"_id": 0}
-    ).to_list(1000)
+    cached = _dashboard_cache.get(seller_id)
+    if cached is not None:
+        return cached
 
-    today_earnings = sum(e["amount"] for e in earnings_list if e.get("created_at", "")[:10] == today)
-    total_pending = sum(e["amount"] for e in earnings_list if e["status"] == "PENDING")
-
-    warnings_count = await db.warnings.count_documents({"seller_id": seller_id})
+    today = now_iso()[:10]
+    tomorrow = (date.fromisoformat(today) + timedelta(days=1)).isoformat()
+    # ISO timestamps sort lexicographically, so a string range selects today on the (seller_id, created_at) index
+    today_range = {"$gte": today, "$lt": tomorrow}
+    stock = {"$ifNull": ["$stock", 0]}
+
+    order_rows, stock_rows, today_earning_rows, balance, warnings_count = await asyncio.gather(
+        db.orders.aggregate([
+            {"$match": {"seller_id": seller_id, "created_at": today_range}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ]).to_list(None),
+        db.products.aggregate([
+            {"$match": {"seller_id": seller_id, "status": "APPROVED"}},
+            {"$group": {
+                "_id": None,
+                "healthy": {"$sum": {"$cond": [{"$gt": [stock, 10]}, 1, 0]}},
+                "low": {"$sum": {"$cond": [{"$and": [{"$gt": [stock, 0]}, {"$lte": [stock, 10]}]}, 1, 0]}},
+                "out": {"$sum": {"$cond": [{"$eq": [stock, 0]}, 1, 0]}},
+            }},
+        ]).to_list(1),
+        db.earnings.aggregate([
+            {"$match": {"user_id": seller_id, "created_at": today_range}},
+            {"$group": {"_id": None, "amount": {"$sum": "$amount"}}},
+        ]).to_list(1),
+        earnings_service.get_balance(seller_id),
+        db.warnings.count_documents({"seller_id": seller_id}),
+    )
 
-    return {
-        "today_orders": {"assigned": assigned, "accepted": accepted, "total": len(today_orders)},
-        "stock_health": {"healthy": healthy, "low": low, "out_of_stock": out},
-        "earnings": {"today": today_earnings, "pending": total_pending},
+    orders_by_status = {row["_id"]: row["count"] for row in order_rows}
+    stock_health = stock_rows[0] if stock_rows else {}
+
+    result = {
+        "today_orders": {
+            "assigned": orders_by_status.get("ASSIGNED", 0),
+            "accepted": orders_by_status.get("ACCEPTED", 0) + orders_by_status.get("READY_FOR_PICKUP", 0),
+            "total": sum(orders_by_status.values()),
+        },
+        "stock_health": {
+            "healthy": stock_health.get("healthy", 0),
+            "low": stock_health.get("low", 0),
+            "out_of_stock": stock_health.get("out", 0),
+        },
+        "earnings": {
+            "today": today_earning_rows[0]["amount"] if today_earning_rows else 0,
+            "pending": balance["pending"],
+        },
         "warnings_count": warnings_count,
     }
+    _dashboard_cache.set(seller_id, result)
+    return result
 
 
 @router.get("/products")
-async def get_products(user=Depends(require_role("SELLER"))):
-    products = await db.products.find(
-        {"seller_id": user["user_id"]}, {"_id": 0}
-    ).to_list(1000)
-    return {"products": products}
+async def get_products(page: PageParams = Depends(), user=Depends(require_role("SELLER"))):
+    return await page.respond(db.products, {"seller_id": user["user_id"]}, "products", default_limit=1000)
 
 
 @router.post("/products/bulk")
 async def add_products_bulk(req: BulkProductRequest, user=Depends(require_role("SELLER"))):
     seller_id = user["user_id"]
-    created = []
-    for item in req.products:
-        product = {
-            "id": gen_id(),
-            "seller_id": seller_id,
-            "name": item.name,
-            "unit": item.unit,
-            "seller_price": item.price,
-            "status": "PENDING",
-            "stock": 0,
-            "created_at": now_iso(),
-        }
-        await db.products.insert_one({**product})
-        created.append(product)
-
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": seller_id,
-        "actor_role": "SELLER",
-        "action": "PRODUCTS_ADDED",
-        "entity": "product",
-        "entity_id": "",
-        "details": f"Added {len(created)} products for approval",
-        "created_at": now_iso(),
-    })
+    created = [product_ingest.new_product(seller_id, item) for item in req.products]
+    for start in range(0, len(created), product_ingest.INGEST_CHUNK_SIZE):
+        chunk = created[start:start + product_ingest.INGEST_CHUNK_SIZE]
+        await db.products.insert_many([{**product} for product in chunk], ordered=False)
+
+    await audit.record(
+        actor_id=seller_id,
+        actor_role="SELLER",
+        action="PRODUCTS_ADDED",
+        entity="product",
+        entity_id="",
+        details=f"Added {len(created)} products for approval",
+    )
 
     return {"success": True, "products": created}
 
 
+@router.post("/products/upload")
+async def upload_products(request: Request, format: Optional[str] = None, user=Depends(require_role("SELLER"))):
+    """Stream a CSV (name,unit,price header) or NDJSON catalog; rows are validated and inserted as they arrive."""
+    content_type = request.headers.get("content-type", "")
+    fmt = (format or ("csv" if "csv" in content_type else "ndjson" if "ndjson" in content_type else "")).lower()
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Upload must be CSV (text/csv) or NDJSON (application/x-ndjson)")
+
+    seller_id = user["user_id"]
+    lines = product_ingest.iter_lines(request.stream())
+    rows = product_ingest.iter_csv_rows(lines) if fmt == "csv" else product_ingest.iter_ndjson_rows(lines)
+    try:
+        report = await product_ingest.ingest(seller_id, rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await audit.record(
+        actor_id=seller_id,
+        actor_role="SELLER",
+        action="PRODUCTS_ADDED",
+        entity="product",
+        entity_id="",
+        details=f"Uploaded {report.inserted} products for approval ({report.failed} rows rejected)",
+    )
+
+    return {"success": True, **report.to_dict()}
+
+
 @router.patch("/products/{product_id}/price")
 async def update_price(product_id: str, req: PriceUpdateRequest, user=Depends(require_role("SELLER"))):
     product = await db.products.find_one(
@@ -114,6 +172,7 @@ async def update_price(product_id: str, req: PriceUpdateRequest, user=Depends(re
         {"id": product_id},
         {"$set": {"seller_price": req.price}}
     )
+    await catalog.refresh_entries([(product["name"], product["unit"])])
     return {"success": True}
 
 
@@ -142,29 +201,60 @@ async def daily_stock_confirm(req: StockConfirmRequest, user=Depends(require_rol
     seller_id = user["user_id"]
     today = now_iso()[:10]
 
-    for item in req.items:
-        await db.products.update_one(
-            {"id": item.product_id, "seller_id": seller_id},
-            {"$set": {"stock": item.stock}}
-        )
+    # Ownership for every line in one query; a product listed twice keeps its last value
+    requested = {item.product_id: item.stock for item in req.items}
+    owned = await db.products.find(
+        {"id": {"$in": list(requested)}, "seller_id": seller_id}, {"_id": 0, "id": 1, "name": 1, "unit": 1}
+    ).to_list(None)
+    owned = {p["id"]: p for p in owned}
+
+    results = []
+    counts = {}
+    for product_id, stock in requested.items():
+        if product_id not in owned:
+            results.append({"product_id": product_id, "success": False, "error": "Product not found"})
+        elif stock < 0:
+            results.append({"product_id": product_id, "success": False, "error": "Stock cannot be negative"})
+        else:
+            counts[product_id] = stock
+
+    if counts:
+        # Counted units still include open holds; confirm_levels nets them off so a later release can't double them
+        unconfirmed = set(await confirm_levels(seller_id, counts))
+        await catalog.refresh_entries({(p["name"], p["unit"]) for p in owned.values()})
+        snapshot = {}
+        for product_id, stock in counts.items():
+            if product_id in unconfirmed:
+                results.append({"product_id": product_id, "success": False, "error": "Stock is changing, please retry"})
+                continue
+            product = owned[product_id]
+            snapshot[f"items.{product_id}"] = {"name": product["name"], "unit": product["unit"], "stock": stock}
+            results.append({"product_id": product_id, "success": True, "stock": stock})
+        # One document per seller per day: the confirmed levels, for analytics without replaying stock_logs
+        if snapshot:
+            await db.stock_snapshots.update_one(
+                {"seller_id": seller_id, "date": today},
+                {"$set": {**snapshot, "confirmed_at": now_iso()}},
+                upsert=True,
+            )
+    updated = sum(1 for r in results if r["success"])
 
     await db.users.update_one(
         {"id": seller_id},
-        {"$set": {"daily_stock_confirmed": True, "daily_stock_date": today}}
+        {"$set": {"daily_stock_confirmed": True, "daily_stock_date": today, "updated_at": now_iso()}}
+    )
+    invalidate_user(seller_id)
+
+    await audit.record(
+        actor_id=seller_id,
+        actor_role="SELLER",
+        action="DAILY_STOCK_CONFIRMED",
+        entity="stock",
+        entity_id=seller_id,
+        details=f"Confirmed stock for {updated} products",
     )
 
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": seller_id,
-        "actor_role": "SELLER",
-        "action": "DAILY_STOCK_CONFIRMED",
-        "entity": "stock",
-        "entity_id": seller_id,
-        "details": f"Confirmed stock for {len(req.items)} products",
-        "created_at": now_iso(),
-    })
-
-    return {"success": True, "redirect": "/seller/dashboard"}
+    return {"success": True, "updated": updated, "results": results, "redirect": "/seller/dashboard"}
 
 
 @router.patch("/stock/{product_id}/adjust")
@@ -172,17 +262,27 @@ async def adjust_stock(product_id: str, req: StockAdjustRequest, user=Depends(re
     if req.adjustment not in [-1, 1]:
         raise HTTPException(status_code=400, detail="Adjustment must be +1 or -1")
 
-    product = await db.products.find_one(
-        {"id": product_id, "seller_id": user["user_id"]}, {"_id": 0}
+    # Guarded $inc so concurrent reservations are never overwritten and stock never goes negative
+    query = {"id": product_id, "seller_id": user["user_id"]}
+    if req.adjustment < 0:
+        query["stock"] = {"$gte": -req.adjustment}
+    product = await db.products.find_one_and_update(
+        query,
+        {"$inc": {"stock": req.adjustment}},
+        projection={"_id": 0, "name": 1, "unit": 1, "stock": 1},
+        return_document=ReturnDocument.AFTER,
     )
     if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
+        product = await db.products.find_one(
+            {"id": product_id, "seller_id": user["user_id"]}, {"_id": 0, "name": 1, "unit": 1, "stock": 1}
+        )
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
 
-    new_stock = max(0, product.get("stock", 0) + req.adjustment)
-    await db.products.update_one(
-        {"id": product_id},
-        {"$set": {"stock": new_stock}}
-    )
+    new_stock = product.get("stock", 0)
+    # Availability only flips when stock crosses zero
+    if new_stock == 0 or new_stock == req.adjustment:
+        await catalog.refresh_entries([(product["name"], product["unit"])])
 
     await db.stock_logs.insert_one({
         "id": gen_id(),
@@ -197,138 +297,114 @@ async def adjust_stock(product_id: str, req: StockAdjustRequest, user=Depends(re
 
 
 @router.get("/orders")
-async def get_orders(user=Depends(require_role("SELLER"))):
-    orders = await db.orders.find(
+async def get_orders(page: PageParams = Depends(), user=Depends(require_role("SELLER"))):
+    return await page.respond(
+        db.orders,
         {"seller_id": user["user_id"], "status": {"$in": ["ASSIGNED", "ACCEPTED", "READY_FOR_PICKUP"]}},
-        {"_id": 0}
-    ).to_list(1000)
-    return {"orders": orders}
+        "orders",
+        default_limit=1000,
+    )
 
 
 @router.post("/orders/{order_id}/accept")
-async def accept_order(order_id: str, user=Depends(require_role("SELLER"))):
+@idempotency.idempotent
+async def accept_order(order_id: str, idempotency_key: Optional[str] = Header(None),
+                       user=Depends(require_role("SELLER"))):
+    match = {"seller_id": user["user_id"]}
     order = await db.orders.find_one(
-        {"id": order_id, "seller_id": user["user_id"]}, {"_id": 0}
+        {"id": order_id, **match}, {"_id": 0, "id": 1, "status": 1, "items": 1, "stock_reserved": 1, "stock_hold_id": 1}
     )
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    if order["status"] != "ASSIGNED":
-        raise HTTPException(status_code=400, detail="Order can only be accepted from ASSIGNED state")
-
-    for item in order.get("items", []):
-        product = await db.products.find_one(
-            {"id": item["product_id"], "seller_id": user["user_id"]}, {"_id": 0}
-        )
-        if product:
-            new_stock = max(0, product.get("stock", 0) - item["quantity"])
-            await db.products.update_one(
-                {"id": item["product_id"]},
-                {"$set": {"stock": new_stock}}
-            )
 
-    await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {"status": "ACCEPTED", "updated_at": now_iso()}}
+    # Orders placed before checkout-time reservation still need their stock taken here
+    items = order.get("items", [])
+    reserved_here = order["status"] == "ASSIGNED" and not order.get("stock_reserved")
+    hold = new_hold_id(order_id) if reserved_here else hold_id(order)
+    if reserved_here and not await reserve_stock(hold, items):
+        raise HTTPException(status_code=400, detail="Insufficient stock to accept this order")
+
+    async def take_stock(order, session):
+        await commit_stock(hold_id(order), order.get("items", []), session=session)
+
+    accepted, applied = await order_state.transition(
+        order_id, "ASSIGNED", "ACCEPTED",
+        match=match,
+        changes={"stock_reserved": True, "stock_hold_id": hold},
+        idempotency_key=idempotency_key,
+        effects=take_stock,
     )
-
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "SELLER",
-        "action": "ORDER_ACCEPTED",
-        "entity": "order",
-        "entity_id": order_id,
-        "details": f"Seller accepted order {order_id}, stock deducted",
-        "created_at": now_iso(),
-    })
+    if not accepted:
+        if reserved_here:
+            await release_stock(hold, items)
+        await order_state.reject(order_id, match, "Order can only be accepted from ASSIGNED state")
+
+    if applied:
+        await audit.record(
+            actor_id=user["user_id"],
+            actor_role="SELLER",
+            action="ORDER_ACCEPTED",
+            entity="order",
+            entity_id=order_id,
+            details=f"Seller accepted order {order_id}, stock deducted",
+        )
 
     return {"success": True}
 
 
 @router.post("/orders/{order_id}/ready")
-async def mark_ready(order_id: str, user=Depends(require_role("SELLER"))):
-    order = await db.orders.find_one(
-        {"id": order_id, "seller_id": user["user_id"]}, {"_id": 0}
+@idempotency.idempotent
+async def mark_ready(order_id: str, idempotency_key: Optional[str] = Header(None),
+                     user=Depends(require_role("SELLER"))):
+    match = {"seller_id": user["user_id"]}
+    order, applied = await order_state.transition(
+        order_id, "ACCEPTED", "READY_FOR_PICKUP", match=match, idempotency_key=idempotency_key
     )
     if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    if order["status"] != "ACCEPTED":
-        raise HTTPException(status_code=400, detail="Order must be ACCEPTED before marking ready")
-
-    await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {"status": "READY_FOR_PICKUP", "updated_at": now_iso()}}
+        await order_state.reject(order_id, match, "Order must be ACCEPTED before marking ready")
+    if not applied:
+        return {"success": True}
+
+    # Auto-assign the nearest free delivery partner in the seller's city
+    seller = await get_user(user["user_id"])
+    if seller:
+        await dispatch.dispatch_order(order_id, seller)
+
+    await audit.record(
+        actor_id=user["user_id"],
+        actor_role="SELLER",
+        action="ORDER_READY",
+        entity="order",
+        entity_id=order_id,
+        details=f"Order {order_id} marked ready for pickup",
     )
 
-    # Auto-assign delivery partner
-    delivery_partner = await db.users.find_one({
-        "role": "DELIVERY",
-        "approval_status": "APPROVED",
-        "is_available": True,
-        "status": "ACTIVE",
-    }, {"_id": 0})
-
-    if delivery_partner:
-        import random
-        delivery_otp = str(random.randint(100000, 999999))
-        if os.environ.get("OTP_MODE", "development") == "development":
-            delivery_otp = "123456"
-
-        await db.orders.update_one(
-            {"id": order_id},
-            {"$set": {
-                "delivery_partner_id": delivery_partner["id"],
-                "delivery_otp": delivery_otp,
-            }}
-        )
-        await db.users.update_one(
-            {"id": delivery_partner["id"]},
-            {"$set": {"is_available": False}}
-        )
-
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": user["user_id"],
-        "actor_role": "SELLER",
-        "action": "ORDER_READY",
-        "entity": "order",
-        "entity_id": order_id,
-        "details": f"Order {order_id} marked ready for pickup",
-        "created_at": now_iso(),
-    })
-
     return {"success": True}
 
 
 @router.get("/earnings")
-async def get_earnings(user=Depends(require_role("SELLER"))):
-    earnings = await db.earnings.find(
-        {"user_id": user["user_id"]}, {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
+async def get_earnings(page: PageParams = Depends(), user=Depends(require_role("SELLER"))):
+    balance = await earnings_service.get_balance(user["user_id"]) if page.format == "json" else None
+    return await page.respond(db.earnings, {"user_id": user["user_id"]}, "transactions", default_limit=1000, extra=balance)
 
-    total = sum(e["amount"] for e in earnings)
-    paid = sum(e["amount"] for e in earnings if e["status"] == "PAID")
-    pending = sum(e["amount"] for e in earnings if e["status"] == "PENDING")
 
-    return {
-        "total": total,
-        "paid": paid,
-        "pending": pending,
-        "transactions": earnings,
-    }
+@router.get("/earnings/balance")
+async def get_earnings_balance(user=Depends(require_role("SELLER"))):
+    return await earnings_service.get_balance(user["user_id"])
+
+
+@router.get("/earnings/transactions")
+async def get_earnings_transactions(page: PageParams = Depends(), user=Depends(require_role("SELLER"))):
+    return await page.respond(db.earnings, {"user_id": user["user_id"]}, "transactions", default_limit=100)
 
 
 @router.get("/warnings")
-async def get_warnings(user=Depends(require_role("SELLER"))):
-    warnings = await db.warnings.find(
-        {"seller_id": user["user_id"]}, {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    return {"warnings": warnings}
+async def get_warnings(page: PageParams = Depends(), user=Depends(require_role("SELLER"))):
+    return await page.respond(db.warnings, {"seller_id": user["user_id"]}, "warnings", default_limit=100)
 
 
 @router.get("/profile")
-async def get_profile(user=Depends(require_role("SELLER"))):
-    seller = await db.users.find_one({"id": user["user_id"]}, {"_id": 0})
+async def get_profile(user=Depends(require_role("SELLER")), seller=Depends(current_user_doc("SELLER"))):
     if not seller:
         raise HTTPException(status_code=404, detail="Seller not found")
 
@@ -352,9 +428,6 @@ async def get_profile(user=Depends(require_role("SELLER"))):
     }
 
 
-import os
-
-
 class SellerRegisterRequest(PydanticBaseModel):
     shop_name: str
     city: str
@@ -368,9 +441,12 @@ class SellerRegisterRequest(PydanticBaseModel):
 
 
 @router.post("/register")
-async def register_seller(req: SellerRegisterRequest, user=Depends(require_role("SELLER"))):
+async def register_seller(
+    req: SellerRegisterRequest,
+    user=Depends(require_role("SELLER")),
+    seller=Depends(current_user_doc("SELLER")),
+):
     seller_id = user["user_id"]
-    seller = await db.users.find_one({"id": seller_id}, {"_id": 0})
     if seller and seller.get("shop_name"):
         return {"success": True, "message": "Already registered", "redirect": "/seller/approval-status"}
 
@@ -384,20 +460,21 @@ async def register_seller(req: SellerRegisterRequest, user=Depends(require_role(
             "address": req.address,
             "latitude": req.latitude,
             "longitude": req.longitude,
+            "location": dispatch.geo_point(req.latitude, req.longitude),
             "bank_info": bank_info,
             "categories": req.categories,
+            "updated_at": now_iso(),
         }}
     )
-
-    await db.audit_logs.insert_one({
-        "id": gen_id(),
-        "actor_id": seller_id,
-        "actor_role": "SELLER",
-        "action": "SELLER_REGISTERED",
-        "entity": "user",
-        "entity_id": seller_id,
-        "details": f"Seller {req.shop_name} submitted registration",
-        "created_at": now_iso(),
-    })
+    invalidate_user(seller_id)
+
+    await audit.record(
+        actor_id=seller_id,
+        actor_role="SELLER",
+        action="SELLER_REGISTERED",
+        entity="user",
+        entity_id=seller_id,
+        details=f"Seller {req.shop_name} submitted registration",
+    )
 
     return {"success": True, "redirect": "/seller/approval-status"}
@@ -1,15 +1,19 @@
 import os
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
 from contextlib import asynccontextmanager
 from models import gen_id, now_iso
+from services import indexes, db_pool, metrics, query_trace, assignment
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 MONGO_URL = os.environ.get("MONGO_URL")
+# When set, /api/metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
 DB_NAME = os.environ.get("DB_NAME", "green_basket")
 
 
@@ -38,29 +42,24 @@ async def seed_admin(db):
             "location_set": True,
             "created_at": now_iso(),
         }
-        await db.users.insert_one(admin)
-        logger.info("Admin seeded: phone=9999999999")
+        try:
+            await db.users.insert_one(admin)
+            logger.info("Admin seeded: phone=9999999999")
+        except DuplicateKeyError:
+            # Another worker booting alongside this one seeded it first
+            logger.info("Admin already exists")
     else:
         logger.info("Admin already exists")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    client = AsyncIOMotorClient(MONGO_URL)
+    client = AsyncIOMotorClient(MONGO_URL, **db_pool.client_options())
     db = client[DB_NAME]
     app.state.db = db
 
-    # Create indexes
-    await db.users.create_index([("phone", 1), ("role", 1)], unique=True)
-    await db.users.create_index("id", unique=True)
-    await db.products.create_index("id", unique=True)
-    await db.products.create_index("seller_id")
-    await db.orders.create_index("id", unique=True)
-    await db.orders.create_index("customer_id")
-    await db.orders.create_index("seller_id")
-    await db.orders.create_index("delivery_partner_id")
-    await db.earnings.create_index("user_id")
-    await db.audit_logs.create_index("created_at")
+    # Built once per INDEX_VERSION by whichever worker gets there first; the rest just verify
+    await indexes.ensure_indexes(db)
 
     # Seed admin
     await seed_admin(db)
@@ -71,16 +70,75 @@ async def lifespan(app: FastAPI):
     from routes.customer import set_db as customer_set_db
     from routes.delivery import set_db as delivery_set_db
     from routes.admin import set_db as admin_set_db
+    from services.matching import set_db as matching_set_db
+    from services.stock import set_db as stock_set_db
+    from services import catalog
+    from services import user_cache
+    from services import revocation
+    from services import stats
+    from services.earnings import set_db as earnings_set_db, start as earnings_start
+    from services import dispatch
+    from services import audit
+    from services import order_ids
+    from services import otp
+    from services import rate_limit
+    from services import idempotency
+    from services import order_state
+    from services import product_ingest
+    from services import events
+    from services import change_feed
+    from routes.seller import on_order_change as seller_on_order_change
 
     auth_set_db(db)
     seller_set_db(db)
     customer_set_db(db)
     delivery_set_db(db)
     admin_set_db(db)
+    matching_set_db(db)
+    stock_set_db(db)
+    catalog.set_db(db)
+    user_cache.set_db(db)
+    order_ids.set_db(db)
+    otp.set_db(db)
+    rate_limit.set_db(db)
+    idempotency.set_db(db)
+    await otp.purge_legacy()
+    order_state.set_db(db)
+    product_ingest.set_db(db)
+    await order_state.start()
+    revocation.set_db(db)
+    await revocation.start()
+    stats.set_db(db)
+    await stats.start()
+    earnings_set_db(db)
+    await earnings_start()
+    dispatch.set_db(db)
+    await dispatch.start()
+    audit.set_db(db)
+    await audit.start()
+    await events.start(db)
+    assignment.set_db(db)
+    await assignment.start()
+
+    # Keep per-process caches coherent with writes made by other workers
+    change_feed.set_db(db)
+    change_feed.subscribe("users", user_cache.on_change)
+    change_feed.subscribe("catalog", catalog.on_change)
+    change_feed.subscribe("orders", seller_on_order_change)
+    await change_feed.start()
+
+    if await db.catalog.estimated_document_count() == 0:
+        await catalog.rebuild()
 
     logger.info("Green Basket backend started")
     yield
 
+    await assignment.stop()
+    await change_feed.stop()
+    await events.stop()
+    await audit.stop()
+    await stats.stop()
+    await revocation.stop()
     client.close()
 
 
@@ -93,6 +151,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(query_trace.QueryTraceMiddleware)
+# Added last so it is outermost and times everything, CORS included
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Include routers
 from routes.auth import router as auth_router
@@ -100,14 +161,35 @@ from routes.seller import router as seller_router
 from routes.customer import router as customer_router
 from routes.delivery import router as delivery_router
 from routes.admin import router as admin_router
+from routes.events import router as events_router
 
 app.include_router(auth_router)
 app.include_router(seller_router)
 app.include_router(customer_router)
 app.include_router(delivery_router)
 app.include_router(admin_router)
+app.include_router(events_router)
 
 
 @app.get("/api/health")
 async def health():
     return {"status": "healthy", "service": "Green Basket API"}
+
+
+@app.get("/api/metrics")
+async def prometheus_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    pool = db_pool.pool_metrics.snapshot()
+    queue = await assignment.queue_depth()
+    body = metrics.render({
+        "mongodb_pool_open_connections": ("Open connections across all pools", pool["open_connections"]),
+        "mongodb_pool_checked_out": ("Connections currently checked out", pool["checked_out"]),
+        "mongodb_pool_max_size": ("Configured maxPoolSize", pool["max_pool_size"]),
+        "mongodb_pool_checkouts": ("Connection checkouts since start", pool["checkouts"]),
+        "mongodb_pool_wait_seconds_max": ("Longest connection checkout wait", pool["wait_ms"]["max"] / 1000),
+        "order_assignment_queue_pending": ("Orders waiting for a seller", queue["pending"]),
+        "order_assignment_queue_due": ("Orders waiting for a seller and due for an attempt", queue["due"]),
+        "order_assignment_awaiting_acceptance": ("Assigned orders the seller has not accepted yet", queue["awaiting_acceptance"]),
+    })
+    return Response(content=body, media_type="text/plain; version=0.0.4")
@@ -0,0 +1,355 @@
+"""Background seller assignment.
+
+Checkout stores orders as CREATED and returns. A pool of worker tasks claims due
+CREATED orders (oldest first), matches a seller, reserves stock and moves the
+order to ASSIGNED. Orders with no match are retried with exponential backoff
+and cancelled after ``ASSIGNMENT_MAX_ATTEMPTS`` tries or
+``ASSIGNMENT_MAX_AGE_SECONDS``, whichever comes first. A sweep takes ASSIGNED
+orders back from sellers that haven't accepted within
+``ASSIGNMENT_ACCEPT_TIMEOUT_SECONDS`` and queues them for a different seller.
+
+Runs inside each API worker (``ASSIGNMENT_WORKERS`` tasks, 0 to disable) or as a
+separate process:
+
+    python -m services.assignment
+"""
+from pymongo import ReturnDocument
+from models import gen_id, now_iso
+from services import matching, stock, catalog, order_state, audit, metrics
+from datetime import datetime, timezone, timedelta
+import asyncio
+import os
+import random
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+ASSIGNMENT_WORKERS = int(os.environ.get("ASSIGNMENT_WORKERS", "4"))
+# Idle workers look for due orders this often; checkouts in this process wake them sooner
+ASSIGNMENT_POLL_SECONDS = float(os.environ.get("ASSIGNMENT_POLL_SECONDS", "1"))
+# A claimed order is hidden from other workers this long, so a crashed worker's claim lapses
+ASSIGNMENT_LEASE_SECONDS = float(os.environ.get("ASSIGNMENT_LEASE_SECONDS", "30"))
+ASSIGNMENT_RETRY_BASE_SECONDS = float(os.environ.get("ASSIGNMENT_RETRY_BASE_SECONDS", "5"))
+ASSIGNMENT_RETRY_MAX_SECONDS = float(os.environ.get("ASSIGNMENT_RETRY_MAX_SECONDS", "300"))
+# An order still without a seller after this many tries or this long is cancelled
+ASSIGNMENT_MAX_ATTEMPTS = int(os.environ.get("ASSIGNMENT_MAX_ATTEMPTS", "20"))
+ASSIGNMENT_MAX_AGE_SECONDS = float(os.environ.get("ASSIGNMENT_MAX_AGE_SECONDS", "3600"))
+# 0 leaves assigned orders with their seller indefinitely
+ASSIGNMENT_ACCEPT_TIMEOUT_SECONDS = float(os.environ.get("ASSIGNMENT_ACCEPT_TIMEOUT_SECONDS", "600"))
+ASSIGNMENT_SWEEP_SECONDS = float(os.environ.get("ASSIGNMENT_SWEEP_SECONDS", "15"))
+ASSIGNMENT_SWEEP_BATCH = 100
+RESERVATION_ATTEMPTS = 3
+
+_workers = []
+_sweep_task = None
+_wake = None
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def _iso(dt):
+    return dt.isoformat()
+
+
+def queue_fields():
+    """Fields checkout sets on a new order so the workers pick it up."""
+    return {"assign_after": now_iso(), "assign_attempts": 0, "excluded_seller_ids": []}
+
+
+def notify():
+    # Wake an idle worker in this process instead of waiting for the next poll
+    if _wake is not None:
+        _wake.set()
+
+
+def backoff(attempts):
+    delay = min(ASSIGNMENT_RETRY_MAX_SECONDS, ASSIGNMENT_RETRY_BASE_SECONDS * 2 ** attempts)
+    # Jitter spreads out orders that failed together, e.g. before sellers confirm stock in the morning
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def claim_next():
+    """Lease the longest-waiting due CREATED order, or None.
+
+    ``assign_lease`` identifies this claim; writes for it are guarded on the lease,
+    so a worker whose lease lapsed and was re-claimed can no longer touch the order.
+    """
+    now = datetime.now(timezone.utc)
+    return await db.orders.find_one_and_update(
+        # assign_after is null for orders created before this queue existed
+        {"status": "CREATED", "$or": [{"assign_after": {"$lte": _iso(now)}}, {"assign_after": None}]},
+        {"$set": {"assign_after": _iso(now + timedelta(seconds=ASSIGNMENT_LEASE_SECONDS)), "assign_lease": gen_id()}},
+        sort=[("assign_after", 1)],
+        projection={"_id": 0, "id": 1, "items": 1, "created_at": 1, "assign_attempts": 1,
+                    "excluded_seller_ids": 1, "assign_lease": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def retry_later(order, reset_exclusions=False):
+    attempts = order.get("assign_attempts", 0)
+    changes = {"assign_after": _iso(datetime.now(timezone.utc) + timedelta(seconds=backoff(attempts)))}
+    if reset_exclusions:
+        changes["excluded_seller_ids"] = []
+    await db.orders.update_one(
+        {"id": order["id"], "status": "CREATED", "assign_lease": order.get("assign_lease")},
+        {"$set": changes, "$inc": {"assign_attempts": 1}},
+    )
+
+
+def _gave_up(order):
+    if order.get("assign_attempts", 0) + 1 >= ASSIGNMENT_MAX_ATTEMPTS:
+        return True
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(order["created_at"])
+    return age.total_seconds() >= ASSIGNMENT_MAX_AGE_SECONDS
+
+
+async def cancel_unassigned(order):
+    """Cancel an order no seller could take. Returns True if this call cancelled it."""
+    async def release(cancelled, session):
+        # CREATED orders hold no stock unless an attempt was cut short; releasing an absent hold is a no-op
+        if cancelled.get("stock_hold_id"):
+            await stock.release_stock(cancelled["stock_hold_id"], cancelled["items"], session=session)
+
+    cancelled, applied = await order_state.transition(
+        order["id"], "CREATED", "CANCELLED",
+        match={"assign_lease": order.get("assign_lease")},
+        changes={
+            "cancel_reason": "NO_SELLER",
+            "cancelled_at": now_iso(),
+            "assign_attempts": order.get("assign_attempts", 0) + 1,
+            "stock_reserved": False,
+        },
+        effects=release,
+    )
+    if not applied:
+        return False
+    await audit.record(
+        actor_id="",
+        actor_role="SYSTEM",
+        action="ORDER_CANCELLED",
+        entity="order",
+        entity_id=order["id"],
+        details=f"Order {order['id']} cancelled: no seller after {cancelled['assign_attempts']} attempts",
+    )
+    return True
+
+
+async def assign(order):
+    """Match and reserve a seller for a claimed order. Returns the outcome label."""
+    order_id = order["id"]
+    items = order.get("items", [])
+    required = matching.required_quantities(items)
+    today = now_iso()[:10]
+
+    excluded = order.get("excluded_seller_ids") or []
+
+    # Stock is reserved against the match; if a concurrent order wins the race, match again
+    for _ in range(RESERVATION_ATTEMPTS):
+        seller_id, seller_products = await matching.find_matching_seller(items, today, exclude_seller_ids=excluded)
+        if not seller_id:
+            break
+        seller_items = [
+            {"product_id": seller_products[(item["name"], item["unit"])]["id"], "quantity": item["quantity"]}
+            for item in items
+        ]
+        hold = stock.new_hold_id(order_id)
+        if not await stock.reserve_stock(hold, seller_items):
+            continue
+
+        # Remap product_ids to the seller's own listings
+        assigned_items = [{**item, "product_id": s["product_id"]} for item, s in zip(items, seller_items)]
+        assigned, _ = await order_state.transition(
+            order_id, "CREATED", "ASSIGNED",
+            match={"assign_lease": order.get("assign_lease")},
+            changes={
+                "seller_id": seller_id,
+                "items": assigned_items,
+                "stock_reserved": True,
+                "stock_hold_id": hold,
+                "assigned_at": now_iso(),
+            },
+        )
+        if not assigned:
+            # Cancelled, or our lease lapsed and another worker claimed the order
+            await stock.release_stock(hold, seller_items)
+            return "lost"
+        # Listings only change availability when a seller sells out
+        await catalog.refresh_entries(
+            key for key, product in seller_products.items()
+            if product.get("stock", 0) <= required[key]
+        )
+        waited = datetime.now(timezone.utc) - datetime.fromisoformat(order["created_at"])
+        metrics.assignment_wait.labels().observe(waited.total_seconds())
+        return "assigned"
+
+    if _gave_up(order):
+        return "cancelled" if await cancel_unassigned(order) else "lost"
+    # Every seller that could fill the order has let it time out: give them all another chance
+    await retry_later(order, reset_exclusions=bool(excluded))
+    return "no_match"
+
+
+async def reassign_stale():
+    """Take back orders whose seller hasn't accepted within the timeout. Returns how many moved."""
+    cutoff = _iso(datetime.now(timezone.utc) - timedelta(seconds=ASSIGNMENT_ACCEPT_TIMEOUT_SECONDS))
+    stale = await db.orders.find(
+        {"status": "ASSIGNED", "assigned_at": {"$lt": cutoff}},
+        {"_id": 0, "id": 1, "seller_id": 1, "items": 1, "assigned_at": 1, "excluded_seller_ids": 1, "stock_hold_id": 1},
+    ).to_list(ASSIGNMENT_SWEEP_BATCH)
+
+    moved = 0
+    for order in stale:
+        async def release(_, session, order=order):
+            await stock.release_stock(stock.hold_id(order), order["items"], session=session)
+
+        # Guarded on seller and assigned_at: an accept racing this sweep wins or loses as a whole
+        _, applied = await order_state.transition(
+            order["id"], "ASSIGNED", "CREATED",
+            match={"seller_id": order["seller_id"], "assigned_at": order["assigned_at"]},
+            changes={
+                "seller_id": "",
+                "stock_reserved": False,
+                "stock_hold_id": None,
+                "assigned_at": None,
+                "assign_after": now_iso(),
+                "excluded_seller_ids": (order.get("excluded_seller_ids") or []) + [order["seller_id"]],
+            },
+            effects=release,
+        )
+        if not applied:
+            continue
+        moved += 1
+        metrics.assignment_reassigned.labels().inc()
+        await catalog.refresh_products(item["product_id"] for item in order["items"])
+        await db.warnings.insert_one({
+            "id": gen_id(),
+            "seller_id": order["seller_id"],
+            "order_id": order["id"],
+            "type": "ACCEPT_TIMEOUT",
+            "message": f"Order {order['id']} was reassigned because it wasn't accepted in time",
+            "created_at": now_iso(),
+        })
+        await audit.record(
+            actor_id="",
+            actor_role="SYSTEM",
+            action="ORDER_REASSIGNED",
+            entity="order",
+            entity_id=order["id"],
+            details=f"Order {order['id']} taken back from seller {order['seller_id']} after accept timeout",
+        )
+    if moved:
+        notify()
+    return moved
+
+
+async def queue_depth():
+    now = now_iso()
+    return {
+        "pending": await db.orders.count_documents({"status": "CREATED"}),
+        "due": await db.orders.count_documents(
+            {"status": "CREATED", "$or": [{"assign_after": {"$lte": now}}, {"assign_after": None}]}
+        ),
+        "awaiting_acceptance": await db.orders.count_documents({"status": "ASSIGNED"}),
+    }
+
+
+async def snapshot():
+    return {
+        "workers": len(_workers),
+        "accept_timeout_seconds": ASSIGNMENT_ACCEPT_TIMEOUT_SECONDS,
+        "queue": await queue_depth(),
+    }
+
+
+async def _worker():
+    while True:
+        _wake.clear()
+        try:
+            order = await claim_next()
+        except Exception:
+            logger.exception("Claiming an order for assignment failed")
+            order = None
+        if order is None:
+            try:
+                await asyncio.wait_for(_wake.wait(), ASSIGNMENT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            outcome = await assign(order)
+        except Exception:
+            logger.exception(f"Assigning order {order['id']} failed")
+            outcome = "error"
+            try:
+                await retry_later(order)
+            except Exception:
+                # The lease lapses on its own and another attempt picks the order up
+                logger.exception(f"Rescheduling order {order['id']} failed")
+        metrics.assignment_attempts.labels(outcome).inc()
+
+
+async def _sweep_loop():
+    while True:
+        await asyncio.sleep(ASSIGNMENT_SWEEP_SECONDS)
+        try:
+            moved = await reassign_stale()
+            if moved:
+                logger.info(f"Reassigned {moved} orders after accept timeout")
+        except Exception:
+            logger.exception("Reassignment sweep failed")
+
+
+async def start(workers=None):
+    global _sweep_task, _wake
+    workers = ASSIGNMENT_WORKERS if workers is None else workers
+    if workers <= 0:
+        return
+    _wake = asyncio.Event()
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(workers))
+    if ASSIGNMENT_ACCEPT_TIMEOUT_SECONDS > 0:
+        _sweep_task = asyncio.create_task(_sweep_loop())
+    logger.info(f"Order assignment started with {workers} workers")
+
+
+async def stop():
+    global _sweep_task, _wake
+    tasks = _workers + ([_sweep_task] if _sweep_task else [])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _workers.clear()
+    _sweep_task = None
+    _wake = None
+
+
+if __name__ == "__main__":
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from services import db_pool, stats, events
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], **db_pool.client_options())
+        database = client[os.environ.get("DB_NAME", "green_basket")]
+        for module in (matching, stock, catalog, order_state, audit, stats):
+            module.set_db(database)
+        set_db(database)
+        await order_state.start()
+        await events.start(database)
+        await audit.start()
+        await start(max(1, ASSIGNMENT_WORKERS))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await stop()
+            await audit.stop()
+            await events.stop()
+            client.close()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+from models import gen_id, now_iso
+import asyncio
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+AUDIT_QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", "0.5"))
+
+_queue = None
+_writer_task = None
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def build_entry(actor_id: str, actor_role: str, action: str, entity: str, entity_id: str, details: str) -> dict:
+    return {
+        "id": gen_id(),
+        "actor_id": actor_id,
+        "actor_role": actor_role,
+        "action": action,
+        "entity": entity,
+        "entity_id": entity_id,
+        "details": details,
+        "created_at": now_iso(),
+    }
+
+
+async def record(*, actor_id: str, actor_role: str, action: str, entity: str, entity_id: str, details: str) -> None:
+    """Queue one audit log entry for the background writer.
+
+    Blocks only when the queue is full, which pushes back on request
+    handlers instead of growing memory without bound. Without a running
+    writer (scripts, benchmarks) the entry is written inline.
+    """
+    entry = build_entry(actor_id, actor_role, action, entity, entity_id, details)
+    if _queue is None:
+        await db.audit_logs.insert_one(entry)
+        return
+    await _queue.put(entry)
+
+
+async def _flush(batch):
+    try:
+        await db.audit_logs.insert_many(batch, ordered=False)
+    except Exception:
+        logger.exception(f"Failed to write {len(batch)} audit log entries")
+
+
+async def _writer(queue):
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        # Fill the batch for at most AUDIT_FLUSH_INTERVAL. get_nowait rather than wait_for(get()):
+        # a timed-out get can swallow an item and leave join() waiting forever.
+        deadline = loop.time() + AUDIT_FLUSH_INTERVAL
+        while len(batch) < AUDIT_BATCH_SIZE:
+            try:
+                batch.append(queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, 0.05))
+        await _flush(batch)
+        for _ in batch:
+            queue.task_done()
+
+
+async def start():
+    global _queue, _writer_task
+    _queue = asyncio.Queue(maxsize=AUDIT_QUEUE_SIZE)
+    _writer_task = asyncio.create_task(_writer(_queue))
+
+
+async def stop():
+    """Stop accepting entries and write out everything still queued."""
+    global _queue, _writer_task
+    if _writer_task is None:
+        return
+    queue, _queue = _queue, None
+    await queue.join()
+    _writer_task.cancel()
+    _writer_task = None
@@ -0,0 +1,147 @@
+from pymongo import DeleteOne, UpdateOne
+from models import now_iso
+from services.cache import TTLCache
+import base64
+import hashlib
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", "30"))
+
+# (cursor, limit) -> (etag, body); other workers' writes show up within the TTL
+_page_cache = TTLCache(maxsize=256, ttl=CATALOG_CACHE_TTL)
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def catalog_key(name, unit):
+    return f"{name}_{unit}"
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def _listing_pipeline(match):
+    # Cheapest approved offer represents the listing; availability is across all sellers
+    return [
+        {"$match": {**match, "status": "APPROVED"}},
+        {"$sort": {"seller_price": 1}},
+        {"$group": {
+            "_id": {"name": "$name", "unit": "$unit"},
+            "product_id": {"$first": "$id"},
+            "price": {"$first": "$seller_price"},
+            "category": {"$first": {"$ifNull": ["$category", "General"]}},
+            "seller_count": {"$sum": 1},
+            "in_stock_sellers": {"$sum": {"$cond": [{"$gt": ["$stock", 0]}, 1, 0]}},
+        }},
+    ]
+
+
+def _entry(row):
+    name, unit = row["_id"]["name"], row["_id"]["unit"]
+    return {
+        "key": catalog_key(name, unit),
+        "name": name,
+        "unit": unit,
+        "product_id": row["product_id"],
+        "price": row["price"],
+        "category": row["category"],
+        "available": row["in_stock_sellers"] > 0,
+        "seller_count": row["seller_count"],
+        "in_stock_sellers": row["in_stock_sellers"],
+        "updated_at": now_iso(),
+    }
+
+
+async def refresh_entries(keys):
+    """Recompute the listing for each (name, unit) in ``keys``."""
+    keys = set(keys)
+    if not keys:
+        return
+
+    rows = await db.products.aggregate(_listing_pipeline(
+        {"$or": [{"name": name, "unit": unit} for name, unit in keys]}
+    )).to_list(None)
+
+    ops = []
+    for row in rows:
+        entry = _entry(row)
+        ops.append(UpdateOne({"key": entry["key"]}, {"$set": entry}, upsert=True))
+        keys.discard((entry["name"], entry["unit"]))
+    # Whatever is left no longer has an approved offer
+    ops.extend(DeleteOne({"key": catalog_key(name, unit)}) for name, unit in keys)
+
+    await db.catalog.bulk_write(ops, ordered=False)
+    _page_cache.clear()
+
+
+async def refresh_products(product_ids):
+    products = await db.products.find(
+        {"id": {"$in": list(product_ids)}}, {"_id": 0, "name": 1, "unit": 1}
+    ).to_list(None)
+    await refresh_entries((p["name"], p["unit"]) for p in products)
+
+
+async def rebuild():
+    rows = await db.products.aggregate(_listing_pipeline({})).to_list(None)
+    entries = [_entry(row) for row in rows]
+    ops = [UpdateOne({"key": e["key"]}, {"$set": e}, upsert=True) for e in entries]
+    if ops:
+        await db.catalog.bulk_write(ops, ordered=False)
+    await db.catalog.delete_many({"key": {"$nin": [e["key"] for e in entries]}})
+    _page_cache.clear()
+    logger.info(f"Catalog rebuilt with {len(entries)} listings")
+
+
+def on_change(event):
+    # Listings were rewritten, possibly by another worker
+    _page_cache.clear()
+
+
+async def get_page(cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Return ``(etag, body)`` for one page of the customer catalog."""
+    cache_key = (cursor, limit)
+    page = _page_cache.get(cache_key)
+    if page is not None:
+        return page
+
+    query = {}
+    if cursor:
+        query["key"] = {"$gt": decode_cursor(cursor)}
+    entries = await db.catalog.find(query, {"_id": 0}).sort("key", 1).limit(limit + 1).to_list(None)
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    body = {
+        "products": [{
+            "id": e["product_id"],
+            "name": e["name"],
+            "unit": e["unit"],
+            "price": e["price"],
+            "available": e["available"],
+            "category": e["category"],
+        } for e in entries],
+        "next_cursor": encode_cursor(entries[-1]["key"]) if has_more else None,
+    }
+    etag = '"' + hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest() + '"'
+    page = (etag, body)
+    _page_cache.set(cache_key, page)
+    return page
@@ -0,0 +1,219 @@
+from pymongo.errors import OperationFailure, PyMongoError
+from models import now_iso
+from datetime import datetime, timedelta
+import asyncio
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+# auto: change streams when the server supports them, polling otherwise. changes/poll force a mode.
+CHANGE_FEED_MODE = os.environ.get("CHANGE_FEED_MODE", "auto").lower()
+CHANGE_FEED_COLLECTIONS = [c.strip() for c in os.environ.get(
+    "CHANGE_FEED_COLLECTIONS", "users,products,orders,catalog").split(",") if c.strip()]
+# Name under which the resume token is checkpointed; must be unique per process. Unset (the
+# default) means no checkpoints: in-process caches start empty, so there is nothing to resume.
+CHANGE_FEED_CONSUMER = os.environ.get("CHANGE_FEED_CONSUMER", "")
+CHANGE_FEED_CHECKPOINT_SECONDS = float(os.environ.get("CHANGE_FEED_CHECKPOINT_SECONDS", "1"))
+CHANGE_FEED_POLL_SECONDS = float(os.environ.get("CHANGE_FEED_POLL_SECONDS", "2"))
+# Polling backstop for deletes and writes that don't stamp updated_at; each one empties every cache
+CHANGE_FEED_INVALIDATE_SECONDS = float(os.environ.get("CHANGE_FEED_INVALIDATE_SECONDS", "300"))
+# updated_at comes from each worker's clock at write time, so a write can commit after one stamped
+# later. Each poll re-reads this far behind the watermark and skips versions it already delivered.
+CHANGE_FEED_POLL_OVERLAP_SECONDS = float(os.environ.get("CHANGE_FEED_POLL_OVERLAP_SECONDS", "5"))
+POLL_PAGE_SIZE = 1000
+
+# collection -> (timestamp, id) for collections whose every write stamps updated_at; these are
+# polled for individual changes. The rest only get an INVALIDATE every CHANGE_FEED_INVALIDATE_SECONDS.
+POLLABLE = {"orders": ("updated_at", "id"), "users": ("updated_at", "id"), "catalog": ("updated_at", "key")}
+
+INSERT = "insert"
+UPDATE = "update"
+REPLACE = "replace"
+DELETE = "delete"
+# The consumer lost track of individual changes: drop everything cached for the collection
+INVALIDATE = "invalidate"
+
+_handlers = {}
+_task = None
+mode = None
+
+
+class ChangeEvent:
+    __slots__ = ("collection", "operation", "doc_id", "document", "updated_fields")
+
+    def __init__(self, collection, operation, doc_id=None, document=None, updated_fields=None):
+        self.collection = collection
+        self.operation = operation
+        self.doc_id = doc_id
+        self.document = document
+        self.updated_fields = updated_fields or {}
+
+    def __repr__(self):
+        return f"ChangeEvent({self.collection}, {self.operation}, {self.doc_id})"
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def subscribe(collection, handler):
+    """Register ``handler(event)`` (sync or async) for changes to ``collection``."""
+    _handlers.setdefault(collection, []).append(handler)
+
+
+async def dispatch(event):
+    for handler in _handlers.get(event.collection, ()):
+        try:
+            result = handler(event)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            logger.exception(f"Change handler failed for {event!r}")
+
+
+def from_change(change):
+    # Deletes carry only _id, so handlers that need the app id must cope with doc_id None
+    document = change.get("fullDocument")
+    if document is not None:
+        document = {k: v for k, v in document.items() if k != "_id"}
+    return ChangeEvent(
+        collection=change["ns"]["coll"],
+        operation=change["operationType"],
+        doc_id=(document or {}).get("id"),
+        document=document,
+        updated_fields=change.get("updateDescription", {}).get("updatedFields"),
+    )
+
+
+async def _load_token():
+    if not CHANGE_FEED_CONSUMER:
+        return None
+    state = await db.change_feed_state.find_one({"id": CHANGE_FEED_CONSUMER}, {"_id": 0, "resume_token": 1})
+    return (state or {}).get("resume_token")
+
+
+async def _save_token(token):
+    if not CHANGE_FEED_CONSUMER:
+        return
+    await db.change_feed_state.update_one(
+        {"id": CHANGE_FEED_CONSUMER},
+        {"$set": {"resume_token": token, "updated_at": now_iso()}},
+        upsert=True,
+    )
+
+
+async def _invalidate_all():
+    for collection in CHANGE_FEED_COLLECTIONS:
+        await dispatch(ChangeEvent(collection, INVALIDATE))
+
+
+async def _watch():
+    pipeline = [{"$match": {"ns.coll": {"$in": CHANGE_FEED_COLLECTIONS}}}]
+    token = await _load_token()
+    while True:
+        try:
+            async with db.watch(pipeline, full_document="updateLookup", resume_after=token) as stream:
+                last_saved = time.monotonic()
+                while stream.alive:
+                    change = await stream.try_next()
+                    if change is not None:
+                        await dispatch(from_change(change))
+                    # Checkpoint at most once per interval; events after the last checkpoint are redelivered on restart
+                    if stream.resume_token != token and time.monotonic() - last_saved >= CHANGE_FEED_CHECKPOINT_SECONDS:
+                        token = stream.resume_token
+                        await _save_token(token)
+                        last_saved = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if token is not None:
+                # Resume point fell off the oplog: start from now and flush what we may have missed
+                logger.warning(f"Change stream could not resume ({e.code}); restarting from now")
+                token = None
+                await _invalidate_all()
+                continue
+            logger.exception("Change stream failed; retrying")
+            await asyncio.sleep(5)
+        except PyMongoError:
+            logger.exception("Change stream interrupted; reconnecting")
+            await asyncio.sleep(1)
+
+
+async def _poll_collection(collection, field, id_field, state):
+    """Dispatch documents changed since ``state["watermark"]``, each version once.
+
+    ``state["seen"]`` holds the ``(id, updated_at)`` versions already delivered inside
+    the overlap window. Pages are keyed on ``(updated_at, id)`` so documents sharing
+    a timestamp across a page boundary are not skipped.
+    """
+    since = (datetime.fromisoformat(state["watermark"]) - timedelta(seconds=CHANGE_FEED_POLL_OVERLAP_SECONDS)).isoformat()
+    seen = {key for key in state["seen"] if key[1] >= since}
+    watermark = state["watermark"]
+    query = {field: {"$gte": since}}
+    while True:
+        docs = await db[collection].find(query, {"_id": 0}).sort(
+            [(field, 1), (id_field, 1)]
+        ).limit(POLL_PAGE_SIZE).to_list(None)
+        for doc in docs:
+            key = (doc.get(id_field), doc[field])
+            if key in seen:
+                continue
+            seen.add(key)
+            watermark = max(watermark, doc[field])
+            await dispatch(ChangeEvent(collection, UPDATE, doc.get("id"), doc))
+        if len(docs) < POLL_PAGE_SIZE:
+            break
+        last = docs[-1]
+        query = {"$or": [{field: {"$gt": last[field]}}, {field: last[field], id_field: {"$gt": last.get(id_field)}}]}
+    state["watermark"], state["seen"] = watermark, seen
+
+
+async def _poll():
+    states = {collection: {"watermark": now_iso(), "seen": set()} for collection in POLLABLE}
+    last_invalidated = time.monotonic()
+    while True:
+        await asyncio.sleep(CHANGE_FEED_POLL_SECONDS)
+        try:
+            invalidate = time.monotonic() - last_invalidated >= CHANGE_FEED_INVALIDATE_SECONDS
+            if invalidate:
+                last_invalidated = time.monotonic()
+            for collection in CHANGE_FEED_COLLECTIONS:
+                if collection in POLLABLE:
+                    await _poll_collection(collection, *POLLABLE[collection], states[collection])
+                elif invalidate:
+                    await dispatch(ChangeEvent(collection, INVALIDATE))
+        except Exception:
+            logger.exception("Change polling failed")
+
+
+async def _supports_change_streams():
+    try:
+        hello = await db.command("hello")
+    except Exception:
+        return False
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+
+async def start():
+    global _task, mode
+    if CHANGE_FEED_MODE == "off":
+        return
+    if CHANGE_FEED_MODE in ("changes", "poll"):
+        mode = CHANGE_FEED_MODE
+    else:
+        mode = "changes" if await _supports_change_streams() else "poll"
+    _task = asyncio.create_task(_watch() if mode == "changes" else _poll())
+    logger.info(f"Change feed started in {mode} mode for {', '.join(CHANGE_FEED_COLLECTIONS)}")
+
+
+async def stop():
+    global _task
+    if _task:
+        _task.cancel()
+        _task = None
+    _handlers.clear()
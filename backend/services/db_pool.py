@@ -0,0 +1,132 @@
+from pymongo import monitoring
+from services.metrics import command_metrics
+from services.query_trace import trace_listener
+from collections import deque
+import threading
+import time
+import os
+
+# Pool settings for AsyncIOMotorClient; defaults match the driver's except where noted
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "0")) or None
+# The driver waits forever for a free connection by default; fail fast instead so overload shows up as errors
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")) or None
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "0")) or None
+# e.g. "zstd,snappy,zlib"; zstd and snappy need their optional packages installed
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "")
+
+WAIT_SAMPLES = 2048
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Counts connections and checkout waits across every pool of the client.
+
+    Checkouts run on the driver's executor threads; the start and end events of one
+    checkout arrive on the same thread, which is how wait times are paired up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.open = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = {}
+        self.pool_clears = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+
+    def _end_wait(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return (time.perf_counter() - started) * 1000 if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = self._end_wait()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_total_ms += waited
+            self.wait_max_ms = max(self.wait_max_ms, waited)
+            self._waits.append(waited)
+
+    def connection_check_out_failed(self, event):
+        self._end_wait()
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "min_pool_size": MONGO_MIN_POOL_SIZE,
+                "open_connections": self.open,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "pool_clears": self.pool_clears,
+                "wait_ms": {
+                    "mean": round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                    "p50": round(waits[len(waits) // 2], 3) if waits else 0.0,
+                    "p99": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))], 3) if waits else 0.0,
+                    "max": round(self.wait_max_ms, 3),
+                },
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def client_options():
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "event_listeners": [pool_metrics, command_metrics, trace_listener],
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
@@ -0,0 +1,149 @@
+from pymongo import UpdateOne, ReturnDocument
+from models import now_iso
+from services.user_cache import invalidate_user
+from services import events
+import random
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+# Search rings around the seller, widened in order until a free partner is found
+DISPATCH_RADII_KM = [float(r) for r in os.environ.get("DISPATCH_RADII_KM", "3,8,20").split(",") if r.strip()]
+# After the rings, take any free partner in the seller's city regardless of distance
+DISPATCH_CITY_FALLBACK = os.environ.get("DISPATCH_CITY_FALLBACK", "true").lower() == "true"
+# Finally park the order until a partner in the city comes online
+DISPATCH_QUEUE = os.environ.get("DISPATCH_QUEUE", "true").lower() == "true"
+DISPATCH_CANDIDATES = int(os.environ.get("DISPATCH_CANDIDATES", "5"))
+
+AVAILABLE_PARTNER = {
+    "role": "DELIVERY",
+    "approval_status": "APPROVED",
+    "is_available": True,
+    "status": "ACTIVE",
+}
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def geo_point(latitude, longitude):
+    if not latitude and not longitude:
+        return None
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+def _delivery_otp():
+    if os.environ.get("OTP_MODE", "development") == "development":
+        return "123456"
+    return str(random.randint(100000, 999999))
+
+
+async def _claim(candidate_ids, order_id):
+    # The is_available guard makes the claim atomic: two dispatchers can't take the same partner
+    for partner_id in candidate_ids:
+        partner = await db.users.find_one_and_update(
+            {"id": partner_id, **AVAILABLE_PARTNER},
+            {"$set": {"is_available": False, "current_order_id": order_id, "updated_at": now_iso()}},
+            projection={"_id": 0},
+        )
+        if partner:
+            invalidate_user(partner_id)
+            return partner
+    return None
+
+
+async def claim_partner(order_id, seller):
+    """Atomically take the nearest free partner for ``seller``'s city, or None."""
+    city_query = {**AVAILABLE_PARTNER, "city": seller.get("city", "")}
+    point = seller.get("location") or geo_point(seller.get("latitude"), seller.get("longitude"))
+
+    if point:
+        for radius_km in DISPATCH_RADII_KM:
+            candidates = await db.users.find(
+                {**city_query, "location": {"$near": {"$geometry": point, "$maxDistance": radius_km * 1000}}},
+                {"_id": 0, "id": 1},
+            ).limit(DISPATCH_CANDIDATES).to_list(None)
+            partner = await _claim([c["id"] for c in candidates], order_id)
+            if partner:
+                return partner
+
+    if DISPATCH_CITY_FALLBACK:
+        candidates = await db.users.find(city_query, {"_id": 0, "id": 1}).limit(DISPATCH_CANDIDATES).to_list(None)
+        return await _claim([c["id"] for c in candidates], order_id)
+
+    return None
+
+
+async def _assign(order_id, partner):
+    order = await db.orders.find_one_and_update(
+        {"id": order_id},
+        {"$set": {
+            "delivery_partner_id": partner["id"],
+            "delivery_otp": _delivery_otp(),
+            "updated_at": now_iso(),
+        }},
+        projection={"_id": 0, "delivery_otp": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if order:
+        await events.publish_order(order)
+
+
+async def dispatch_order(order_id, seller):
+    partner = await claim_partner(order_id, seller)
+    if partner:
+        await _assign(order_id, partner)
+        return partner
+
+    if DISPATCH_QUEUE:
+        await db.dispatch_queue.update_one(
+            {"order_id": order_id},
+            {"$set": {"order_id": order_id, "seller_id": seller["id"], "city": seller.get("city", ""), "created_at": now_iso()}},
+            upsert=True,
+        )
+        logger.info(f"No delivery partner free for {order_id}; queued")
+    return None
+
+
+async def assign_queued(partner_id):
+    """Hand the oldest queued order in the partner's city to a partner who just came online."""
+    partner = await db.users.find_one({"id": partner_id, **AVAILABLE_PARTNER}, {"_id": 0, "city": 1})
+    if not partner:
+        return None
+    entry = await db.dispatch_queue.find_one_and_delete({"city": partner.get("city", "")}, sort=[("created_at", 1)])
+    if not entry:
+        return None
+
+    claimed = await _claim([partner_id], entry["order_id"])
+    if not claimed:
+        # Someone else took this partner in between; put the order back for the next one
+        await db.dispatch_queue.insert_one(entry)
+        return None
+    await _assign(entry["order_id"], claimed)
+    return entry["order_id"]
+
+
+async def backfill_locations():
+    users = await db.users.find(
+        {"location": {"$exists": False}, "latitude": {"$nin": [0, None]}},
+        {"_id": 0, "id": 1, "latitude": 1, "longitude": 1},
+    ).to_list(None)
+    ops = [
+        UpdateOne(
+            {"id": u["id"]},
+            {"$set": {"location": geo_point(u["latitude"], u["longitude"]), "updated_at": now_iso()}},
+        )
+        for u in users if geo_point(u.get("latitude"), u.get("longitude"))
+    ]
+    if ops:
+        await db.users.bulk_write(ops, ordered=False)
+        logger.info(f"Backfilled GeoJSON location for {len(ops)} users")
+
+
+async def start():
+    await backfill_locations()
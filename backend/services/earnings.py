@@ -0,0 +1,157 @@
+from pymongo import UpdateOne
+from models import gen_id, now_iso
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def _balance_incs(rows, field_signs):
+    # user_id -> (role, {field: delta}) for a set of earnings rows
+    incs = {}
+    for row in rows:
+        role, fields = incs.setdefault(row["user_id"], (row.get("role", ""), {}))
+        for field, sign in field_signs.items():
+            fields[field] = fields.get(field, 0) + sign * row["amount"]
+    return incs
+
+
+async def _apply_balance_incs(incs, session=None):
+    if not incs:
+        return
+    await db.balances.bulk_write([
+        UpdateOne(
+            {"user_id": user_id},
+            {"$inc": fields, "$set": {"role": role, "updated_at": now_iso()}},
+            upsert=True,
+        )
+        for user_id, (role, fields) in incs.items()
+    ], ordered=False, session=session)
+
+
+async def record_earnings(rows, session=None):
+    """Insert earnings rows and credit each user's pending balance.
+
+    Rows are upserted by id and only newly inserted rows are credited, so
+    recording the same rows again (a retried delivery) changes nothing.
+    """
+    if not rows:
+        return
+    result = await db.earnings.bulk_write([
+        UpdateOne({"id": row["id"]}, {"$setOnInsert": {**row}}, upsert=True)
+        for row in rows
+    ], ordered=False, session=session)
+    new_rows = [rows[i] for i in result.upserted_ids]
+    await _apply_balance_incs(_balance_incs(new_rows, {"total": 1, "pending": 1}), session=session)
+
+
+async def get_balance(user_id):
+    balance = await db.balances.find_one({"user_id": user_id}, {"_id": 0})
+    balance = balance or {}
+    return {k: round(balance.get(k, 0), 2) for k in ["total", "paid", "pending"]}
+
+
+async def summarize_by_role(role=None):
+    """Totals per role from the balance documents (one row per payee, not per transaction)."""
+    pipeline = []
+    if role:
+        pipeline.append({"$match": {"role": role}})
+    pipeline.append({"$group": {
+        "_id": "$role",
+        "total": {"$sum": "$total"},
+        "paid": {"$sum": "$paid"},
+        "pending": {"$sum": "$pending"},
+        "payees": {"$sum": 1},
+    }})
+    rows = await db.balances.aggregate(pipeline).to_list(None)
+    by_role = {
+        row["_id"]: {**{k: round(row[k], 2) for k in ["total", "paid", "pending"]}, "payees": row["payees"]}
+        for row in rows
+    }
+    return {
+        "total": round(sum(r["total"] for r in by_role.values()), 2),
+        "paid": round(sum(r["paid"] for r in by_role.values()), 2),
+        "pending": round(sum(r["pending"] for r in by_role.values()), 2),
+        "by_role": by_role,
+    }
+
+
+async def payout(role=None, user_ids=None, created_before=None, all_pending=False):
+    """Flip matching PENDING earnings to PAID in one batch and move the amounts in the balances.
+
+    Paying out everything needs ``all_pending=True``; without any filter this raises
+    ValueError. Returns the batch, or None when nothing matched (no batch is recorded).
+    """
+    if not (role or user_ids or created_before or all_pending):
+        raise ValueError("Payout needs role, user_ids or created_before, or all_pending")
+    batch_id = gen_id()
+    query = {"status": "PENDING"}
+    if role:
+        query["role"] = role
+    if user_ids:
+        query["user_id"] = {"$in": list(user_ids)}
+    if created_before:
+        query["created_at"] = {"$lt": created_before}
+
+    # Tagging rows with the batch id means the balance move covers exactly the rows this batch flipped
+    paid_at = now_iso()
+    result = await db.earnings.update_many(
+        query, {"$set": {"status": "PAID", "payout_batch_id": batch_id, "paid_at": paid_at}}
+    )
+    if result.modified_count == 0:
+        return None
+    rows = await db.earnings.aggregate([
+        {"$match": {"payout_batch_id": batch_id}},
+        {"$group": {"_id": {"user_id": "$user_id", "role": "$role"}, "amount": {"$sum": "$amount"}}},
+    ]).to_list(None)
+    paid_rows = [{"user_id": r["_id"]["user_id"], "role": r["_id"].get("role", ""), "amount": r["amount"]} for r in rows]
+    await _apply_balance_incs(_balance_incs(paid_rows, {"paid": 1, "pending": -1}))
+
+    batch = {
+        "id": batch_id,
+        "role": role or "",
+        "user_ids": list(user_ids or []),
+        "created_before": created_before or "",
+        "transactions": result.modified_count,
+        "payees": len(paid_rows),
+        "amount": round(sum(r["amount"] for r in paid_rows), 2),
+        "created_at": paid_at,
+    }
+    await db.payout_batches.insert_one({**batch})
+    return batch
+
+
+async def rebuild_balances():
+    rows = await db.earnings.aggregate([
+        {"$group": {
+            "_id": "$user_id",
+            "role": {"$first": "$role"},
+            "total": {"$sum": "$amount"},
+            "paid": {"$sum": {"$cond": [{"$eq": ["$status", "PAID"]}, "$amount", 0]}},
+            "pending": {"$sum": {"$cond": [{"$eq": ["$status", "PENDING"]}, "$amount", 0]}},
+        }},
+    ]).to_list(None)
+    if rows:
+        await db.balances.bulk_write([
+            UpdateOne({"user_id": row["_id"]}, {"$set": {
+                "user_id": row["_id"],
+                "role": row["role"],
+                "total": row["total"],
+                "paid": row["paid"],
+                "pending": row["pending"],
+                "updated_at": now_iso(),
+            }}, upsert=True)
+            for row in rows
+        ], ordered=False)
+    logger.info(f"Earnings balances rebuilt for {len(rows)} payees")
+
+
+async def start():
+    if await db.balances.estimated_document_count() == 0 and await db.earnings.estimated_document_count() > 0:
+        await rebuild_balances()
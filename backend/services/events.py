@@ -0,0 +1,182 @@
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+from models import now_iso
+from services import change_feed
+import asyncio
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# memory: single node, events never leave the process. mongo: every node tails a capped collection.
+# changes: every node turns the orders change feed into events, so no explicit publish is needed.
+EVENTS_BACKEND = os.environ.get("EVENTS_BACKEND", "memory").lower()
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_CAPPED_BYTES = int(os.environ.get("EVENTS_CAPPED_BYTES", str(16 * 1024 * 1024)))
+
+ADMIN_CHANNEL = "orders"
+
+# channel -> set of Subscription
+_subscribers = {}
+_backend = None
+
+
+class Subscription:
+    def __init__(self, channels):
+        self.channels = list(channels)
+        self.queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.dropped = 0
+
+    def offer(self, event):
+        # A slow client loses its oldest events instead of growing memory or stalling publishers
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def subscribe(channels):
+    sub = Subscription(channels)
+    for channel in sub.channels:
+        _subscribers.setdefault(channel, set()).add(sub)
+    return sub
+
+
+def unsubscribe(sub):
+    for channel in sub.channels:
+        subs = _subscribers.get(channel)
+        if subs:
+            subs.discard(sub)
+            if not subs:
+                del _subscribers[channel]
+
+
+def deliver(channels, event):
+    """Fan an event out to the local subscribers of ``channels``; each connection gets it once."""
+    targets = set()
+    for channel in channels:
+        targets.update(_subscribers.get(channel, ()))
+    for sub in targets:
+        sub.offer(event)
+
+
+class MemoryBackend:
+    async def publish(self, channels, event):
+        deliver(channels, event)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class MongoBackend:
+    """Broker stand-in for several workers or nodes: events go into a capped collection
+    and every process tails it, delivering to its own connections."""
+
+    def __init__(self, database):
+        self.db = database
+        self._task = None
+
+    async def publish(self, channels, event):
+        await self.db.events.insert_one({"channels": list(channels), "event": event, "created_at": now_iso()})
+
+    async def start(self):
+        try:
+            await self.db.create_collection("events", capped=True, size=EVENTS_CAPPED_BYTES)
+        except CollectionInvalid:
+            pass
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _tail(self):
+        # Only events published after startup are delivered
+        latest = await self.db.events.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        last_id = latest["_id"] if latest else None
+        while True:
+            try:
+                query = {"_id": {"$gt": last_id}} if last_id else {}
+                cursor = self.db.events.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for doc in cursor:
+                        last_id = doc["_id"]
+                        deliver(doc["channels"], doc["event"])
+                    await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Event tail failed; retrying")
+            await asyncio.sleep(1)
+
+
+class ChangeFeedBackend:
+    async def publish(self, channels, event):
+        pass
+
+    async def start(self):
+        change_feed.subscribe("orders", self.on_order_change)
+
+    async def stop(self):
+        pass
+
+    def on_order_change(self, event):
+        if event.document and event.operation != change_feed.INVALIDATE:
+            deliver(*_order_message(event.document))
+
+
+async def publish(channels, event):
+    # Push is best effort: clients reconcile by refetching, so a failed publish must not fail the write
+    if _backend is None:
+        return
+    try:
+        await _backend.publish(channels, event)
+    except Exception:
+        logger.exception(f"Failed to publish {event.get('type')} event")
+
+
+def _order_message(order):
+    channels = [ADMIN_CHANNEL] + [
+        user_channel(order[field])
+        for field in ("customer_id", "seller_id", "delivery_partner_id")
+        if order.get(field)
+    ]
+    return channels, {
+        "type": "order",
+        "order_id": order["id"],
+        "status": order.get("status", ""),
+        "seller_id": order.get("seller_id", ""),
+        "delivery_partner_id": order.get("delivery_partner_id", ""),
+        "updated_at": order.get("updated_at", ""),
+    }
+
+
+async def publish_order(order):
+    """Tell the order's customer, seller, delivery partner and admins about its current state."""
+    await publish(*_order_message(order))
+
+
+async def start(database):
+    global _backend
+    if EVENTS_BACKEND == "mongo":
+        _backend = MongoBackend(database)
+    elif EVENTS_BACKEND == "changes":
+        _backend = ChangeFeedBackend()
+    else:
+        _backend = MemoryBackend()
+    await _backend.start()
+
+
+async def stop():
+    global _backend
+    if _backend:
+        await _backend.stop()
+        _backend = None
@@ -0,0 +1,178 @@
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+from models import gen_id
+from services.cache import TTLCache
+from datetime import datetime, timezone, timedelta
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+# How long a stored response answers retries of the same Idempotency-Key
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# A claim not renewed for this long belongs to a worker that died mid-request and may be taken over.
+# The owner renews it every third of this while the request runs, however long that takes.
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "30"))
+# How long a duplicate waits for another worker's in-progress request before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_POLL_SECONDS = 0.05
+
+# record id -> (fingerprint, response body)
+_results = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_SECONDS)
+# record id -> task computing the response in this process
+_in_flight = {}
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def _record_id(user_id, endpoint, path_params, key):
+    raw = json.dumps([user_id, endpoint, path_params, key], sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _fingerprint(bodies):
+    return hashlib.sha256(json.dumps(jsonable_encoder(bodies), sort_keys=True).encode()).hexdigest()
+
+
+async def _claim(record_id, fingerprint, now):
+    """Insert the pending record, or take over one whose owner stopped renewing it.
+
+    Returns our owner token, or None if another worker holds the record.
+    """
+    owner = gen_id()
+    lock = now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+    try:
+        await db.idempotency_keys.insert_one({
+            "id": record_id,
+            "status": "pending",
+            "fingerprint": fingerprint,
+            "owner": owner,
+            "locked_until": lock,
+            "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        })
+        return owner
+    except DuplicateKeyError:
+        pass
+    taken = await db.idempotency_keys.find_one_and_update(
+        {"id": record_id, "status": "pending", "locked_until": {"$lt": now}},
+        {"$set": {"locked_until": lock, "fingerprint": fingerprint, "owner": owner}},
+        projection={"_id": 1},
+    )
+    return owner if taken is not None else None
+
+
+async def _heartbeat(record_id, owner):
+    # Keeps a slow request's claim alive so a retry waits for it instead of running it again
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_LOCK_SECONDS / 3)
+        try:
+            renewed = await db.idempotency_keys.update_one(
+                {"id": record_id, "status": "pending", "owner": owner},
+                {"$set": {"locked_until": datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}},
+            )
+        except Exception:
+            logger.exception(f"Renewing idempotency claim {record_id} failed")
+            continue
+        if not renewed.matched_count:
+            logger.warning(f"Idempotency claim {record_id} was taken over while its request was running")
+            return
+
+
+async def _resolve(record_id, fingerprint, compute):
+    """Returns ``(fingerprint, body, replayed)`` from the store, another worker, or ``compute``."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        record = await db.idempotency_keys.find_one(
+            {"id": record_id}, {"_id": 0, "status": 1, "fingerprint": 1, "response": 1}
+        )
+        if record and record["status"] == "done":
+            _results.set(record_id, (record["fingerprint"], record["response"]))
+            return record["fingerprint"], record["response"], True
+        if record and record["fingerprint"] != fingerprint:
+            return record["fingerprint"], None, True
+        owner = await _claim(record_id, fingerprint, datetime.now(timezone.utc))
+        if owner:
+            break
+        if loop.time() > deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    heartbeat = asyncio.create_task(_heartbeat(record_id, owner))
+    try:
+        body = jsonable_encoder(await compute())
+    except BaseException:
+        # Errors aren't stored: release the claim so a retry runs the request again
+        await db.idempotency_keys.delete_one({"id": record_id, "status": "pending", "owner": owner})
+        raise
+    finally:
+        heartbeat.cancel()
+    # Owner-guarded, so a worker that lost its claim can't overwrite the new owner's response
+    stored = await db.idempotency_keys.update_one(
+        {"id": record_id, "status": "pending", "owner": owner},
+        {"$set": {"status": "done", "response": body}, "$unset": {"locked_until": "", "owner": ""}},
+    )
+    if stored.matched_count:
+        _results.set(record_id, (fingerprint, body))
+    else:
+        logger.warning(f"Idempotency claim {record_id} was lost; response not stored")
+    return fingerprint, body, False
+
+
+async def run(record_id, fingerprint, compute):
+    """Run ``compute`` at most once per record id; returns ``(body, replayed)``.
+
+    Order of lookups: this process's LRU, a computation already in flight here
+    (duplicates await the same task), then the ``idempotency_keys`` collection,
+    where a pending record means another worker is on it.
+    """
+    cached = _results.get(record_id)
+    if cached is None:
+        task = _in_flight.get(record_id)
+        replayed = task is not None
+        if task is None:
+            task = asyncio.ensure_future(_resolve(record_id, fingerprint, compute))
+            _in_flight[record_id] = task
+            task.add_done_callback(lambda _: _in_flight.pop(record_id, None))
+        # Shielded: a client hanging up mid-checkout must not cancel it for the retries waiting on it
+        stored_fingerprint, body, replayed_from_store = await asyncio.shield(task)
+        replayed = replayed or replayed_from_store
+    else:
+        (stored_fingerprint, body), replayed = cached, True
+    if stored_fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    return body, replayed
+
+
+def idempotent(endpoint):
+    """Make a route honour the ``Idempotency-Key`` header.
+
+    The route must take ``user`` and ``idempotency_key`` parameters. Keys are scoped
+    to the user, the endpoint and its path parameters; request bodies are
+    fingerprinted, so reusing a key for a different request is refused. Replays get
+    the stored response with an ``Idempotent-Replayed: true`` header.
+    """
+    @functools.wraps(endpoint)
+    async def wrapper(**kwargs):
+        key = kwargs.get("idempotency_key")
+        if not key:
+            return await endpoint(**kwargs)
+        bodies = {name: value for name, value in kwargs.items() if isinstance(value, BaseModel)}
+        path_params = {name: value for name, value in kwargs.items() if isinstance(value, str) and name != "idempotency_key"}
+        record_id = _record_id(kwargs["user"]["user_id"], endpoint.__name__, path_params, key)
+        body, replayed = await run(record_id, _fingerprint(bodies), lambda: endpoint(**kwargs))
+        return JSONResponse(body, headers={"Idempotent-Replayed": "true"}) if replayed else body
+    return wrapper
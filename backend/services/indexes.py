@@ -0,0 +1,210 @@
+"""Versioned index migration.
+
+Every index the app relies on is declared in ``INDEXES``. The first worker to boot
+with a newer ``INDEX_VERSION`` takes a lock in ``schema_migrations`` and builds all
+collections' indexes concurrently; every other worker only checks the recorded
+version and that the index names exist. Bump ``INDEX_VERSION`` whenever ``INDEXES``
+changes. Can also be run ahead of a deploy:
+
+    python -m services.indexes
+"""
+from pymongo import IndexModel, ASCENDING as ASC, DESCENDING as DESC
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timezone, timedelta
+import asyncio
+import os
+import socket
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 7
+INDEX_LOCK_SECONDS = float(os.environ.get("INDEX_LOCK_SECONDS", "600"))
+INDEX_WAIT_SECONDS = float(os.environ.get("INDEX_WAIT_SECONDS", "900"))
+
+MIGRATION_ID = "indexes"
+
+INDEXES = {
+    "users": [
+        IndexModel([("phone", ASC), ("role", ASC)], unique=True),
+        IndexModel("id", unique=True),
+        # Keyset pagination: newest first with id as the tie-breaker
+        IndexModel([("role", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("location", "2dsphere"), ("role", ASC), ("city", ASC), ("is_available", ASC)]),
+        # Dispatch without coordinates: the city fallback and partners draining dispatch_queue
+        IndexModel([("role", ASC), ("city", ASC), ("is_available", ASC)]),
+        # Change-feed polling pages on (updated_at, id)
+        IndexModel([("updated_at", ASC), ("id", ASC)]),
+    ],
+    "products": [
+        IndexModel("id", unique=True),
+        IndexModel("seller_id"),
+        IndexModel([("seller_id", ASC), ("name", ASC), ("unit", ASC), ("status", ASC)]),
+        IndexModel([("name", ASC), ("unit", ASC), ("status", ASC)]),
+        IndexModel([("seller_id", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("status", ASC), ("created_at", DESC), ("id", DESC)]),
+    ],
+    "catalog": [
+        IndexModel("key", unique=True),
+        IndexModel([("updated_at", ASC), ("key", ASC)]),
+    ],
+    "counters": [
+        IndexModel("id", unique=True),
+    ],
+    "orders": [
+        IndexModel("id", unique=True),
+        IndexModel("customer_id"),
+        IndexModel("seller_id"),
+        IndexModel([("seller_id", ASC), ("created_at", ASC)]),
+        IndexModel("delivery_partner_id"),
+        # Change-feed polling pages on (updated_at, id)
+        IndexModel([("updated_at", ASC), ("id", ASC)]),
+        IndexModel([("created_at", DESC), ("id", DESC)]),
+        IndexModel([("status", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("customer_id", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("delivery_partner_id", ASC), ("status", ASC), ("updated_at", DESC), ("id", DESC)]),
+        # Assignment queue: due CREATED orders, and ASSIGNED ones past the accept timeout
+        IndexModel([("status", ASC), ("assign_after", ASC)]),
+        IndexModel([("status", ASC), ("assigned_at", ASC)]),
+    ],
+    "earnings": [
+        IndexModel("id", unique=True),
+        IndexModel("user_id"),
+        IndexModel("payout_batch_id"),
+        IndexModel([("status", ASC), ("role", ASC), ("created_at", ASC)]),
+        IndexModel([("user_id", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("role", ASC), ("created_at", DESC), ("id", DESC)]),
+    ],
+    "balances": [
+        IndexModel("user_id", unique=True),
+        IndexModel("role"),
+    ],
+    "audit_logs": [
+        IndexModel("created_at"),
+        IndexModel([("actor_role", ASC), ("created_at", DESC), ("id", DESC)]),
+    ],
+    "warnings": [
+        IndexModel([("seller_id", ASC), ("created_at", DESC), ("id", DESC)]),
+    ],
+    "stock_snapshots": [
+        IndexModel([("seller_id", ASC), ("date", ASC)], unique=True),
+        IndexModel("date"),
+    ],
+    "stats": [
+        IndexModel("id", unique=True),
+    ],
+    "token_revocations": [
+        IndexModel("user_id", unique=True),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+    "dispatch_queue": [
+        IndexModel("order_id", unique=True),
+        IndexModel([("city", ASC), ("created_at", ASC)]),
+    ],
+    "change_feed_state": [
+        IndexModel("id", unique=True),
+    ],
+    "otp_store": [
+        IndexModel("phone", unique=True),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+    "rate_limits": [
+        IndexModel("id", unique=True),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+    "idempotency_keys": [
+        IndexModel("id", unique=True),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+}
+
+
+async def _build(db):
+    # One createIndexes command per collection, all collections at once
+    await asyncio.gather(*(db[name].create_indexes(models) for name, models in INDEXES.items()))
+
+
+async def _missing(db):
+    async def check(name, models):
+        existing = await db[name].index_information()
+        return [(name, m) for m in models if m.document["name"] not in existing]
+
+    results = await asyncio.gather(*(check(name, models) for name, models in INDEXES.items()))
+    return [item for result in results for item in result]
+
+
+async def _acquire(db):
+    now = datetime.now(timezone.utc)
+    try:
+        # Matches only when the version is behind and nobody holds a live lock
+        await db.schema_migrations.find_one_and_update(
+            {
+                "id": MIGRATION_ID,
+                "version": {"$not": {"$gte": INDEX_VERSION}},
+                "$or": [{"locked_until": None}, {"locked_until": {"$lt": now}}],
+            },
+            {"$set": {
+                "locked_until": now + timedelta(seconds=INDEX_LOCK_SECONDS),
+                "locked_by": f"{socket.gethostname()}:{os.getpid()}",
+            }},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def migrate(db):
+    """Build every index if this process wins the migration lock. Returns True if it did."""
+    if not await _acquire(db):
+        return False
+    try:
+        await _build(db)
+    except Exception:
+        await db.schema_migrations.update_one({"id": MIGRATION_ID}, {"$set": {"locked_until": None}})
+        raise
+    await db.schema_migrations.update_one(
+        {"id": MIGRATION_ID},
+        {"$set": {"version": INDEX_VERSION, "applied_at": datetime.now(timezone.utc), "locked_until": None}},
+    )
+    logger.info(f"Index migration to version {INDEX_VERSION} applied")
+    return True
+
+
+async def _current_version(db):
+    state = await db.schema_migrations.find_one({"id": MIGRATION_ID}, {"_id": 0, "version": 1})
+    return (state or {}).get("version", 0)
+
+
+async def ensure_indexes(db):
+    """Worker startup: migrate if behind and unclaimed, wait if another worker is migrating, then verify."""
+    if await _current_version(db) < INDEX_VERSION:
+        await db.schema_migrations.create_index("id", unique=True)
+        deadline = asyncio.get_running_loop().time() + INDEX_WAIT_SECONDS
+        # Retrying migrate() also takes over if the lock holder died and its lock expired
+        while await _current_version(db) < INDEX_VERSION and not await migrate(db):
+            if asyncio.get_running_loop().time() > deadline:
+                raise RuntimeError(f"Timed out waiting for index migration to version {INDEX_VERSION}")
+            await asyncio.sleep(1)
+
+    missing = await _missing(db)
+    if missing:
+        # Dropped by hand or never built; createIndexes is idempotent so rebuilding just these is safe
+        names = ", ".join(f"{name}.{model.document['name']}" for name, model in missing)
+        logger.warning(f"Rebuilding missing indexes: {names}")
+        by_collection = {}
+        for name, model in missing:
+            by_collection.setdefault(name, []).append(model)
+        await asyncio.gather(*(db[name].create_indexes(models) for name, models in by_collection.items()))
+
+
+if __name__ == "__main__":
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        await ensure_indexes(client[os.environ.get("DB_NAME", "green_basket")])
+        client.close()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def required_quantities(order_items):
+    # Collapse cart lines onto (name, unit) so repeated lines are matched against their combined quantity
+    required = {}
+    for item in order_items:
+        key = (item["name"], item["unit"])
+        required[key] = required.get(key, 0) + item["quantity"]
+    return required
+
+
+async def find_matching_seller(order_items, today, exclude_seller_ids=()):
+    """Find the first eligible seller that stocks every (name, unit) in the order.
+
+    Two round trips regardless of cart size or seller count: one for the
+    eligible seller ids, one bulk product fetch. Sellers in ``exclude_seller_ids``
+    (ones that already let the order time out) are skipped. Returns
+    ``(seller_id, {(name, unit): product})`` or ``(None, {})``.
+    """
+    required = required_quantities(order_items)
+    if not required:
+        return None, {}
+
+    query = {
+        "role": "SELLER",
+        "approval_status": "APPROVED",
+        "status": "ACTIVE",
+        "daily_stock_date": today,
+    }
+    if exclude_seller_ids:
+        query["id"] = {"$nin": list(exclude_seller_ids)}
+    sellers = await db.users.find(query, {"_id": 0, "id": 1}).to_list(None)
+    seller_ids = [s["id"] for s in sellers]
+    if not seller_ids:
+        return None, {}
+
+    products = await db.products.find({
+        "seller_id": {"$in": seller_ids},
+        "status": "APPROVED",
+        "$or": [
+            {"name": name, "unit": unit, "stock": {"$gte": quantity}}
+            for (name, unit), quantity in required.items()
+        ],
+    }, {"_id": 0, "id": 1, "seller_id": 1, "name": 1, "unit": 1, "stock": 1}).to_list(None)
+
+    carried = {}
+    for p in products:
+        carried.setdefault(p["seller_id"], {}).setdefault((p["name"], p["unit"]), p)
+
+    # Preserve the seller scan order so assignment matches the old first-fit behaviour
+    for seller_id in seller_ids:
+        lines = carried.get(seller_id)
+        if lines and len(lines) == len(required):
+            return seller_id, lines
+
+    return None, {}
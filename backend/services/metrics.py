@@ -0,0 +1,201 @@
+from pymongo import monitoring
+from bisect import bisect_left
+import time
+
+# Counters are plain attribute increments with no locks: request handling is single-threaded
+# on the event loop, and for the driver's executor threads a rare lost increment under
+# contention is an accepted trade for keeping the hot path free of lock traffic.
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+ASSIGNMENT_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+
+# Handshakes, auth and session bookkeeping, not application queries
+IGNORED_COMMANDS = frozenset([
+    "hello", "ismaster", "isMaster", "ping", "buildinfo", "buildInfo", "saslStart", "saslContinue",
+    "endSessions", "killCursors", "getnonce", "authenticate",
+])
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bucket plus +Inf, allocated once
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class Family:
+    def __init__(self, name, kind, help_text, labelnames, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = _Histogram(self.buckets) if self.kind == "histogram" else _Value()
+            child = self._children.setdefault(values, child)
+        return child
+
+
+_families = []
+
+
+def _family(name, kind, help_text, labelnames=(), buckets=None):
+    family = Family(name, kind, help_text, tuple(labelnames), buckets)
+    _families.append(family)
+    return family
+
+
+http_requests = _family("http_requests_total", "counter", "HTTP requests by route and status", ["method", "route", "status"])
+http_errors = _family("http_request_errors_total", "counter", "HTTP requests answered with 5xx or an exception", ["method", "route"])
+http_latency = _family("http_request_duration_seconds", "histogram", "HTTP request latency", ["method", "route"], HTTP_BUCKETS)
+http_in_flight = _family("http_requests_in_flight", "gauge", "HTTP requests currently being handled")
+mongo_commands = _family("mongodb_commands_total", "counter", "MongoDB commands by collection and outcome", ["collection", "command", "outcome"])
+mongo_latency = _family("mongodb_command_duration_seconds", "histogram", "MongoDB command latency", ["collection", "command"], MONGO_BUCKETS)
+assignment_attempts = _family("order_assignment_attempts_total", "counter", "Seller assignment attempts by outcome", ["outcome"])
+assignment_reassigned = _family("order_reassignments_total", "counter", "Orders taken back from sellers who did not accept in time")
+assignment_wait = _family("order_assignment_wait_seconds", "histogram", "Time from checkout to seller assignment", (), ASSIGNMENT_BUCKETS)
+
+_in_flight = http_in_flight.labels()
+_route_paths = {}
+
+
+def route_label(scope):
+    # Route templates, not raw paths, so ids don't explode the label set
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        for route in scope["app"].routes:
+            if getattr(route, "endpoint", None) is not None:
+                _route_paths[route.endpoint] = route.path
+        path = _route_paths.get(endpoint, "unmatched")
+    return path
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware; BaseHTTPMiddleware would add a task and a stream copy per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        _in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _in_flight.dec()
+            method = scope["method"]
+            route = route_label(scope)
+            http_latency.labels(method, route).observe(elapsed)
+            http_requests.labels(method, route, str(status)).inc()
+            if status >= 500:
+                http_errors.labels(method, route).inc()
+
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        # request_id -> collection; only the started event carries the command document
+        self._collections = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        self._collections[event.request_id] = target if isinstance(target, str) else ""
+
+    def _finish(self, event, outcome):
+        collection = self._collections.pop(event.request_id, None)
+        if collection is None:
+            return
+        mongo_latency.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        mongo_commands.labels(collection, event.command_name, outcome).inc()
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+command_metrics = CommandMetrics()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(extra_gauges=None):
+    """Prometheus text exposition (format 0.0.4) of every family plus ``extra_gauges``."""
+    lines = []
+    for family in _families:
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.kind}")
+        for values, child in list(family._children.items()):
+            if family.kind != "histogram":
+                lines.append(f"{family.name}{_labels(family.labelnames, values)} {child.value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(family.buckets + (float("inf"),), list(child.counts)):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{family.name}_bucket{_labels(family.labelnames, values, le)} {cumulative}")
+            lines.append(f"{family.name}_sum{_labels(family.labelnames, values)} {_format_number(child.sum)}")
+            lines.append(f"{family.name}_count{_labels(family.labelnames, values)} {cumulative}")
+    for name, (help_text, value) in (extra_gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_format_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,30 @@
+from pymongo import ReturnDocument
+from datetime import datetime, timezone
+
+db = None
+
+# ORD-YYYYMMDD-NNNNNN: fixed width, so string order on `id` is creation order and
+# new ids always land at the right edge of the orders.id index.
+SEQUENCE_WIDTH = 6
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def format_order_id(day, seq):
+    return f"ORD-{day}-{seq:0{SEQUENCE_WIDTH}d}"
+
+
+async def next_order_id():
+    """Allocate the next id from today's counter. The $inc is atomic, so concurrent
+    checkouts (and multiple workers) never hand out the same id."""
+    day = datetime.now(timezone.utc).strftime("%Y%m%d")
+    counter = await db.counters.find_one_and_update(
+        {"id": f"orders:{day}"},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return format_order_id(day, counter["seq"])
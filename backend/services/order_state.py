@@ -0,0 +1,110 @@
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from models import now_iso
+from services import stats, events
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+# auto: use transactions when the server is a replica set member or mongos; on/off force it
+ORDER_TRANSACTIONS = os.environ.get("ORDER_TRANSACTIONS", "auto").lower()
+
+TRANSITIONS = {
+    # CANCELLED when no seller is found in time (services.assignment)
+    "CREATED": {"ASSIGNED", "CANCELLED"},
+    # Back to CREATED when the seller doesn't accept in time (services.assignment)
+    "ASSIGNED": {"ACCEPTED", "CREATED"},
+    "ACCEPTED": {"READY_FOR_PICKUP"},
+    "READY_FOR_PICKUP": {"OUT_FOR_DELIVERY"},
+    "OUT_FOR_DELIVERY": {"DELIVERED"},
+}
+
+_use_transactions = False
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+async def _run(callback):
+    if not _use_transactions:
+        return await callback(None)
+    async with await db.client.start_session() as session:
+        return await session.with_transaction(callback)
+
+
+async def transition(order_id, from_status, to_status, *, match=None, changes=None,
+                     idempotency_key=None, effects=None):
+    """Move an order from ``from_status`` to ``to_status``.
+
+    The status is guarded in the update filter, so of two concurrent requests only
+    one applies. ``effects(order, session)`` performs the transition's other writes;
+    with transactions enabled they commit together with the status change. Effects
+    must be idempotent: a retry carrying the same ``idempotency_key`` replays them
+    to finish anything a crash left undone, then reports success again.
+
+    Returns ``(order, applied)``. ``order`` is None when nothing matched the guard
+    and the request is not a replay.
+    """
+    if to_status not in TRANSITIONS.get(from_status, ()):
+        raise ValueError(f"Invalid order transition {from_status} -> {to_status}")
+    match = match or {}
+    update = {"status": to_status, "updated_at": now_iso(), **(changes or {})}
+    if idempotency_key:
+        update[f"transition_keys.{to_status}"] = idempotency_key
+
+    async def apply(session):
+        order = await db.orders.find_one_and_update(
+            {"id": order_id, "status": from_status, **match},
+            {"$set": update},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if order and effects:
+            await effects(order, session)
+        return order
+
+    order = await _run(apply)
+    if order:
+        await stats.record_order_transition(from_status, to_status)
+        await events.publish_order(order)
+        return order, True
+
+    order = await find_replay(order_id, to_status, idempotency_key, match)
+    if order and effects:
+        await _run(lambda session: effects(order, session))
+    return order, False
+
+
+async def find_replay(order_id, to_status, idempotency_key, match=None):
+    """The order if ``to_status`` was already reached under this idempotency key."""
+    if not idempotency_key:
+        return None
+    return await db.orders.find_one(
+        {"id": order_id, **(match or {}), f"transition_keys.{to_status}": idempotency_key}, {"_id": 0}
+    )
+
+
+async def reject(order_id, match, detail):
+    """Raise the right error for a transition whose guard matched nothing."""
+    if not await db.orders.find_one({"id": order_id, **match}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Order not found")
+    raise HTTPException(status_code=400, detail=detail)
+
+
+async def start():
+    global _use_transactions
+    if ORDER_TRANSACTIONS in ("on", "off"):
+        _use_transactions = ORDER_TRANSACTIONS == "on"
+    else:
+        try:
+            hello = await db.command("hello")
+            _use_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _use_transactions = False
+    logger.info(f"Order transitions {'use' if _use_transactions else 'do not use'} transactions")
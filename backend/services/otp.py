@@ -0,0 +1,82 @@
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timezone, timedelta
+import hashlib
+import hmac
+import os
+import secrets
+
+db = None
+
+OTP_MODE = os.environ.get("OTP_MODE", "development")
+DEV_OTP = "123456"
+OTP_TTL_SECONDS = int(os.environ.get("OTP_TTL_SECONDS", "300"))
+# Wrong codes allowed against one OTP before it stops verifying and a new one must be sent
+OTP_MAX_ATTEMPTS = int(os.environ.get("OTP_MAX_ATTEMPTS", "5"))
+OTP_SECRET = os.environ.get("OTP_SECRET") or os.environ.get("JWT_SECRET", "green_basket_secret_key_v1")
+
+VERIFIED = "verified"
+INVALID = "invalid"
+EXPIRED = "expired"
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def _digest(phone, otp):
+    # Only the HMAC is stored, and lookups compare digests, never the code itself
+    return hmac.new(OTP_SECRET.encode(), f"{phone}:{otp}".encode(), hashlib.sha256).hexdigest()
+
+
+def generate():
+    if OTP_MODE == "development":
+        return DEV_OTP
+    return f"{secrets.randbelow(1_000_000):06d}"
+
+
+async def issue(phone):
+    """Create a fresh OTP for ``phone``, replacing any earlier one, and return it."""
+    otp = generate()
+    now = datetime.now(timezone.utc)
+    update = {
+        "$set": {
+            "phone": phone,
+            "otp_hash": _digest(phone, otp),
+            "attempts": 0,
+            "created_at": now,
+            # The TTL index removes the document at this instant
+            "expires_at": now + timedelta(seconds=OTP_TTL_SECONDS),
+        },
+        "$unset": {"otp": ""},
+    }
+    try:
+        await db.otp_store.update_one({"phone": phone}, update, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent send for the same phone inserted first; overwrite it
+        await db.otp_store.update_one({"phone": phone}, update)
+    return otp
+
+
+async def verify(phone, otp):
+    """Consume the OTP if it matches; returns VERIFIED, INVALID or EXPIRED.
+
+    The match and the delete are one atomic ``find_one_and_delete``, so a code can't
+    be used twice. The query compares HMAC digests rather than the code, so response
+    timing says nothing about how many digits of a guess were right.
+    """
+    now = datetime.now(timezone.utc)
+    # The TTL monitor runs about once a minute, hence the explicit expiry check
+    live = {"phone": phone, "expires_at": {"$gt": now}, "attempts": {"$lt": OTP_MAX_ATTEMPTS}}
+    matched = await db.otp_store.find_one_and_delete(
+        {**live, "otp_hash": _digest(phone, otp)}, projection={"_id": 0, "phone": 1}
+    )
+    if matched:
+        return VERIFIED
+    result = await db.otp_store.update_one(live, {"$inc": {"attempts": 1}})
+    return INVALID if result.matched_count else EXPIRED
+
+
+async def purge_legacy():
+    # Documents written before expiry existed would never be removed by the TTL index
+    await db.otp_store.delete_many({"expires_at": {"$exists": False}})
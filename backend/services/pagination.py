@@ -0,0 +1,108 @@
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import base64
+import json
+import re
+
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
+_FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+_CURSOR_TYPES = (str, int, float, type(None))
+
+
+def encode_cursor(value, doc_id):
+    return base64.urlsafe_b64encode(json.dumps([value, doc_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Scalars only: the value lands in an equality match, where a dict would be read as operators
+    if not isinstance(decoded, list) or len(decoded) != 2 or not all(isinstance(v, _CURSOR_TYPES) for v in decoded):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    value, doc_id = decoded
+    return value, doc_id
+
+
+def _outermost(paths):
+    """Dedupe dotted paths and drop any whose parent is also listed; Mongo rejects the overlap."""
+    kept = []
+    for path in sorted(set(paths), key=lambda p: p.count(".")):
+        if not any(path.startswith(parent + ".") for parent in kept):
+            kept.append(path)
+    return kept
+
+
+class PageParams:
+    """Query parameters shared by every list endpoint.
+
+    ``cursor`` is the opaque ``next_cursor`` from a previous page, ``fields``
+    a comma-separated projection, and ``format=ndjson`` streams every
+    remaining row instead of returning one page.
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        fields: Optional[str] = None,
+        format: str = "json",
+    ):
+        if format not in ["json", "ndjson"]:
+            raise HTTPException(status_code=400, detail="format must be json or ndjson")
+        self.cursor = cursor
+        self.limit = limit
+        self.fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        self.format = format
+        for field in self.fields or []:
+            # _id is always projected out: an ObjectId can't be encoded as JSON
+            if not _FIELD_RE.match(field) or field.split(".")[0] == "_id":
+                raise HTTPException(status_code=400, detail=f"Invalid field: {field}")
+
+    def projection(self, sort_field):
+        if not self.fields:
+            return {"_id": 0}
+        # The keyset columns always come back so the cursor can be built
+        return {"_id": 0, **{f: 1 for f in _outermost([sort_field, "id", *self.fields])}}
+
+    def keyset_query(self, query, sort_field):
+        if not self.cursor:
+            return query
+        value, doc_id = decode_cursor(self.cursor)
+        after = {"$or": [{sort_field: {"$lt": value}}, {sort_field: value, "id": {"$lt": doc_id}}]}
+        return {"$and": [query, after]} if query else after
+
+    async def fetch(self, collection, query, sort_field="created_at", default_limit=100):
+        """Return ``(items, next_cursor)`` for one newest-first page."""
+        limit = max(1, min(self.limit or default_limit, MAX_PAGE_SIZE))
+        items = await collection.find(
+            self.keyset_query(query, sort_field), self.projection(sort_field)
+        ).sort([(sort_field, -1), ("id", -1)]).limit(limit + 1).to_list(None)
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            next_cursor = encode_cursor(last.get(sort_field), last.get("id"))
+        return items, next_cursor
+
+    def stream(self, collection, query, sort_field="created_at"):
+        cursor = collection.find(
+            self.keyset_query(query, sort_field), self.projection(sort_field)
+        ).sort([(sort_field, -1), ("id", -1)]).batch_size(STREAM_BATCH_SIZE)
+
+        async def rows():
+            async for doc in cursor:
+                yield json.dumps(doc, default=str) + "\n"
+
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    async def respond(self, collection, query, key, sort_field="created_at", default_limit=100, extra=None):
+        if self.format == "ndjson":
+            return self.stream(collection, query, sort_field)
+        items, next_cursor = await self.fetch(collection, query, sort_field, default_limit)
+        return {**(extra or {}), key: items, "next_cursor": next_cursor}
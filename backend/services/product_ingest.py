@@ -0,0 +1,156 @@
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from models import BulkProductItem, gen_id, now_iso
+import codecs
+import csv
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+INGEST_CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", "500"))
+INGEST_MAX_ROWS = int(os.environ.get("INGEST_MAX_ROWS", "20000"))
+# Past this many the response just counts failures instead of listing them
+INGEST_MAX_REPORTED_ERRORS = int(os.environ.get("INGEST_MAX_REPORTED_ERRORS", "1000"))
+
+CSV_COLUMNS = ["name", "unit", "price"]
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def new_product(seller_id, item):
+    return {
+        "id": gen_id(),
+        "seller_id": seller_id,
+        "name": item.name,
+        "unit": item.unit,
+        "seller_price": item.price,
+        "status": "PENDING",
+        "stock": 0,
+        "created_at": now_iso(),
+    }
+
+
+async def iter_lines(chunks):
+    """Split an async stream of bytes into text lines without buffering the whole body."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+
+async def iter_csv_rows(lines):
+    # First non-blank line is the header; columns may come in any order
+    header = None
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [v.strip().lower() for v in values]
+            missing = [c for c in CSV_COLUMNS if c not in header]
+            if missing:
+                raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+            continue
+        row_number += 1
+        yield row_number, dict(zip(header, (v.strip() for v in values)))
+
+
+async def iter_ndjson_rows(lines):
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, ValueError(f"Invalid JSON: {e.msg}")
+
+
+def _validation_message(error):
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+class IngestReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row, message):
+        self.failed += 1
+        if len(self.errors) < INGEST_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def _write_chunk(chunk, report):
+    # chunk: [(row_number, product)]; unordered so one bad row doesn't stop the rest
+    try:
+        result = await db.products.insert_many([{**product} for _, product in chunk], ordered=False)
+        report.inserted += len(result.inserted_ids)
+    except BulkWriteError as e:
+        failed = {err["index"]: err.get("errmsg", "write failed") for err in e.details.get("writeErrors", [])}
+        report.inserted += e.details.get("nInserted", len(chunk) - len(failed))
+        for index, message in sorted(failed.items()):
+            report.error(chunk[index][0], message)
+
+
+async def ingest(seller_id, rows):
+    """Validate ``(row_number, raw)`` pairs as they arrive and insert them in chunks.
+
+    Returns an ``IngestReport``; rows that fail validation or the insert are reported by
+    row number and never abort the upload.
+    """
+    report = IngestReport()
+    chunk = []
+    async for row_number, raw in rows:
+        report.rows += 1
+        if report.rows > INGEST_MAX_ROWS:
+            report.rows -= 1
+            report.error(row_number, f"Upload exceeds {INGEST_MAX_ROWS} rows; remaining rows skipped")
+            break
+        if isinstance(raw, Exception):
+            report.error(row_number, str(raw))
+            continue
+        try:
+            item = BulkProductItem.model_validate(raw)
+        except ValidationError as e:
+            report.error(row_number, _validation_message(e))
+            continue
+        if not item.name.strip() or not item.unit.strip():
+            report.error(row_number, "name and unit are required")
+            continue
+        if item.price <= 0:
+            report.error(row_number, "price must be positive")
+            continue
+        chunk.append((row_number, new_product(seller_id, item)))
+        if len(chunk) >= INGEST_CHUNK_SIZE:
+            await _write_chunk(chunk, report)
+            chunk = []
+    if chunk:
+        await _write_chunk(chunk, report)
+    return report
@@ -0,0 +1,159 @@
+from pymongo import monitoring
+from contextvars import ContextVar
+from services.metrics import route_label, IGNORED_COMMANDS
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default Mongo round trips one request may make before it is logged as over budget
+QUERY_BUDGET = int(os.environ.get("QUERY_BUDGET", "25"))
+# "POST /api/customer/cart/checkout=12,GET /api/delivery/active-order=4"
+QUERY_BUDGETS = {
+    key.strip(): int(value)
+    for key, value in (
+        entry.rsplit("=", 1) for entry in os.environ.get("QUERY_BUDGETS", "").split(",") if "=" in entry
+    )
+}
+# The same query shape this many times in one request is reported as a likely N+1 loop
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", "5"))
+
+_current = ContextVar("query_trace", default=None)
+_observers = []
+
+
+def _shape(value):
+    # Field names and operators, not values: find({"id": "a"}) and find({"id": "b"}) are one shape
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{k}:{_shape(v)}" for k, v in sorted(value.items())) + "}"
+    if isinstance(value, list):
+        return "[" + (_shape(value[0]) if value and isinstance(value[0], dict) else "") + "]"
+    return "?"
+
+
+def _filter_of(command_name, command):
+    if command_name in ("find", "count", "distinct"):
+        return command.get("filter", command.get("query", {}))
+    if command_name == "findAndModify":
+        return command.get("query", {})
+    if command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        return {"q": statements[0].get("q", {}), "n": len(statements)}
+    if command_name == "aggregate":
+        return {"pipeline": [next(iter(stage)) for stage in command.get("pipeline", [])]}
+    return {}
+
+
+class QueryTrace:
+    """Mongo round trips made on behalf of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.db_ms = 0.0
+        self.shapes = {}
+
+    def record(self, shape, duration_ms):
+        self.count += 1
+        self.db_ms += duration_ms
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+class TraceListener(monitoring.CommandListener):
+    """Attributes each command to the request that issued it.
+
+    Motor copies the caller's context into its executor threads, so the request's
+    trace is visible here. Started and finished events of one command run in the
+    same context, so the shape can be stashed on the trace until the duration is known.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS or _current.get() is None:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        shape = f"{event.command_name} {collection if isinstance(collection, str) else ''} " \
+                f"{_shape(_filter_of(event.command_name, event.command))}"
+        self._pending[event.request_id] = shape
+
+    def _finish(self, event):
+        shape = self._pending.pop(event.request_id, None)
+        trace = _current.get()
+        if shape is not None and trace is not None:
+            trace.record(shape, event.duration_micros / 1000)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+
+trace_listener = TraceListener()
+
+
+def current_trace():
+    return _current.get()
+
+
+def start_trace():
+    trace = QueryTrace()
+    return trace, _current.set(trace)
+
+
+def end_trace(token):
+    _current.reset(token)
+
+
+def add_observer(callback):
+    """``callback(method, route, trace)`` runs after every traced request (used by the pytest plugin)."""
+    _observers.append(callback)
+
+
+def remove_observer(callback):
+    _observers.remove(callback)
+
+
+def budget_for(method, route):
+    return QUERY_BUDGETS.get(f"{method} {route}", QUERY_BUDGET)
+
+
+class QueryTraceMiddleware:
+    """Counts Mongo round trips per request, reports them in a Server-Timing header and
+    warns when a route goes over its query budget or repeats a query shape in a loop."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace, token = start_trace()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timing = f'db;dur={trace.db_ms:.1f};desc="{trace.count} queries"'.encode()
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_trace(token)
+            method = scope["method"]
+            route = route_label(scope)
+            budget = budget_for(method, route)
+            if trace.count > budget:
+                logger.warning(f"{method} {route} made {trace.count} queries (budget {budget})")
+            for shape, n in trace.repeated().items():
+                logger.warning(f"{method} {route} ran the same query {n} times, likely N+1: {shape}")
+            for observer in list(_observers):
+                observer(method, route, trace)
@@ -0,0 +1,108 @@
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from services.cache import TTLCache
+from datetime import datetime, timezone, timedelta
+import math
+import os
+import time
+
+db = None
+
+# "memory" keeps buckets per process; "mongo" shares them across workers through the rate_limits collection
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def parse_limit(spec):
+    """``"5/900"`` -> (capacity 5, refill rate 5/900 tokens per second)."""
+    count, _, seconds = spec.partition("/")
+    capacity = float(count)
+    return capacity, capacity / float(seconds or 1)
+
+
+class MemoryTokenBucket:
+    """Token buckets keyed by caller, in this process only.
+
+    A bucket starts full with ``capacity`` tokens and refills continuously at
+    ``rate`` per second, so a caller gets a burst of ``capacity`` and then a steady
+    ``rate``. Idle buckets are full again after ``capacity / rate`` seconds, which
+    is when the cache lets them expire.
+    """
+
+    def __init__(self, name, capacity, rate):
+        self.name = name
+        self.capacity = capacity
+        self.rate = rate
+        self._buckets = TTLCache(maxsize=RATE_LIMIT_MAX_KEYS, ttl=capacity / rate)
+
+    async def hit(self, key):
+        """Take one token. Returns ``(allowed, retry_after_seconds)``."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets.set(key, (tokens, now))
+        return allowed, 0 if allowed else math.ceil((1 - tokens) / self.rate)
+
+
+class MongoTokenBucket:
+    """The same bucket kept in ``rate_limits`` so every worker draws from it.
+
+    Refill and take happen in one pipeline update, so concurrent hits from
+    different workers can't both spend the last token. The TTL index on
+    ``expires_at`` drops buckets once they would be full again.
+    """
+
+    def __init__(self, name, capacity, rate):
+        self.name = name
+        self.capacity = capacity
+        self.rate = rate
+
+    async def hit(self, key):
+        now = time.time()
+        refilled = {"$min": [
+            self.capacity,
+            {"$add": [
+                {"$ifNull": ["$tokens", self.capacity]},
+                {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, self.rate]},
+            ]},
+        ]}
+        update = [
+            {"$set": {"tokens": refilled, "updated": now}},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.capacity / self.rate),
+            }},
+        ]
+        bucket_id = f"{self.name}:{key}"
+        try:
+            bucket = await db.rate_limits.find_one_and_update(
+                {"id": bucket_id}, update, upsert=True,
+                projection={"_id": 0, "tokens": 1, "allowed": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Two first hits raced on the upsert; the bucket exists now
+            bucket = await db.rate_limits.find_one_and_update(
+                {"id": bucket_id}, update,
+                projection={"_id": 0, "tokens": 1, "allowed": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+        if bucket["allowed"]:
+            return True, 0
+        return False, math.ceil((1 - bucket["tokens"]) / self.rate)
+
+
+def limiter(name, spec):
+    """A token bucket family for ``spec`` (see ``parse_limit``) on the configured backend."""
+    capacity, rate = parse_limit(spec)
+    bucket_class = MongoTokenBucket if RATE_LIMIT_BACKEND == "mongo" else MemoryTokenBucket
+    return bucket_class(name, capacity, rate)
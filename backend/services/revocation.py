@@ -0,0 +1,72 @@
+from datetime import datetime, timezone, timedelta
+import middleware
+import asyncio
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+REVOCATION_SYNC_SECONDS = float(os.environ.get("REVOCATION_SYNC_SECONDS", "5"))
+
+_sync_task = None
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+async def revoke_user(user_id):
+    """Refuse every token issued to ``user_id`` up to now, on all workers."""
+    revoked_at = time.time()
+    middleware.revoke_user(user_id, revoked_at)
+    await db.token_revocations.update_one({"user_id": user_id}, _revocation_update(user_id, revoked_at), upsert=True)
+
+
+def _revocation_update(user_id, revoked_at):
+    fields = {"user_id": user_id, "revoked_at": revoked_at}
+    if middleware.ACCEPT_LEGACY_TOKENS:
+        # Legacy tokens never expire, so only the record stops them: keep it until restore_user
+        return {"$set": fields, "$unset": {"expires_at": ""}}
+    # Once every token issued before the revocation is past refresh too, the TTL index drops the record
+    lifetime = middleware.ACCESS_TOKEN_TTL + middleware.REFRESH_GRACE_SECONDS
+    fields["expires_at"] = datetime.now(timezone.utc) + timedelta(seconds=lifetime)
+    return {"$set": fields}
+
+
+async def restore_user(user_id):
+    middleware.restore_user(user_id)
+    await db.token_revocations.delete_one({"user_id": user_id})
+
+
+async def sync_revocations():
+    docs = await db.token_revocations.find(
+        {"$or": [{"expires_at": {"$exists": False}}, {"expires_at": {"$gt": datetime.now(timezone.utc)}}]},
+        {"_id": 0, "user_id": 1, "revoked_at": 1},
+    ).to_list(None)
+    middleware.replace_revocations({d["user_id"]: d["revoked_at"] for d in docs})
+
+
+async def _sync_loop():
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+        try:
+            await sync_revocations()
+        except Exception:
+            logger.exception("Token revocation sync failed")
+
+
+async def start():
+    global _sync_task
+    await sync_revocations()
+    _sync_task = asyncio.create_task(_sync_loop())
+
+
+async def stop():
+    global _sync_task
+    if _sync_task:
+        _sync_task.cancel()
+        _sync_task = None
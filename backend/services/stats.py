@@ -0,0 +1,205 @@
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from models import now_iso
+from datetime import datetime, timezone, timedelta
+import asyncio
+import os
+import socket
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+ACTIVE_ORDER_STATUSES = ["CREATED", "ASSIGNED", "ACCEPTED", "READY_FOR_PICKUP", "OUT_FOR_DELIVERY"]
+STATS_RECONCILE_SECONDS = float(os.environ.get("STATS_RECONCILE_SECONDS", "3600"))
+# Per-day counts older than this are never recounted; 0 skips per-day counts entirely
+STATS_RECONCILE_DAYS = int(os.environ.get("STATS_RECONCILE_DAYS", "2"))
+# How often each worker checks whether the cluster-wide reconciliation is due
+STATS_RECONCILE_POLL_SECONDS = 60
+
+GLOBAL_ID = "global"
+# Holds next_run_at, so one worker per interval runs the reconciliation
+RECONCILE_ID = "reconcile"
+
+_reconcile_task = None
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def day_id(date):
+    return f"day:{date}"
+
+
+def user_counters(user):
+    role = user.get("role")
+    approved_active = user.get("approval_status") == "APPROVED" and user.get("status") == "ACTIVE"
+    return {
+        "active_sellers": int(role == "SELLER" and approved_active),
+        "active_delivery_partners": int(role == "DELIVERY" and approved_active),
+        "pending_approvals": int(role in ["SELLER", "DELIVERY"] and user.get("approval_status") == "PENDING"),
+    }
+
+
+async def record_order_created(status):
+    today = now_iso()[:10]
+    await db.stats.bulk_write([
+        UpdateOne({"id": GLOBAL_ID}, {"$inc": {f"orders.{status}": 1}}, upsert=True),
+        UpdateOne(
+            {"id": day_id(today)},
+            {"$inc": {"orders_created": 1, f"transitions.{status}": 1}, "$set": {"date": today}},
+            upsert=True,
+        ),
+    ], ordered=False)
+
+
+async def record_order_transition(from_status, to_status):
+    today = now_iso()[:10]
+    await db.stats.bulk_write([
+        UpdateOne({"id": GLOBAL_ID}, {"$inc": {f"orders.{from_status}": -1, f"orders.{to_status}": 1}}, upsert=True),
+        UpdateOne(
+            {"id": day_id(today)},
+            {"$inc": {f"transitions.{to_status}": 1}, "$set": {"date": today}},
+            upsert=True,
+        ),
+    ], ordered=False)
+
+
+async def record_user_change(before, after):
+    """Apply the counter delta between two versions of a user document (either may be None)."""
+    old = user_counters(before or {})
+    new = user_counters(after or {})
+    deltas = {f"users.{k}": new[k] - old[k] for k in new if new[k] != old[k]}
+    if deltas:
+        await db.stats.update_one({"id": GLOBAL_ID}, {"$inc": deltas}, upsert=True)
+
+
+async def get_dashboard_counters(today):
+    docs = await db.stats.find({"id": {"$in": [GLOBAL_ID, day_id(today)]}}, {"_id": 0}).to_list(2)
+    by_id = {d["id"]: d for d in docs}
+    return by_id.get(GLOBAL_ID, {}), by_id.get(day_id(today), {})
+
+
+def _flatten(docs):
+    """``{stats doc id: doc}`` -> ``{(doc id, dotted field): value}`` for the reconciled counters."""
+    values = {}
+    for doc_id, doc in docs.items():
+        if doc_id == GLOBAL_ID:
+            for group in ("orders", "users"):
+                for key, value in (doc.get(group) or {}).items():
+                    values[(doc_id, f"{group}.{key}")] = value
+        else:
+            values[(doc_id, "orders_created")] = doc.get("orders_created", 0)
+    return values
+
+
+async def _read_counters(since):
+    query = {"$or": [{"id": GLOBAL_ID}, {"date": {"$gte": since}} if since else {"date": {"$exists": True}}]}
+    docs = await db.stats.find(query, {"_id": 0}).to_list(None)
+    return _flatten({d["id"]: d for d in docs})
+
+
+async def reconcile(days=STATS_RECONCILE_DAYS):
+    """Correct counter drift against the source collections.
+
+    Only the last ``days`` days of per-day counts are recounted (all of history
+    when ``days`` is None). Corrections are applied as ``$inc`` deltas, and a
+    counter that changed while it was being recounted is left for the next run,
+    so concurrent ``record_*`` updates are never overwritten.
+    """
+    since = None
+    if days is not None:
+        since = (datetime.now(timezone.utc) - timedelta(days=max(days - 1, 0))).date().isoformat()
+    before = await _read_counters(since)
+
+    # One COUNT_SCAN per status on the (status, ...) index instead of a collection scan
+    statuses = [status for status in await db.orders.distinct("status") if status]
+    status_counts = await asyncio.gather(*(db.orders.count_documents({"status": status}) for status in statuses))
+    fresh = {(GLOBAL_ID, f"orders.{status}"): count for status, count in zip(statuses, status_counts)}
+
+    fresh[(GLOBAL_ID, "users.active_sellers")] = await db.users.count_documents(
+        {"role": "SELLER", "approval_status": "APPROVED", "status": "ACTIVE"})
+    fresh[(GLOBAL_ID, "users.active_delivery_partners")] = await db.users.count_documents(
+        {"role": "DELIVERY", "approval_status": "APPROVED", "status": "ACTIVE"})
+    fresh[(GLOBAL_ID, "users.pending_approvals")] = await db.users.count_documents(
+        {"approval_status": "PENDING", "role": {"$in": ["SELLER", "DELIVERY"]}})
+
+    if days != 0:
+        by_day = await db.orders.aggregate([
+            *([{"$match": {"created_at": {"$gte": since}}}] if since else []),
+            {"$group": {"_id": {"$substrCP": ["$created_at", 0, 10]}, "count": {"$sum": 1}}},
+        ]).to_list(None)
+        fresh.update({(day_id(row["_id"]), "orders_created"): row["count"] for row in by_day if row["_id"]})
+
+    after = await _read_counters(since)
+    # Statuses and days with no orders left still have a counter to bring back to zero
+    recounted = ("orders.", "orders_created") if days != 0 else ("orders.",)
+    fresh.update({key: 0 for key in after if key not in fresh and key[1].startswith(recounted)})
+
+    deltas = {}
+    skipped = 0
+    for (doc_id, field), count in fresh.items():
+        current = after.get((doc_id, field), 0)
+        if before.get((doc_id, field), 0) != current:
+            skipped += 1
+            continue
+        if count != current:
+            deltas.setdefault(doc_id, {})[field] = count - current
+
+    ops = [
+        UpdateOne(
+            {"id": doc_id},
+            {"$inc": inc} if doc_id == GLOBAL_ID else {"$inc": inc, "$set": {"date": doc_id[len("day:"):]}},
+            upsert=True,
+        )
+        for doc_id, inc in deltas.items()
+    ]
+    ops.append(UpdateOne({"id": GLOBAL_ID}, {"$set": {"reconciled_at": now_iso()}}, upsert=True))
+    await db.stats.bulk_write(ops, ordered=False)
+    logger.info(f"Stats reconciled: {sum(len(inc) for inc in deltas.values())} counters corrected, "
+                f"{skipped} busy counters left for the next run")
+
+
+async def _acquire_run(now):
+    """Claim this interval's reconciliation. True in exactly one worker per interval."""
+    try:
+        await db.stats.update_one(
+            {"id": RECONCILE_ID, "$or": [{"next_run_at": None}, {"next_run_at": {"$lte": now}}]},
+            {"$set": {
+                "next_run_at": now + timedelta(seconds=STATS_RECONCILE_SECONDS),
+                "claimed_by": f"{socket.gethostname()}:{os.getpid()}",
+            }},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # Not due: the filter missed the existing document and the upsert collided with it
+        return False
+    return True
+
+
+async def _reconcile_loop():
+    while True:
+        await asyncio.sleep(STATS_RECONCILE_POLL_SECONDS)
+        try:
+            if await _acquire_run(datetime.now(timezone.utc)):
+                await reconcile()
+        except Exception:
+            logger.exception("Stats reconciliation failed")
+
+
+async def start():
+    global _reconcile_task
+    # First deploy: one worker counts all of history, the rest start from empty counters
+    if not await db.stats.find_one({"id": GLOBAL_ID}, {"_id": 1}) and await _acquire_run(datetime.now(timezone.utc)):
+        await reconcile(days=None)
+    _reconcile_task = asyncio.create_task(_reconcile_loop())
+
+
+async def stop():
+    global _reconcile_task
+    if _reconcile_task:
+        _reconcile_task.cancel()
+        _reconcile_task = None
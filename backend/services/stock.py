@@ -0,0 +1,136 @@
+from pymongo import UpdateOne
+from models import gen_id
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+db = None
+
+# A confirm write loses only to a reservation or release landing between its read and write
+STOCK_CONFIRM_ATTEMPTS = int(os.environ.get("STOCK_CONFIRM_ATTEMPTS", "5"))
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+def new_hold_id(order_id):
+    # One per reservation attempt, so releasing a failed or abandoned attempt can't undo another's hold
+    return f"{order_id}:{gen_id()}"
+
+
+def hold_id(order):
+    """The hold an order's reserved stock carries; orders reserved before per-attempt ids used the order id."""
+    return order.get("stock_hold_id") or order["id"]
+
+
+def quantities_by_product(items):
+    quantities = {}
+    for item in items:
+        quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+    return quantities
+
+
+async def reserve_stock(hold_id, items):
+    """Atomically take stock for every line of an order, or none of it.
+
+    Each product is decremented with a conditional ``$inc`` guarded by
+    ``stock >= qty`` and tagged with ``hold_id`` in ``stock_holds``, with the
+    quantity under ``stock_held.<hold_id>``; all lines go out in one unordered
+    ``bulk_write``. If any line loses the race the lines that did succeed are
+    released again and ``False`` is returned.
+    """
+    quantities = quantities_by_product(items)
+    if not quantities:
+        return True
+
+    ops = [
+        UpdateOne(
+            {"id": product_id, "stock": {"$gte": quantity}, "stock_holds": {"$ne": hold_id}},
+            {
+                "$inc": {"stock": -quantity},
+                "$push": {"stock_holds": hold_id},
+                "$set": {f"stock_held.{hold_id}": quantity},
+            },
+        )
+        for product_id, quantity in quantities.items()
+    ]
+    result = await db.products.bulk_write(ops, ordered=False)
+    if result.modified_count == len(ops):
+        return True
+
+    await release_stock(hold_id, items)
+    logger.info(f"Stock reservation {hold_id} failed: {result.modified_count}/{len(ops)} lines available")
+    return False
+
+
+async def release_stock(hold_id, items, session=None):
+    # Only products still carrying the hold are restored, so releasing twice is harmless
+    quantities = quantities_by_product(items)
+    if not quantities:
+        return
+    await db.products.bulk_write([
+        UpdateOne(
+            {"id": product_id, "stock_holds": hold_id},
+            {
+                "$inc": {"stock": quantity},
+                "$pull": {"stock_holds": hold_id},
+                "$unset": {f"stock_held.{hold_id}": ""},
+            },
+        )
+        for product_id, quantity in quantities.items()
+    ], ordered=False, session=session)
+
+
+async def commit_stock(hold_id, items, session=None):
+    # The stock is already deducted; committing just drops the hold marker
+    product_ids = list(quantities_by_product(items))
+    if not product_ids:
+        return
+    await db.products.update_many(
+        {"id": {"$in": product_ids}, "stock_holds": hold_id},
+        {"$pull": {"stock_holds": hold_id}, "$unset": {f"stock_held.{hold_id}": ""}},
+        session=session,
+    )
+
+
+async def confirm_levels(seller_id, counts):
+    """Set each product's stock from a shelf count, less the quantity open holds already took.
+
+    Held units are still on the shelf when the seller counts them, and releasing a hold adds
+    them back, so the sellable level is ``count - held``. Each write is guarded on the holds it
+    was computed from and retried when a reservation or release lands in between. Returns the
+    ids that could not be set.
+    """
+    confirmation = gen_id()
+    pending = dict(counts)
+    for _ in range(STOCK_CONFIRM_ATTEMPTS):
+        products = await db.products.find(
+            {"id": {"$in": list(pending)}, "seller_id": seller_id},
+            {"_id": 0, "id": 1, "stock_holds": 1, "stock_held": 1},
+        ).to_list(None)
+        if not products:
+            return []
+        # Holds taken before quantities were recorded count as 0, as they always did
+        ops = [
+            UpdateOne(
+                {"id": p["id"], "seller_id": seller_id, "stock_holds": p.get("stock_holds")},
+                {"$set": {
+                    "stock": max(pending[p["id"]] - sum((p.get("stock_held") or {}).values()), 0),
+                    "stock_confirmation": confirmation,
+                }},
+            )
+            for p in products
+        ]
+        result = await db.products.bulk_write(ops, ordered=False)
+        if result.matched_count == len(ops):
+            return []
+        missed = await db.products.find(
+            {"id": {"$in": [p["id"] for p in products]}, "stock_confirmation": {"$ne": confirmation}},
+            {"_id": 0, "id": 1},
+        ).to_list(None)
+        pending = {p["id"]: pending[p["id"]] for p in missed}
+    logger.warning(f"Stock confirmation for seller {seller_id} kept losing to reservations: {sorted(pending)}")
+    return sorted(pending)
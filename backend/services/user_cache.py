@@ -0,0 +1,42 @@
+from services.cache import TTLCache
+import os
+
+db = None
+
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "10"))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+
+# user id -> user document (without _id). Every users write path must call invalidate_user.
+_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def set_db(database):
+    global db
+    db = database
+
+
+async def get_user(user_id):
+    user = _cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        if not user:
+            return None
+        _cache.set(user_id, user)
+    # Callers get their own copy so a handler can't corrupt the shared entry
+    return dict(user)
+
+
+def invalidate_user(user_id):
+    _cache.pop(user_id)
+
+
+def clear():
+    _cache.clear()
+
+
+def on_change(event):
+    # Another worker may have written the user; deletes and invalidations carry no id
+    if event.doc_id and event.operation != "invalidate":
+        invalidate_user(event.doc_id)
+    else:
+        clear()
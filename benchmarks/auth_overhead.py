@@ -0,0 +1,77 @@
+"""Per-request authentication overhead.
+
+Times token verification the old way (full ``jwt.decode`` every call) against
+``middleware.decode_token`` with a warm verified-token cache, plus the full
+``get_current_user`` dependency including the revocation check. No database
+is involved.
+
+    python benchmarks/auth_overhead.py
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import common  # noqa: F401  (puts backend/ on sys.path)
+
+import jwt
+import middleware
+from fastapi.security import HTTPAuthorizationCredentials
+
+
+def per_call_us(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--revoked-users", type=int, default=1000)
+    args = parser.parse_args()
+
+    token = middleware.create_token("user-1", "CUSTOMER", "Bangalore", "ACTIVE", "9000000000")
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    for n in range(args.revoked_users):
+        middleware.revoke_user(f"revoked-{n}")
+
+    def legacy():
+        jwt.decode(token, middleware.JWT_SECRET, algorithms=[middleware.JWT_ALGORITHM])
+
+    def cold():
+        middleware._verified_tokens.clear()
+        middleware.decode_token(token)
+
+    def warm():
+        middleware.decode_token(token)
+
+    loop = asyncio.new_event_loop()
+
+    def dependency():
+        loop.run_until_complete(middleware.get_current_user(credentials))
+
+    def loop_baseline():
+        loop.run_until_complete(asyncio.sleep(0))
+
+    results = {
+        "create_token_us": per_call_us(
+            lambda: middleware.create_token("user-1", "CUSTOMER", "Bangalore", "ACTIVE", "9000000000"),
+            args.iterations,
+        ),
+        "legacy_jwt_decode_us": per_call_us(legacy, args.iterations),
+        "decode_token_cold_us": per_call_us(cold, args.iterations),
+        "decode_token_cached_us": per_call_us(warm, args.iterations),
+        # Event-loop dispatch is paid by every dependency, so report it separately
+        "get_current_user_us": per_call_us(dependency, args.iterations // 10) - per_call_us(loop_baseline, args.iterations // 10),
+    }
+    loop.close()
+
+    for name, value in results.items():
+        print(f"{name:>26}: {value:8.2f} us")
+    print(json.dumps({k: round(v, 3) for k, v in results.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""End-to-end check of ``services.change_feed`` against a single-node replica set.
+
+Change streams need a replica set, so start a throwaway one first:
+
+    mongod --replSet rs0 --port 27018 --dbpath /tmp/rs0 --bind_ip localhost
+    MONGO_URL="mongodb://localhost:27018/?directConnection=true" python benchmarks/change_feed_harness.py
+
+The replica set is initiated on first use. The harness checks that inserts,
+updates and deletes on users, products and orders reach registered handlers,
+that writes made while the consumer is stopped are replayed from the persisted
+resume token, and reports delivery latency. Exits non-zero on any failure.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from pymongo.errors import OperationFailure
+
+from common import get_bench_db, reset_db, summarize
+
+from models import gen_id, now_iso
+from services import change_feed
+
+
+async def ensure_replica_set(client):
+    try:
+        await client.admin.command("replSetGetStatus")
+        return
+    except OperationFailure as e:
+        if e.code != 94:  # NotYetInitialized
+            raise
+    await client.admin.command("replSetInitiate")
+    for _ in range(60):
+        hello = await client.admin.command("hello")
+        if hello.get("isWritablePrimary"):
+            return
+        await asyncio.sleep(0.5)
+    sys.exit("replica set never elected a primary")
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append((time.perf_counter(), event))
+
+    async def wait_for(self, collection, operation, doc_id, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for seen_at, event in self.events:
+                if (event.collection, event.operation) == (collection, operation) and (
+                    doc_id is None or event.doc_id == doc_id
+                ):
+                    return seen_at
+            await asyncio.sleep(0.01)
+        return None
+
+
+async def start_consumer(db, recorder):
+    change_feed.set_db(db)
+    for collection in ("users", "products", "orders"):
+        change_feed.subscribe(collection, recorder)
+    await change_feed.start()
+    # Let the stream open before writing, otherwise the first writes predate it
+    await asyncio.sleep(1)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=200, help="orders written for the latency sample")
+    args = parser.parse_args()
+
+    client, db = get_bench_db()
+    await ensure_replica_set(client)
+    await reset_db(client)
+
+    change_feed.CHANGE_FEED_MODE = "auto"
+    change_feed.CHANGE_FEED_CONSUMER = "harness"
+    failures = []
+
+    recorder = Recorder()
+    await start_consumer(db, recorder)
+    if change_feed.mode != "changes":
+        sys.exit(f"expected change stream mode, got {change_feed.mode}")
+
+    # Every operation type on every watched collection reaches the handler
+    for collection in ("users", "products", "orders"):
+        doc_id = gen_id()
+        await db[collection].insert_one({"id": doc_id, "status": "NEW", "updated_at": now_iso()})
+        await db[collection].update_one({"id": doc_id}, {"$set": {"status": "CHANGED"}})
+        await db[collection].delete_one({"id": doc_id})
+        for operation, expect_id in (("insert", doc_id), ("update", doc_id), ("delete", None)):
+            if await recorder.wait_for(collection, operation, expect_id) is None:
+                failures.append(f"no {operation} event for {collection}")
+
+    # Write-to-handler latency for order inserts, one at a time
+    latencies = []
+    for _ in range(args.writes):
+        order_id = gen_id()
+        written_at = time.perf_counter()
+        await db.orders.insert_one({"id": order_id, "status": "CREATED", "updated_at": now_iso()})
+        seen_at = await recorder.wait_for("orders", "insert", order_id)
+        if seen_at is None:
+            failures.append(f"order {order_id} never delivered")
+            break
+        latencies.append((seen_at - written_at) * 1000)
+
+    # Writes made while the consumer is down are replayed from the saved resume token
+    await asyncio.sleep(change_feed.CHANGE_FEED_CHECKPOINT_SECONDS + 1.5)
+    await change_feed.stop()
+    missed_id = gen_id()
+    await db.orders.insert_one({"id": missed_id, "status": "CREATED", "updated_at": now_iso()})
+    recorder = Recorder()
+    await start_consumer(db, recorder)
+    if await recorder.wait_for("orders", "insert", missed_id) is None:
+        failures.append("write made while stopped was not replayed after restart")
+    await change_feed.stop()
+
+    print(json.dumps({
+        "mode": change_feed.mode,
+        "delivery_latency": summarize(latencies),
+        "failures": failures,
+    }, indent=2))
+    await reset_db(client)
+    client.close()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""Checkout seller-matching latency versus seller count and cart size.
+
+Compares the legacy per-seller/per-line ``find_one`` loop with
+``services.matching.find_matching_seller``. Only the last seller carries the
+full cart, which is the worst case for the legacy scan.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/checkout_matching.py
+"""
+import argparse
+import asyncio
+import json
+
+from common import get_bench_db, reset_db, summarize, time_async
+
+from models import gen_id, now_iso
+from services import matching
+
+
+async def legacy_find_matching_seller(db, order_items, today):
+    sellers = await db.users.find({
+        "role": "SELLER",
+        "approval_status": "APPROVED",
+        "status": "ACTIVE",
+        "daily_stock_date": today,
+    }, {"_id": 0}).to_list(1000)
+    for seller in sellers:
+        has_all = True
+        for item in order_items:
+            prod = await db.products.find_one({
+                "seller_id": seller["id"],
+                "name": item["name"],
+                "unit": item["unit"],
+                "status": "APPROVED",
+            }, {"_id": 0})
+            if not prod or prod.get("stock", 0) < item["quantity"]:
+                has_all = False
+                break
+        if has_all:
+            return seller["id"]
+    return None
+
+
+async def seed(db, seller_count, cart_size, today):
+    sellers, products = [], []
+    for i in range(seller_count):
+        seller_id = gen_id()
+        sellers.append({
+            "id": seller_id,
+            "phone": f"8{i:09d}",
+            "role": "SELLER",
+            "status": "ACTIVE",
+            "approval_status": "APPROVED",
+            "daily_stock_date": today,
+            "created_at": now_iso(),
+        })
+        # Every seller but the last is missing the final cart line
+        carried = cart_size if i == seller_count - 1 else cart_size - 1
+        for n in range(carried):
+            products.append({
+                "id": gen_id(),
+                "seller_id": seller_id,
+                "name": f"Item {n}",
+                "unit": "1 kg",
+                "seller_price": 40.0,
+                "status": "APPROVED",
+                "stock": 50,
+                "created_at": now_iso(),
+            })
+    await db.users.insert_many(sellers)
+    if products:
+        await db.products.insert_many(products)
+    await db.products.create_index([("seller_id", 1), ("name", 1), ("unit", 1), ("status", 1)])
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sellers", default="10,100,300")
+    parser.add_argument("--cart-sizes", default="1,5,10")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    client, db = get_bench_db()
+    matching.set_db(db)
+    today = now_iso()[:10]
+    results = []
+
+    for seller_count in [int(x) for x in args.sellers.split(",")]:
+        for cart_size in [int(x) for x in args.cart_sizes.split(",")]:
+            await reset_db(client)
+            await seed(db, seller_count, cart_size, today)
+            order_items = [{"name": f"Item {n}", "unit": "1 kg", "quantity": 2} for n in range(cart_size)]
+
+            legacy = await time_async(lambda: legacy_find_matching_seller(db, order_items, today), args.repeat)
+            current = await time_async(lambda: matching.find_matching_seller(order_items, today), args.repeat)
+
+            row = {
+                "sellers": seller_count,
+                "cart_size": cart_size,
+                "legacy": summarize(legacy),
+                "set_based": summarize(current),
+            }
+            results.append(row)
+            print(f"sellers={seller_count:>4} cart={cart_size:>3}  "
+                  f"legacy p50={row['legacy']['p50_ms']:>9.2f}ms  "
+                  f"set-based p50={row['set_based']['p50_ms']:>8.2f}ms")
+
+    await reset_db(client)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import statistics
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+BENCH_DB_NAME = os.environ.get("BENCH_DB_NAME", "green_basket_bench")
+# "motor" talks to a real mongod; "mongomock" runs in-process for quick dry runs (no network latency)
+BENCH_BACKEND = os.environ.get("BENCH_BACKEND", "motor")
+
+
+def _patch_mongomock():
+    from mongomock import aggregate
+
+    handle = aggregate._Parser._handle_string_operator
+
+    # mongomock has $substr but not $substrCP; they agree on the ASCII timestamps the app slices
+    def handle_string_operator(self, operator, values):
+        return handle(self, "$substr" if operator == "$substrCP" else operator, values)
+
+    aggregate._Parser._handle_string_operator = handle_string_operator
+
+
+def get_bench_db():
+    if BENCH_BACKEND == "mongomock":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("BENCH_BACKEND=mongomock requires `pip install mongomock-motor`")
+        _patch_mongomock()
+        client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(MONGO_URL)
+    return client, client[BENCH_DB_NAME]
+
+
+async def reset_db(client):
+    await client.drop_database(BENCH_DB_NAME)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples_ms):
+    return {
+        "runs": len(samples_ms),
+        "mean_ms": round(statistics.fmean(samples_ms), 3) if samples_ms else 0.0,
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+    }
+
+
+async def time_async(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
@@ -0,0 +1,129 @@
+"""Dispatch simulation with thousands of delivery partners.
+
+Seeds partners scattered around a few city centres, then has many sellers
+mark orders ready at the same time. Compares the legacy "first available
+partner anywhere" find-then-update against ``services.dispatch``: latency,
+pickup distance, and how many partners were double-assigned.
+
+Requires a real mongod (``$near`` needs a 2dsphere index):
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/dispatch_simulation.py
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter
+
+from common import get_bench_db, reset_db, summarize
+
+from models import gen_id, now_iso
+from services import dispatch, user_cache
+
+CITIES = {
+    "Bangalore": (12.9716, 77.5946),
+    "Mumbai": (19.0760, 72.8777),
+    "Delhi": (28.6139, 77.2090),
+}
+
+
+def scatter(center, km, rng):
+    # Uniform-ish point within `km` of the centre; fine at city scale
+    lat, lng = center
+    r = km * math.sqrt(rng.random())
+    theta = rng.random() * 2 * math.pi
+    return lat + (r / 111.0) * math.cos(theta), lng + (r / (111.0 * math.cos(math.radians(lat)))) * math.sin(theta)
+
+
+def distance_km(a, b):
+    lat1, lng1, lat2, lng2 = map(math.radians, [a[0], a[1], b[0], b[1]])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(h))
+
+
+async def seed(db, partners, sellers, rng):
+    users = []
+    for n in range(partners):
+        city = rng.choice(list(CITIES))
+        lat, lng = scatter(CITIES[city], 15, rng)
+        users.append({
+            "id": gen_id(), "phone": f"7{n:09d}", "role": "DELIVERY", "status": "ACTIVE",
+            "approval_status": "APPROVED", "city": city, "latitude": lat, "longitude": lng,
+            "location": dispatch.geo_point(lat, lng), "is_available": True, "created_at": now_iso(),
+        })
+    seller_docs = []
+    for n in range(sellers):
+        city = rng.choice(list(CITIES))
+        lat, lng = scatter(CITIES[city], 15, rng)
+        seller_docs.append({
+            "id": gen_id(), "phone": f"8{n:09d}", "role": "SELLER", "status": "ACTIVE",
+            "approval_status": "APPROVED", "city": city, "latitude": lat, "longitude": lng,
+            "location": dispatch.geo_point(lat, lng), "created_at": now_iso(),
+        })
+    await db.users.insert_many(users + seller_docs)
+    await db.users.create_index("id", unique=True)
+    await db.users.create_index([("location", "2dsphere"), ("role", 1), ("city", 1), ("is_available", 1)])
+    return seller_docs
+
+
+async def legacy_claim(db, order_id, seller):
+    partner = await db.users.find_one({
+        "role": "DELIVERY", "approval_status": "APPROVED", "is_available": True, "status": "ACTIVE",
+    }, {"_id": 0})
+    if partner:
+        await db.users.update_one({"id": partner["id"]}, {"$set": {"is_available": False}})
+    return partner
+
+
+async def run(db, sellers, claim):
+    latencies, claimed, distances = [], [], []
+
+    async def one(n, seller):
+        start = time.perf_counter()
+        partner = await claim(db, f"ORD-SIM-{n}", seller)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if partner:
+            claimed.append(partner["id"])
+            distances.append(distance_km(
+                (seller["latitude"], seller["longitude"]), (partner["latitude"], partner["longitude"])
+            ))
+
+    await asyncio.gather(*(one(n, s) for n, s in enumerate(sellers)))
+    double_assigned = sum(count - 1 for count in Counter(claimed).values() if count > 1)
+    return {
+        "dispatched": len(claimed),
+        "double_assigned": double_assigned,
+        "mean_pickup_km": round(sum(distances) / len(distances), 2) if distances else None,
+        "latency": summarize(latencies),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--partners", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    client, db = get_bench_db()
+    dispatch.set_db(db)
+    user_cache.set_db(db)
+    report = {}
+
+    for name, claim in [
+        ("legacy", legacy_claim),
+        ("geo_dispatch", lambda db, order_id, seller: dispatch.claim_partner(order_id, seller)),
+    ]:
+        await reset_db(client)
+        sellers = await seed(db, args.partners, args.orders, random.Random(args.seed))
+        report[name] = await run(db, sellers, claim)
+        print(f"{name:>13}: {json.dumps(report[name])}")
+
+    await reset_db(client)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,531 @@
+"""Synthetic data generator for scale testing.
+
+Writes coherent ``users``, ``products``, ``stock_logs``, ``orders``, ``earnings``,
+``balances``, ``audit_logs`` and ``counters`` documents shaped exactly like the ones
+``auth.verify_otp``, ``seller.add_products_bulk``, ``customer.checkout`` and the
+order transitions produce. Orders are split into fixed-size shards generated by a
+pool of processes, each streaming its documents to Mongo with chunked
+``insert_many``. Every shard has its own seeded RNG, so the same ``--seed`` gives
+the same documents whatever ``--workers`` is. Indexes are built once the data is in,
+which is much faster than maintaining them during the load.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/generate_data.py --orders 10000000 --workers 8
+
+Order ids follow ``services.order_ids`` (``ORD-YYYYMMDD-NNNNNN``, sequential per
+day) and the per-day counters are written too, so live checkouts against the
+generated database continue the sequence. Sellers have confirmed stock on
+``--end-date`` (default today), so checkout matching finds them.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone, timedelta
+
+from common import BENCH_BACKEND, BENCH_DB_NAME, MONGO_URL
+
+from services import dispatch, indexes, order_ids
+from routes.delivery import SELLER_SHARE, DELIVERY_SHARE
+
+CITY = "Bangalore"
+CENTER = (12.9716, 77.5946)
+ADMIN_PHONE = "9999999999"
+PRODUCE = [
+    "Tomato", "Onion", "Potato", "Carrot", "Cabbage", "Cauliflower", "Spinach", "Coriander", "Ginger",
+    "Garlic", "Green Chilli", "Capsicum", "Brinjal", "Okra", "Beetroot", "Radish", "Cucumber", "Pumpkin",
+    "Bottle Gourd", "Bitter Gourd", "Beans", "Peas", "Sweet Corn", "Mushroom", "Banana", "Apple", "Mango",
+    "Orange", "Papaya", "Grapes", "Pomegranate", "Watermelon", "Lemon", "Mint", "Curry Leaves", "Drumstick",
+]
+UNITS = ["250 g", "500 g", "1 kg"]
+CATEGORIES = ["Vegetables", "Fruits", "Leafy Greens", "Herbs"]
+# Share of historical orders left in each status
+ORDER_STATUSES = [
+    ("DELIVERED", 85), ("OUT_FOR_DELIVERY", 2), ("READY_FOR_PICKUP", 2), ("ACCEPTED", 4), ("ASSIGNED", 6), ("CREATED", 1),
+]
+LIFECYCLE = ["CREATED", "ASSIGNED", "ACCEPTED", "READY_FOR_PICKUP", "OUT_FOR_DELIVERY", "DELIVERED"]
+SHARD_SIZE = 50_000
+
+
+def make_id(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def iso(dt):
+    return dt.isoformat()
+
+
+class Dataset:
+    """Deterministic description of one generated database.
+
+    Users and products are small enough to rebuild in every worker process from the
+    seed; orders are produced shard by shard so no process holds more than a chunk.
+    """
+
+    def __init__(self, seed=42, sellers=2000, customers=20000, partners=1000, products=100000, orders=1000000,
+                 days=90, end_date=None, audit_fraction=0.2, stock_logs_per_product=2, stock=1_000_000):
+        self.seed = seed
+        self.sellers = sellers
+        self.customers = customers
+        self.partners = partners
+        self.products = products
+        self.orders = orders
+        self.days = max(1, days)
+        self.end_date = end_date or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        self.audit_fraction = audit_fraction
+        self.stock_logs_per_product = stock_logs_per_product
+        self.stock = stock
+        self.end = datetime.strptime(self.end_date, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+        self.start = self.end - timedelta(days=self.days)
+        self._users = None
+        self._products = None
+        if sellers < 1 or customers < 1:
+            raise ValueError("at least one seller and one customer are needed to generate orders")
+
+    def config(self):
+        return {key: value for key, value in vars(self).items() if not key.startswith("_") and key not in ("start", "end")}
+
+    def _created_before_start(self, rng):
+        # Accounts and listings predate the order history
+        return self.start - timedelta(seconds=rng.randint(1, 365 * 86400))
+
+    def _user(self, rng, role, phone, **fields):
+        latitude = CENTER[0] + rng.uniform(-0.15, 0.15)
+        longitude = CENTER[1] + rng.uniform(-0.15, 0.15)
+        # auth.verify_otp's document with what registration and approval fill in
+        user = {
+            "id": make_id(rng),
+            "phone": phone,
+            "role": role,
+            "status": "ACTIVE",
+            "approval_status": "APPROVED",
+            "city": CITY,
+            "latitude": latitude,
+            "longitude": longitude,
+            "address": f"{rng.randint(1, 999)} {rng.choice(['Main Road', 'Cross Street', 'Layout', 'Nagar'])}",
+            "house": "",
+            "area": "",
+            "pincode": f"5600{rng.randint(1, 99):02d}",
+            "shop_name": "",
+            "bank_info": "",
+            "categories": [],
+            "daily_stock_confirmed": False,
+            "daily_stock_date": "",
+            "is_available": False,
+            "location_set": False,
+            "created_at": iso(self._created_before_start(rng)),
+            "location": dispatch.geo_point(latitude, longitude),
+        }
+        user.update(fields)
+        return user
+
+    def users(self):
+        """``{role: [user, ...]}``"""
+        if self._users is None:
+            rng = random.Random(f"{self.seed}:users")
+            self._users = {
+                "ADMIN": [self._user(rng, "ADMIN", ADMIN_PHONE, address="Admin Office", location_set=True)],
+                "SELLER": [
+                    self._user(
+                        rng, "SELLER", f"8{i:09d}",
+                        shop_name=f"Fresh Mart {i}",
+                        bank_info=f"Bank {i % 20} | {rng.randint(10 ** 9, 10 ** 10 - 1)} | BANK000{i % 1000:04d}",
+                        categories=rng.sample(CATEGORIES, rng.randint(1, len(CATEGORIES))),
+                        daily_stock_confirmed=True,
+                        daily_stock_date=self.end_date,
+                    )
+                    for i in range(self.sellers)
+                ],
+                "CUSTOMER": [
+                    self._user(rng, "CUSTOMER", f"6{i:09d}", house=str(rng.randint(1, 300)), location_set=True)
+                    for i in range(self.customers)
+                ],
+                "DELIVERY": [
+                    self._user(rng, "DELIVERY", f"7{i:09d}", is_available=True, vehicle_type="bike",
+                               vehicle_number=f"KA01AB{i % 10000:04d}")
+                    for i in range(self.partners)
+                ],
+            }
+        return self._users
+
+    def products_by_seller(self):
+        """``{seller_id: [product, ...]}``; each seller lists a random slice of the catalog."""
+        if self._products is None:
+            rng = random.Random(f"{self.seed}:products")
+            keys = [(name, unit) for name in PRODUCE for unit in UNITS]
+            sellers = self.users()["SELLER"]
+            per_seller = max(1, min(len(keys), self.products // max(1, len(sellers))))
+            self._products = {}
+            for seller in sellers:
+                # seller.add_products_bulk's document after admin approval and a stock confirmation
+                self._products[seller["id"]] = [
+                    {
+                        "id": make_id(rng),
+                        "seller_id": seller["id"],
+                        "name": name,
+                        "unit": unit,
+                        "seller_price": float(rng.randint(10, 200)),
+                        "status": "APPROVED",
+                        "stock": self.stock,
+                        "created_at": iso(self._created_before_start(rng)),
+                    }
+                    for name, unit in rng.sample(keys, per_seller)
+                ]
+        return self._products
+
+    def catalog_docs(self):
+        """Yields ``(collection, document)`` for users, products, stock logs and their audit entries."""
+        rng = random.Random(f"{self.seed}:catalog")
+        for role, users in self.users().items():
+            for user in users:
+                yield "users", user
+                if role != "ADMIN":
+                    yield "audit_logs", self._audit(rng, user["id"], role, "USER_REGISTERED", "user", user["id"],
+                                                    f"New {role} registered with phone {user['phone']}",
+                                                    datetime.fromisoformat(user["created_at"]))
+        for seller_id, products in self.products_by_seller().items():
+            for product in products:
+                yield "products", product
+                level = self.stock
+                for _ in range(rng.randint(0, 2 * self.stock_logs_per_product)):
+                    adjustment = rng.choice([-1, 1])
+                    level += adjustment
+                    yield "stock_logs", {
+                        "id": make_id(rng),
+                        "seller_id": seller_id,
+                        "product_id": product["id"],
+                        "adjustment": adjustment,
+                        "new_stock": level,
+                        "created_at": iso(self.start + timedelta(seconds=rng.randint(0, self.days * 86400 - 1))),
+                    }
+            if products:
+                yield "audit_logs", self._audit(rng, seller_id, "SELLER", "PRODUCTS_ADDED", "product", "",
+                                                f"Added {len(products)} products for approval",
+                                                datetime.fromisoformat(products[0]["created_at"]))
+
+    def _audit(self, rng, actor_id, actor_role, action, entity, entity_id, details, at):
+        # audit.build_entry
+        return {
+            "id": make_id(rng),
+            "actor_id": actor_id,
+            "actor_role": actor_role,
+            "action": action,
+            "entity": entity,
+            "entity_id": entity_id,
+            "details": details,
+            "created_at": iso(at),
+        }
+
+    def _first_of_day(self, day):
+        # Orders are spread evenly over the days, in id order
+        return (day * self.orders + self.days - 1) // self.days
+
+    def shard_count(self):
+        return (self.orders + SHARD_SIZE - 1) // SHARD_SIZE
+
+    def counters(self):
+        """Per-day order sequences as ``services.order_ids`` keeps them."""
+        for day in range(self.days):
+            count = self._first_of_day(day + 1) - self._first_of_day(day)
+            if count:
+                yield {"id": f"orders:{(self.start + timedelta(days=day)):%Y%m%d}", "seq": count}
+
+    def shard_docs(self, shard):
+        """Yields ``(collection, document)`` for the orders of one shard and what they caused."""
+        rng = random.Random(f"{self.seed}:orders:{shard}")
+        users = self.users()
+        customers, sellers, partners = users["CUSTOMER"], users["SELLER"], users["DELIVERY"]
+        products = self.products_by_seller()
+        statuses = [status for status, weight in ORDER_STATUSES for _ in range(weight)]
+        day = None
+
+        for n in range(shard * SHARD_SIZE, min(self.orders, (shard + 1) * SHARD_SIZE)):
+            if day is None or n >= self._first_of_day(day + 1):
+                day = n * self.days // self.orders
+                first, per_day = self._first_of_day(day), self._first_of_day(day + 1) - self._first_of_day(day)
+                day_start = self.start + timedelta(days=day)
+                day_key = f"{day_start:%Y%m%d}"
+            seq = n - first + 1
+            created_at = day_start + timedelta(seconds=(seq - 0.5) * 86400 / per_day)
+
+            customer = rng.choice(customers)
+            status = rng.choice(statuses)
+            if not partners and LIFECYCLE.index(status) >= LIFECYCLE.index("READY_FOR_PICKUP"):
+                status = "ACCEPTED"
+            # Unmatched orders keep the listings the customer picked, from whichever seller
+            listed_by = rng.choice(sellers)
+            seller = listed_by if status != "CREATED" else None
+            listings = products[listed_by["id"]]
+            items = []
+            for product in rng.sample(listings, min(len(listings), rng.randint(1, 4))):
+                quantity = rng.randint(1, 3)
+                items.append({
+                    "product_id": product["id"],
+                    "name": product["name"],
+                    "unit": product["unit"],
+                    "quantity": quantity,
+                    "price": product["seller_price"],
+                    "total": product["seller_price"] * quantity,
+                })
+            total_amount = sum(item["total"] for item in items)
+            delivery_fee = 0 if total_amount >= 500 else 40
+            order_id = order_ids.format_order_id(day_key, seq)
+
+            # One timestamp per step the order went through, a few minutes apart
+            reached = LIFECYCLE.index(status)
+            step_at = [created_at]
+            for _ in range(reached):
+                step_at.append(step_at[-1] + timedelta(seconds=rng.randint(60, 1800)))
+            partner = rng.choice(partners) if reached >= LIFECYCLE.index("READY_FOR_PICKUP") else None
+
+            # customer.checkout's document plus the fields the transitions set
+            order = {
+                "id": order_id,
+                "customer_id": customer["id"],
+                "seller_id": seller["id"] if seller else "",
+                "delivery_partner_id": partner["id"] if partner else "",
+                "items": items,
+                "status": status,
+                "delivery_address": {
+                    "address": customer["address"], "house": customer["house"], "area": customer["area"],
+                    "city": customer["city"], "pincode": customer["pincode"],
+                    "latitude": customer["latitude"], "longitude": customer["longitude"],
+                },
+                "delivery_otp": f"{rng.randint(100000, 999999)}" if partner else "",
+                "total_amount": total_amount + delivery_fee,
+                "delivery_fee": delivery_fee,
+                "payment_method": "COD",
+                "stock_reserved": seller is not None,
+                "created_at": iso(created_at),
+                "updated_at": iso(step_at[-1]),
+                # services.assignment's queue fields
+                "assign_after": iso(created_at),
+                "assign_attempts": 0,
+                "excluded_seller_ids": [],
+                "assigned_at": iso(step_at[1]) if seller else None,
+            }
+            yield "orders", order
+
+            if status == "DELIVERED":
+                # delivery._earning for both payees
+                for user_id, role, share in ((seller["id"], "SELLER", SELLER_SHARE), (partner["id"], "DELIVERY", DELIVERY_SHARE)):
+                    yield "earnings", {
+                        "id": f"{order_id}:{role}",
+                        "user_id": user_id,
+                        "user_name": "",
+                        "role": role,
+                        "order_id": order_id,
+                        "amount": round(order["total_amount"] * share, 2),
+                        "status": "PENDING",
+                        "created_at": iso(step_at[-1]),
+                    }
+
+            if rng.random() < self.audit_fraction:
+                entries = [
+                    (customer["id"], "CUSTOMER", "ORDER_CREATED",
+                     f"Order {order_id} created with {len(items)} items, total ₹{total_amount + delivery_fee}"),
+                    None,
+                    (seller and seller["id"], "SELLER", "ORDER_ACCEPTED", f"Seller accepted order {order_id}, stock deducted"),
+                    (seller and seller["id"], "SELLER", "ORDER_READY", f"Order {order_id} marked ready for pickup"),
+                    (partner and partner["id"], "DELIVERY", "PICKUP_STARTED", f"Delivery partner picked up order {order_id}"),
+                    (partner and partner["id"], "DELIVERY", "ORDER_DELIVERED", f"Order {order_id} delivered via OTP verification"),
+                ]
+                for step in range(reached + 1):
+                    if entries[step] and entries[step][0]:
+                        actor_id, actor_role, action, details = entries[step]
+                        yield "audit_logs", self._audit(rng, actor_id, actor_role, action, "order", order_id, details, step_at[step])
+
+
+BALANCES_PIPELINE = [
+    {"$group": {
+        "_id": "$user_id",
+        "role": {"$first": "$role"},
+        "total": {"$sum": "$amount"},
+        "pending": {"$sum": {"$cond": [{"$eq": ["$status", "PENDING"]}, "$amount", 0]}},
+        "paid": {"$sum": {"$cond": [{"$eq": ["$status", "PAID"]}, "$amount", 0]}},
+    }},
+    {"$project": {"_id": 0, "user_id": "$_id", "role": 1, "total": 1, "pending": 1, "paid": 1}},
+]
+
+
+def _balance_docs(rows, updated_at):
+    return [{**row, "updated_at": updated_at} for row in rows]
+
+
+async def seed_async(db, dataset, chunk_size=5000, parallel=4):
+    """Write ``dataset`` through an async (Motor or mongomock-motor) database, in this process."""
+    buffers = {}
+    pending = set()
+    counts = {}
+
+    async def flush(collection, docs):
+        nonlocal pending
+        if len(pending) >= parallel:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        pending.add(asyncio.ensure_future(db[collection].insert_many(docs, ordered=False)))
+        counts[collection] = counts.get(collection, 0) + len(docs)
+
+    async def write(stream):
+        for collection, doc in stream:
+            buffer = buffers.setdefault(collection, [])
+            buffer.append(doc)
+            if len(buffer) >= chunk_size:
+                buffers[collection] = []
+                await flush(collection, buffer)
+
+    await write(dataset.catalog_docs())
+    for shard in range(dataset.shard_count()):
+        await write(dataset.shard_docs(shard))
+    for collection, buffer in buffers.items():
+        if buffer:
+            await flush(collection, buffer)
+    for task in pending:
+        await task
+
+    counters = list(dataset.counters())
+    if counters:
+        await db.counters.insert_many(counters)
+    balances = await db.earnings.aggregate(BALANCES_PIPELINE).to_list(None)
+    if balances:
+        await db.balances.insert_many(_balance_docs(balances, iso(datetime.now(timezone.utc))))
+    counts["counters"] = len(counters)
+    counts["balances"] = len(balances)
+    return counts
+
+
+# Worker processes: one dataset and one client each, set up once by the pool initializer
+_dataset = None
+_db = None
+_chunk_size = None
+
+
+def _init_worker(config, mongo_url, db_name, chunk_size):
+    global _dataset, _db, _chunk_size
+    from pymongo import MongoClient
+
+    _dataset = Dataset(**config)
+    _dataset.products_by_seller()
+    _db = MongoClient(mongo_url)[db_name]
+    _chunk_size = chunk_size
+
+
+def _write(db, stream, chunk_size):
+    buffers = {}
+    counts = {}
+    for collection, doc in stream:
+        buffer = buffers.setdefault(collection, [])
+        buffer.append(doc)
+        if len(buffer) >= chunk_size:
+            db[collection].insert_many(buffer, ordered=False)
+            counts[collection] = counts.get(collection, 0) + len(buffer)
+            buffers[collection] = []
+    for collection, buffer in buffers.items():
+        if buffer:
+            db[collection].insert_many(buffer, ordered=False)
+            counts[collection] = counts.get(collection, 0) + len(buffer)
+    return counts
+
+
+def _run_shard(shard):
+    return _write(_db, _dataset.shard_docs(shard), _chunk_size)
+
+
+def _merge_counts(total, counts):
+    for collection, n in counts.items():
+        total[collection] = total.get(collection, 0) + n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sellers", type=int, default=2000)
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--partners", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=90, help="days of order history")
+    parser.add_argument("--end-date", help="last day of history, YYYY-MM-DD (default today)")
+    parser.add_argument("--audit-fraction", type=float, default=0.2, help="share of orders with audit entries")
+    parser.add_argument("--stock-logs", type=int, default=2, help="mean stock adjustments per product")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--keep-existing", action="store_true", help="add to the database instead of dropping it first")
+    parser.add_argument("--no-indexes", action="store_true", help="skip building indexes afterwards")
+    args = parser.parse_args()
+
+    if BENCH_BACKEND == "mongomock":
+        sys.exit("generate_data.py writes from several processes and needs a real mongod; "
+                 "in-process runs use seed_async() (see load_test.py)")
+
+    from pymongo import MongoClient
+
+    dataset = Dataset(
+        seed=args.seed, sellers=args.sellers, customers=args.customers, partners=args.partners,
+        products=args.products, orders=args.orders, days=args.days, end_date=args.end_date,
+        audit_fraction=args.audit_fraction, stock_logs_per_product=args.stock_logs,
+    )
+    client = MongoClient(MONGO_URL)
+    db = client[BENCH_DB_NAME]
+    if not args.keep_existing:
+        client.drop_database(BENCH_DB_NAME)
+
+    started = time.perf_counter()
+    counts = _write(db, dataset.catalog_docs(), args.chunk_size)
+    print(f"users and products written in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    shards = dataset.shard_count()
+    with ProcessPoolExecutor(
+        max_workers=max(1, args.workers),
+        initializer=_init_worker,
+        initargs=(dataset.config(), MONGO_URL, BENCH_DB_NAME, args.chunk_size),
+    ) as pool:
+        futures = [pool.submit(_run_shard, shard) for shard in range(shards)]
+        for done, future in enumerate(as_completed(futures), 1):
+            _merge_counts(counts, future.result())
+            elapsed = time.perf_counter() - started
+            print(f"shard {done}/{shards}  {counts.get('orders', 0)} orders  {elapsed:.1f}s", file=sys.stderr)
+
+    counters = list(dataset.counters())
+    if counters:
+        db.counters.insert_many(counters)
+    balances = list(db.earnings.aggregate(BALANCES_PIPELINE, allowDiskUse=True))
+    for start in range(0, len(balances), args.chunk_size):
+        db.balances.insert_many(_balance_docs(balances[start:start + args.chunk_size], iso(datetime.now(timezone.utc))))
+    counts["counters"] = len(counters)
+    counts["balances"] = len(balances)
+    generated = time.perf_counter() - started
+
+    index_seconds = None
+    if not args.no_indexes:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        async def build():
+            motor_client = AsyncIOMotorClient(MONGO_URL)
+            await indexes.ensure_indexes(motor_client[BENCH_DB_NAME])
+            motor_client.close()
+
+        index_started = time.perf_counter()
+        asyncio.run(build())
+        index_seconds = round(time.perf_counter() - index_started, 2)
+    client.close()
+
+    documents = sum(counts.values())
+    print(json.dumps({
+        "database": BENCH_DB_NAME,
+        "config": dataset.config(),
+        "workers": args.workers,
+        "documents": counts,
+        "generate_seconds": round(generated, 2),
+        "documents_per_second": round(documents / generated, 1) if generated else None,
+        "index_seconds": index_seconds,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Mixed-workload load test of the whole API, in process.
+
+Seeds ``BENCH_DB_NAME`` from ``generate_data.Dataset`` (sellers, customers,
+delivery partners, products and order history), boots ``server.app`` through its
+own lifespan against that database and drives it with ``--concurrency`` async
+clients for ``--duration`` seconds. Requests go through ``httpx.ASGITransport``,
+so no socket or ASGI server is involved: the numbers cover the app and Mongo
+only. Prints one JSON document with p50/p95/p99 latency and requests per second
+per endpoint; ``--output`` also writes it to a file so runs can be compared
+across commits.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/load_test.py
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/load_test.py --skip-seed --keep
+    BENCH_BACKEND=mongomock python benchmarks/load_test.py --sellers 50 --products 2000 --orders 5000 --duration 10
+
+Seeding here runs in one process; for big volumes fill the database with
+``generate_data.py`` and pass ``--skip-seed``, or seed once with ``--keep``.
+With mongomock every query is a Python scan, so keep the volumes small there and
+treat the results as relative only.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+
+from common import BENCH_BACKEND, BENCH_DB_NAME, MONGO_URL, get_bench_db, reset_db, summarize
+
+# server reads these at import time
+os.environ["MONGO_URL"] = MONGO_URL
+os.environ["DB_NAME"] = BENCH_DB_NAME
+
+import httpx  # noqa: E402
+
+from generate_data import CITY, Dataset, seed_async  # noqa: E402
+
+
+async def load_context(db, sample):
+    """Ids the workload draws from, read back so ``--skip-seed`` runs work the same way."""
+    from middleware import create_token
+
+    async def users(role):
+        docs = await db.users.find(
+            {"role": role, "status": "ACTIVE"}, {"_id": 0, "id": 1, "role": 1, "city": 1, "status": 1, "phone": 1}
+        ).to_list(sample)
+        return [
+            {"id": u["id"], "headers": {
+                "Authorization": f"Bearer {create_token(u['id'], u['role'], u.get('city', ''), u['status'], u['phone'])}"
+            }}
+            for u in docs
+        ]
+
+    context = {role: await users(role) for role in ("CUSTOMER", "SELLER", "DELIVERY", "ADMIN")}
+    orders = await db.orders.find(
+        {"customer_id": {"$in": [c["id"] for c in context["CUSTOMER"]]}}, {"_id": 0, "id": 1, "customer_id": 1}
+    ).to_list(sample * 5)
+    context["orders"] = {}
+    for order in orders:
+        context["orders"].setdefault(order["customer_id"], []).append(order["id"])
+    context["products"] = await db.products.find({"status": "APPROVED"}, {"_id": 0, "id": 1}).to_list(sample)
+    missing = [key for key, values in context.items() if not values]
+    if missing:
+        sys.exit(f"nothing to load test with, no {', '.join(missing)} in {BENCH_DB_NAME}; run without --skip-seed")
+    return context
+
+
+def own_order(rng, context, user):
+    orders = context["orders"].get(user["id"]) or rng.choice(list(context["orders"].values()))
+    return rng.choice(orders)
+
+
+# (weight, endpoint label, method, path or path(rng, context, user), body(rng, context) or None)
+WORKLOADS = {
+    "customer": [
+        (5, "GET /api/customer/products", "GET", "/api/customer/products", None),
+        (3, "GET /api/customer/orders", "GET", "/api/customer/orders", None),
+        (2, "GET /api/customer/orders/{order_id}", "GET",
+         lambda rng, ctx, user: f"/api/customer/orders/{own_order(rng, ctx, user)}", None),
+        (2, "GET /api/customer/profile", "GET", "/api/customer/profile", None),
+        (1, "POST /api/customer/cart/checkout", "POST", "/api/customer/cart/checkout",
+         lambda rng, ctx: {
+             "items": [{"product_id": p["id"], "quantity": 1} for p in rng.sample(ctx["products"], min(2, len(ctx["products"])))],
+             "delivery_address": {"address": "Load test", "city": CITY},
+         }),
+    ],
+    "seller": [
+        (3, "GET /api/seller/dashboard", "GET", "/api/seller/dashboard", None),
+        (3, "GET /api/seller/orders", "GET", "/api/seller/orders", None),
+        (2, "GET /api/seller/stock", "GET", "/api/seller/stock", None),
+        (2, "GET /api/seller/products", "GET", "/api/seller/products", None),
+        (1, "GET /api/seller/earnings", "GET", "/api/seller/earnings", None),
+    ],
+    "delivery": [
+        (3, "GET /api/delivery/active-order", "GET", "/api/delivery/active-order", None),
+        (2, "GET /api/delivery/history", "GET", "/api/delivery/history", None),
+        (2, "GET /api/delivery/earnings", "GET", "/api/delivery/earnings", None),
+        (1, "GET /api/delivery/profile", "GET", "/api/delivery/profile", None),
+    ],
+    "admin": [
+        (3, "GET /api/admin/dashboard", "GET", "/api/admin/dashboard", None),
+        (3, "GET /api/admin/orders", "GET", "/api/admin/orders", None),
+        (2, "GET /api/admin/users", "GET", "/api/admin/users", None),
+        (1, "GET /api/admin/earnings/summary", "GET", "/api/admin/earnings/summary", None),
+        (1, "GET /api/admin/audit-logs", "GET", "/api/admin/audit-logs", None),
+    ],
+}
+ROLE_OF = {"customer": "CUSTOMER", "seller": "SELLER", "delivery": "DELIVERY", "admin": "ADMIN"}
+
+
+def parse_mix(value):
+    mix = {}
+    for entry in value.split(","):
+        name, _, weight = entry.partition("=")
+        if name.strip() not in WORKLOADS:
+            raise argparse.ArgumentTypeError(f"unknown workload {name!r}, expected one of {', '.join(WORKLOADS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def record(self, label, elapsed_ms, status):
+        self.latencies.setdefault(label, []).append(elapsed_ms)
+        codes = self.statuses.setdefault(label, {})
+        codes[status] = codes.get(status, 0) + 1
+        if status == "error" or status >= 500:
+            self.errors[label] = self.errors.get(label, 0) + 1
+
+    def report(self, seconds):
+        endpoints = {}
+        for label in sorted(self.latencies):
+            samples = self.latencies[label]
+            endpoints[label] = {
+                **summarize(samples),
+                "rps": round(len(samples) / seconds, 2),
+                "errors": self.errors.get(label, 0),
+                "status": {str(code): n for code, n in sorted(self.statuses[label].items(), key=str)},
+            }
+        everything = [ms for samples in self.latencies.values() for ms in samples]
+        return {
+            "total": {
+                **summarize(everything),
+                "rps": round(len(everything) / seconds, 2),
+                "errors": sum(self.errors.values()),
+            },
+            "endpoints": endpoints,
+        }
+
+
+async def worker(client, context, mix, rng, results, measure_from, deadline):
+    workloads = list(mix)
+    weights = [mix[name] for name in workloads]
+    while time.perf_counter() < deadline:
+        name = rng.choices(workloads, weights)[0]
+        actions = WORKLOADS[name]
+        _, label, method, path, body = rng.choices(actions, [a[0] for a in actions])[0]
+        user = rng.choice(context[ROLE_OF[name]])
+        url = path(rng, context, user) if callable(path) else path
+        payload = body(rng, context) if body else None
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, headers=user["headers"], json=payload)
+            status = response.status_code
+        except Exception:
+            status = "error"
+        if start >= measure_from:
+            results.record(label, (time.perf_counter() - start) * 1000, status)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sellers", type=int, default=2000)
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--partners", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50, help="simultaneous clients")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds run before measuring")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("customer=60,seller=20,delivery=10,admin=10"),
+                        help="workload weights, e.g. customer=60,seller=20,delivery=10,admin=10")
+    parser.add_argument("--sample", type=int, default=2000, help="users/orders/products per role to draw from")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse data left by an earlier --keep run")
+    parser.add_argument("--keep", action="store_true", help="leave the seeded database in place")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    client, db = get_bench_db()
+    seed_seconds = None
+    if not args.skip_seed:
+        await reset_db(client)
+        started = time.perf_counter()
+        dataset = Dataset(
+            seed=args.seed, sellers=args.sellers, customers=args.customers, partners=args.partners,
+            products=args.products, orders=args.orders,
+        )
+        await seed_async(db, dataset, args.chunk_size)
+        seed_seconds = round(time.perf_counter() - started, 2)
+        print(f"seeded in {seed_seconds}s", file=sys.stderr)
+
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+    if BENCH_BACKEND == "mongomock":
+        # The app has to see the same in-memory database the seed went into
+        server.AsyncIOMotorClient = lambda *a, **k: client
+
+    async with server.app.router.lifespan_context(server.app):
+        context = await load_context(db, args.sample)
+        results = Results()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as http:
+            measure_from = time.perf_counter() + args.warmup
+            deadline = measure_from + args.duration
+            await asyncio.gather(*(
+                worker(http, context, args.mix, random.Random(args.seed + i), results, measure_from, deadline)
+                for i in range(args.concurrency)
+            ))
+            measured = max(1e-9, time.perf_counter() - measure_from)
+
+    report = {
+        "commit": git_revision(),
+        "backend": BENCH_BACKEND,
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "seed_seconds": seed_seconds,
+        "measured_seconds": round(measured, 2),
+        **results.report(measured),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+    if not args.keep:
+        await reset_db(client)
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
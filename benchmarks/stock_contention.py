@@ -0,0 +1,108 @@
+"""Concurrent checkouts against one hot product.
+
+Fires ``--checkouts`` simultaneous reservations at a single product holding
+``--stock`` units and checks that exactly ``stock // quantity`` succeed and
+stock never goes negative. The legacy read-modify-write path is run the same
+way for comparison; against a real mongod it oversells.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/stock_contention.py
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from common import get_bench_db, reset_db, summarize
+
+from models import gen_id, now_iso
+from services import stock
+
+
+async def legacy_reserve(db, product_id, quantity):
+    product = await db.products.find_one({"id": product_id}, {"_id": 0})
+    if product.get("stock", 0) < quantity:
+        return False
+    await db.products.update_one(
+        {"id": product_id},
+        {"$set": {"stock": max(0, product.get("stock", 0) - quantity)}}
+    )
+    return True
+
+
+async def seed(db, product_id, initial_stock):
+    await db.products.insert_one({
+        "id": product_id,
+        "seller_id": gen_id(),
+        "name": "Tomato",
+        "unit": "1 kg",
+        "seller_price": 40.0,
+        "status": "APPROVED",
+        "stock": initial_stock,
+        "created_at": now_iso(),
+    })
+
+
+async def run(db, checkouts, reserve):
+    latencies = []
+
+    async def one(n):
+        start = time.perf_counter()
+        ok = await reserve(n)
+        latencies.append((time.perf_counter() - start) * 1000)
+        return ok
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(one(n) for n in range(checkouts)))
+    elapsed = time.perf_counter() - start
+    return sum(outcomes), elapsed, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkouts", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=200)
+    parser.add_argument("--quantity", type=int, default=2)
+    args = parser.parse_args()
+
+    client, db = get_bench_db()
+    stock.set_db(db)
+    expected = min(args.checkouts, args.stock // args.quantity)
+    report = {}
+
+    for name in ["legacy", "reservation"]:
+        await reset_db(client)
+        product_id = gen_id()
+        await seed(db, product_id, args.stock)
+
+        if name == "legacy":
+            reserve = lambda n: legacy_reserve(db, product_id, args.quantity)
+        else:
+            reserve = lambda n: stock.reserve_stock(
+                f"ORD-BENCH-{n}", [{"product_id": product_id, "quantity": args.quantity}]
+            )
+
+        succeeded, elapsed, latencies = await run(db, args.checkouts, reserve)
+        final = await db.products.find_one({"id": product_id}, {"_id": 0, "stock": 1})
+        units_sold = succeeded * args.quantity
+        report[name] = {
+            "succeeded": succeeded,
+            "expected": expected,
+            "final_stock": final["stock"],
+            # Units promised to customers beyond what was actually taken off the shelf
+            "oversold_units": units_sold - (args.stock - final["stock"]),
+            "throughput_rps": round(args.checkouts / elapsed, 1),
+            "latency": summarize(latencies),
+        }
+        print(f"{name:>12}: {succeeded}/{args.checkouts} succeeded (expected {expected}), "
+              f"final stock {final['stock']}, oversold {report[name]['oversold_units']} units")
+
+    await reset_db(client)
+    print(json.dumps(report, indent=2))
+
+    correct = report["reservation"]
+    if correct["succeeded"] != expected or correct["final_stock"] != args.stock - expected * args.quantity:
+        raise SystemExit("reservation path oversold or undersold")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
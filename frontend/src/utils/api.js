@@ -4,9 +4,54 @@ const api = axios.create({
   baseURL: process.env.REACT_APP_BACKEND_URL,
 });
 
-api.interceptors.request.use((config) => {
-  const token = localStorage.getItem('gb_token');
+// Refresh this long before the token's exp, so active sessions never see a 401
+const REFRESH_MARGIN_SECONDS = 5 * 60;
+
+let refreshing = null;
+
+function tokenExpiry(token) {
+  try {
+    return JSON.parse(atob(token.split('.')[1])).exp || null;
+  } catch {
+    return null;
+  }
+}
+
+function clearSession() {
+  localStorage.removeItem('gb_token');
+  localStorage.removeItem('gb_user');
+  window.location.href = '/';
+}
+
+// One refresh at a time; concurrent requests wait for the same new token
+function refreshToken(token) {
+  if (!refreshing) {
+    refreshing = axios
+      .post(`${process.env.REACT_APP_BACKEND_URL}/api/auth/refresh`, null, {
+        headers: { Authorization: `Bearer ${token}` },
+      })
+      .then((res) => {
+        localStorage.setItem('gb_token', res.data.token);
+        return res.data.token;
+      })
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+}
+
+api.interceptors.request.use(async (config) => {
+  let token = localStorage.getItem('gb_token');
   if (token) {
+    const exp = tokenExpiry(token);
+    if (exp && exp - Date.now() / 1000 < REFRESH_MARGIN_SECONDS) {
+      try {
+        token = await refreshToken(token);
+      } catch {
+        // Let the request go out; the response handler decides whether to log out
+      }
+    }
     config.headers.Authorization = `Bearer ${token}`;
   }
   return config;
@@ -14,13 +59,24 @@ api.interceptors.request.use((config) => {
 
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
+    const detail = error.response?.data?.detail;
+    const original = error.config;
+    const token = localStorage.getItem('gb_token');
+    if (error.response?.status === 401 && detail === 'Token expired' && token && original && !original._retried) {
+      original._retried = true;
+      try {
+        const newToken = await refreshToken(token);
+        original.headers.Authorization = `Bearer ${newToken}`;
+        return api(original);
+      } catch {
+        clearSession();
+        return Promise.reject(error);
+      }
+    }
     if (error.response?.status === 401 || error.response?.status === 403) {
-      if (error.response?.data?.detail?.includes('suspended') ||
-          error.response?.data?.detail?.includes('Invalid token')) {
-        localStorage.removeItem('gb_token');
-        localStorage.removeItem('gb_user');
-        window.location.href = '/';
+      if (detail?.includes('suspended') || detail?.includes('Invalid token')) {
+        clearSession();
       }
     }
     return Promise.reject(error);
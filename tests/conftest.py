@@ -0,0 +1,103 @@
+"""Shared fixtures: every service module wired to a fresh in-process mongomock database.
+
+Tests are async and run on anyio's pytest plugin (``@pytest.mark.anyio``).
+"""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from services import (  # noqa: E402
+    assignment, audit, catalog, change_feed, dispatch, earnings, idempotency, indexes, matching, order_state, otp,
+    product_ingest, rate_limit, revocation, stats, stock,
+)
+
+pytest_plugins = ["tests.query_budget"]
+
+SERVICES = [
+    assignment, audit, catalog, change_feed, dispatch, earnings, idempotency, matching, order_state, otp, product_ingest,
+    rate_limit, revocation, stats, stock,
+]
+
+
+def _patch_mongomock():
+    from mongomock import aggregate, collection
+    from pymongo.errors import BulkWriteError
+
+    # mongomock has $substr but not $substrCP; they agree on the ASCII timestamps the app slices
+    handle = aggregate._Parser._handle_string_operator
+
+    def handle_string_operator(self, operator, values):
+        return handle(self, "$substr" if operator == "$substrCP" else operator, values)
+
+    aggregate._Parser._handle_string_operator = handle_string_operator
+
+    # With _id projected out, mongomock re-finds ReturnDocument.AFTER by the original filter,
+    # which misses as soon as the update changes a filtered field (every guarded transition)
+    find_and_modify = collection.Collection._find_and_modify
+
+    def _find_and_modify(self, query, projection=None, update=None, *args, **kwargs):
+        if update is None or not projection:
+            return find_and_modify(self, query, projection, update, *args, **kwargs)
+        doc = find_and_modify(self, query, None, update, *args, **kwargs)
+        return None if doc is None else self.find_one({"_id": doc["_id"]}, projection)
+
+    collection.Collection._find_and_modify = _find_and_modify
+
+    # Bulk results number upserts 0, 1, 2... rather than by the request that upserted, and
+    # record_earnings credits exactly the rows at those request indexes
+    execute = collection.BulkOperationBuilder.execute
+
+    def execute_with_request_indexes(self, write_concern=None):
+        upserted_at = []
+
+        def tracked(index, func):
+            def run():
+                result = func()
+                if result.get("upserted") is not None:
+                    upserted_at.append(index)
+                return result
+            run.__name__ = func.__name__
+            return run
+
+        def renumber(result):
+            for entry, index in zip(result["upserted"], upserted_at):
+                entry["index"] = index
+            return result
+
+        self.executors = [tracked(index, func) for index, func in enumerate(self.executors)]
+        try:
+            return renumber(execute(self, write_concern))
+        except BulkWriteError as err:
+            renumber(err.details)
+            raise
+
+    collection.BulkOperationBuilder.execute = execute_with_request_indexes
+
+
+_patch_mongomock()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db():
+    database = mongomock_motor.AsyncMongoMockClient()["green_basket_test"]
+    # Unique indexes only: the tests rely on them, and mongomock lacks 2dsphere/TTL
+    for name, models in indexes.INDEXES.items():
+        for model in models:
+            if model.document.get("unique"):
+                await database[name].create_index(list(model.document["key"].items()), unique=True)
+    for module in SERVICES:
+        module.set_db(database)
+    yield database
+    idempotency._results.clear()
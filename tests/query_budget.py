@@ -0,0 +1,74 @@
+"""Pytest plugin that fails tests whose requests go over their Mongo query budget.
+
+Enable it from a conftest with ``pytest_plugins = ["tests.query_budget"]`` (or
+``-p tests.query_budget``), then either mark a test::
+
+    @pytest.mark.query_budget(8)
+    def test_checkout(client): ...
+
+or rely on the per-route budgets from ``QUERY_BUDGET`` / ``QUERY_BUDGETS``, which
+every test using the ``query_budget`` fixture is held to. Repeated query shapes
+(likely N+1 loops) fail too unless the marker passes ``allow_repeats=True``.
+Requests must go through the app so ``QueryTraceMiddleware`` sees them, e.g. with
+``fastapi.testclient.TestClient``.
+"""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from services import query_trace  # noqa: E402
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "query_budget(max_queries, allow_repeats=False): cap Mongo round trips per request"
+    )
+
+
+class BudgetRecorder:
+    def __init__(self, max_queries=None, allow_repeats=False):
+        self.max_queries = max_queries
+        self.allow_repeats = allow_repeats
+        self.requests = []
+
+    def __call__(self, method, route, trace):
+        self.requests.append((method, route, trace))
+
+    def violations(self):
+        problems = []
+        for method, route, trace in self.requests:
+            budget = self.max_queries if self.max_queries is not None else query_trace.budget_for(method, route)
+            if trace.count > budget:
+                problems.append(f"{method} {route}: {trace.count} queries, budget {budget}")
+            if not self.allow_repeats:
+                for shape, n in trace.repeated().items():
+                    problems.append(f"{method} {route}: same query {n} times (N+1?): {shape}")
+        return problems
+
+
+@pytest.fixture
+def query_budget(request):
+    """Records every request made during the test and fails it on budget violations."""
+    marker = request.node.get_closest_marker("query_budget")
+    kwargs = dict(marker.kwargs) if marker else {}
+    if marker and marker.args:
+        kwargs.setdefault("max_queries", marker.args[0])
+    recorder = BudgetRecorder(**kwargs)
+    query_trace.add_observer(recorder)
+    yield recorder
+    query_trace.remove_observer(recorder)
+    problems = recorder.violations()
+    if problems:
+        pytest.fail("Query budget exceeded:\n  " + "\n  ".join(problems), pytrace=False)
+
+
+def pytest_collection_modifyitems(items):
+    # A query_budget marker implies the fixture, so marking a test is enough
+    for item in items:
+        if item.get_closest_marker("query_budget") and "query_budget" not in getattr(item, "fixturenames", ["query_budget"]):
+            item.fixturenames.append("query_budget")
@@ -0,0 +1,141 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from models import now_iso
+from services import assignment
+
+pytestmark = pytest.mark.anyio
+
+
+def iso_ago(seconds):
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+
+
+async def add_seller(db, seller_id, stock=10):
+    await db.users.insert_one({
+        "id": seller_id, "phone": f"phone-{seller_id}", "role": "SELLER", "approval_status": "APPROVED", "status": "ACTIVE",
+        "daily_stock_date": now_iso()[:10],
+    })
+    await db.products.insert_one({
+        "id": f"{seller_id}-onion", "seller_id": seller_id, "name": "Onion", "unit": "1 kg",
+        "status": "APPROVED", "stock": stock, "seller_price": 40,
+    })
+
+
+async def place_order(db, order_id="ORD-1", quantity=2, **fields):
+    await db.orders.insert_one({
+        "id": order_id, "customer_id": "c1", "seller_id": "", "status": "CREATED", "stock_reserved": False,
+        "items": [{"product_id": "listing", "name": "Onion", "unit": "1 kg", "quantity": quantity, "price": 40}],
+        "created_at": now_iso(), "updated_at": now_iso(),
+        **assignment.queue_fields(), **fields,
+    })
+
+
+async def order(db, order_id="ORD-1"):
+    return await db.orders.find_one({"id": order_id}, {"_id": 0})
+
+
+async def product(db, product_id):
+    return await db.products.find_one({"id": product_id}, {"_id": 0})
+
+
+async def test_assigns_and_reserves_under_a_per_attempt_hold(db):
+    await add_seller(db, "s1")
+    await place_order(db)
+
+    claimed = await assignment.claim_next()
+    assert await assignment.assign(claimed) == "assigned"
+
+    assigned = await order(db)
+    assert assigned["status"] == "ASSIGNED" and assigned["seller_id"] == "s1" and assigned["stock_reserved"]
+    assert assigned["items"][0]["product_id"] == "s1-onion"
+    assert assigned["stock_hold_id"].startswith("ORD-1:")
+    onion = await product(db, "s1-onion")
+    assert onion["stock"] == 8 and onion["stock_holds"] == [assigned["stock_hold_id"]]
+
+
+async def test_claim_skips_leased_orders(db):
+    await place_order(db)
+    assert await assignment.claim_next() is not None
+    assert await assignment.claim_next() is None
+
+
+async def test_lapsed_lease_cannot_assign_or_release_the_new_holders_stock(db):
+    await add_seller(db, "s1")
+    await place_order(db)
+
+    stale = await assignment.claim_next()
+    # The lease lapses and a second worker claims and assigns the order
+    await db.orders.update_one({"id": "ORD-1"}, {"$set": {"assign_after": iso_ago(1)}})
+    fresh = await assignment.claim_next()
+    assert await assignment.assign(fresh) == "assigned"
+
+    assert await assignment.assign(stale) == "lost"
+    onion = await product(db, "s1-onion")
+    assert onion["stock"] == 8 and onion["stock_holds"] == [(await order(db))["stock_hold_id"]]
+
+
+async def test_no_match_backs_off(db):
+    await place_order(db)
+    claimed = await assignment.claim_next()
+    assert await assignment.assign(claimed) == "no_match"
+
+    waiting = await order(db)
+    assert waiting["status"] == "CREATED" and waiting["assign_attempts"] == 1
+    assert waiting["assign_after"] > now_iso()
+    assert await assignment.claim_next() is None
+
+
+async def test_gives_up_after_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(assignment, "ASSIGNMENT_MAX_ATTEMPTS", 2)
+    await place_order(db, assign_attempts=1)
+    claimed = await assignment.claim_next()
+    assert await assignment.assign(claimed) == "cancelled"
+
+    cancelled = await order(db)
+    assert cancelled["status"] == "CANCELLED" and cancelled["cancel_reason"] == "NO_SELLER"
+    assert await db.audit_logs.count_documents({"entity_id": "ORD-1", "action": "ORDER_CANCELLED"}) == 1
+
+
+async def test_gives_up_after_max_age(db):
+    await place_order(db, created_at=iso_ago(assignment.ASSIGNMENT_MAX_AGE_SECONDS + 1))
+    claimed = await assignment.claim_next()
+    assert await assignment.assign(claimed) == "cancelled"
+    assert (await order(db))["status"] == "CANCELLED"
+
+
+async def test_reassigns_after_accept_timeout(db):
+    await add_seller(db, "s1")
+    await add_seller(db, "s2")
+    await place_order(db)
+    assert await assignment.assign(await assignment.claim_next()) == "assigned"
+    first = await order(db)
+    await db.orders.update_one({"id": "ORD-1"}, {"$set": {"assigned_at": iso_ago(assignment.ASSIGNMENT_ACCEPT_TIMEOUT_SECONDS + 1)}})
+
+    assert await assignment.reassign_stale() == 1
+    reverted = await order(db)
+    assert reverted["status"] == "CREATED" and reverted["seller_id"] == ""
+    assert reverted["excluded_seller_ids"] == [first["seller_id"]] and not reverted["stock_reserved"]
+    onion = await product(db, f"{first['seller_id']}-onion")
+    assert onion["stock"] == 10 and onion["stock_holds"] == []
+    assert await db.warnings.count_documents({"seller_id": first["seller_id"], "order_id": "ORD-1"}) == 1
+
+    # The next attempt goes to the other seller
+    assert await assignment.assign(await assignment.claim_next()) == "assigned"
+    assert (await order(db))["seller_id"] not in ("", first["seller_id"])
+
+
+async def test_exclusions_reset_once_every_seller_has_been_tried(db):
+    await add_seller(db, "s1")
+    await place_order(db, excluded_seller_ids=["s1"])
+    assert await assignment.assign(await assignment.claim_next()) == "no_match"
+    assert (await order(db))["excluded_seller_ids"] == []
+
+
+async def test_accept_in_time_is_not_reassigned(db):
+    await add_seller(db, "s1")
+    await place_order(db)
+    await assignment.assign(await assignment.claim_next())
+    assert await assignment.reassign_stale() == 0
+    assert (await order(db))["status"] == "ASSIGNED"
@@ -0,0 +1,102 @@
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import middleware
+from services import revocation
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def fresh_auth_state(monkeypatch):
+    monkeypatch.setattr(middleware, "_revoked", {})
+    middleware._verified_tokens.clear()
+    yield
+    middleware._verified_tokens.clear()
+
+
+def token(issued_ago=0, lifetime=middleware.ACCESS_TOKEN_TTL, legacy=False, user_id="u1"):
+    payload = {"user_id": user_id, "role": "SELLER", "city": "Pune", "status": "ACTIVE", "phone": "9000000001"}
+    if not legacy:
+        iat = int(time.time()) - issued_ago
+        payload.update(iat=iat, exp=iat + lifetime)
+    return jwt.encode(payload, middleware.JWT_SECRET, algorithm=middleware.JWT_ALGORITHM)
+
+
+def bearer(value):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=value)
+
+
+def refused(call, *args):
+    with pytest.raises(HTTPException) as err:
+        call(*args)
+    return err.value.status_code, err.value.detail
+
+
+async def refused_refresh(value):
+    with pytest.raises(HTTPException) as err:
+        await middleware.get_refresh_user(bearer(value))
+    return err.value.status_code, err.value.detail
+
+
+def test_expired_token_asks_for_a_refresh():
+    assert middleware.authenticate(token())["user_id"] == "u1"
+    assert refused(middleware.authenticate, token(issued_ago=120, lifetime=60)) == (401, "Token expired")
+    assert refused(middleware.authenticate, token() + "x") == (401, "Invalid token")
+
+
+async def test_refresh_accepts_expired_tokens_within_the_grace_window():
+    recently_expired = token(issued_ago=middleware.ACCESS_TOKEN_TTL + 60)
+    assert (await middleware.get_refresh_user(bearer(recently_expired)))["user_id"] == "u1"
+
+    long_expired = token(issued_ago=middleware.ACCESS_TOKEN_TTL + middleware.REFRESH_GRACE_SECONDS + 60)
+    assert await refused_refresh(long_expired) == (401, "Token expired")
+
+
+def test_legacy_tokens_only_while_accepted(monkeypatch):
+    assert middleware.authenticate(token(legacy=True))["user_id"] == "u1"
+
+    middleware._verified_tokens.clear()
+    monkeypatch.setattr(middleware, "ACCEPT_LEGACY_TOKENS", False)
+    assert refused(middleware.authenticate, token(legacy=True)) == (401, "Invalid token")
+
+
+async def test_revocation_refuses_earlier_tokens_but_not_later_ones(db):
+    before = token(issued_ago=10)
+    await revocation.revoke_user("u1")
+    assert refused(middleware.authenticate, before) == (403, "Account suspended")
+    assert await refused_refresh(before) == (403, "Account suspended")
+
+    # Issued after the revocation, e.g. once the account was reinstated and the user logged in again
+    middleware.revoke_user("u1", time.time() - 5)
+    assert middleware.authenticate(token())["user_id"] == "u1"
+
+    await revocation.restore_user("u1")
+    assert middleware.authenticate(before)["user_id"] == "u1"
+
+
+async def test_legacy_token_revocation_outlives_the_access_token_ttl(db):
+    legacy = token(legacy=True)
+    await revocation.revoke_user("u1")
+
+    record = await db.token_revocations.find_one({"user_id": "u1"})
+    assert "expires_at" not in record
+
+    # Another worker, long after every expiring token would have lapsed, still refuses it
+    middleware.replace_revocations({})
+    await revocation.sync_revocations()
+    assert refused(middleware.authenticate, legacy) == (403, "Account suspended")
+
+
+async def test_revocation_expires_once_tokens_cannot_be_refreshed(db, monkeypatch):
+    monkeypatch.setattr(middleware, "ACCEPT_LEGACY_TOKENS", False)
+    await revocation.revoke_user("u1")
+
+    record = await db.token_revocations.find_one({"user_id": "u1"})
+    remaining = record["expires_at"].timestamp() - time.time()
+    lifetime = middleware.ACCESS_TOKEN_TTL + middleware.REFRESH_GRACE_SECONDS
+    assert lifetime - 60 < remaining <= lifetime
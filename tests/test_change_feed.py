@@ -0,0 +1,206 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from services import change_feed
+
+pytestmark = pytest.mark.anyio
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append((event.collection, event.operation, event.doc_id))
+
+
+@pytest.fixture(autouse=True)
+def handlers(monkeypatch):
+    monkeypatch.setattr(change_feed, "_handlers", {})
+
+
+def subscribe_all(collections=("users", "products", "orders", "catalog")):
+    recorder = Recorder()
+    for collection in collections:
+        change_feed.subscribe(collection, recorder)
+    return recorder
+
+
+def iso(seconds_from_now=0.0):
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds_from_now)).isoformat()
+
+
+def change(collection, operation, doc=None, token=None):
+    event = {"ns": {"db": "test", "coll": collection}, "operationType": operation, "_id": token}
+    if doc is not None:
+        event["fullDocument"] = {"_id": "oid", **doc}
+    if operation == "update":
+        event["updateDescription"] = {"updatedFields": {"status": doc.get("status")}}
+    return event
+
+
+class StreamEnded(Exception):
+    pass
+
+
+class FakeStream:
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.resume_token = None
+        self.alive = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def try_next(self):
+        if not self.changes:
+            raise StreamEnded
+        item = self.changes.pop(0)
+        self.resume_token = item["_id"]
+        return item
+
+
+class WatchableDb:
+    """The test database plus a scripted ``watch``: each call consumes the next script entry."""
+
+    def __init__(self, db, *scripts):
+        self._db = db
+        self.scripts = list(scripts)
+        self.resumed_after = []
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def watch(self, pipeline, full_document=None, resume_after=None):
+        self.resumed_after.append(resume_after)
+        script = self.scripts.pop(0)
+        if isinstance(script, Exception):
+            raise script
+        return FakeStream(script)
+
+
+async def test_dispatch_runs_every_handler_even_if_one_fails():
+    calls = []
+
+    def broken(event):
+        raise RuntimeError("boom")
+
+    async def async_handler(event):
+        calls.append(("async", event.doc_id))
+
+    change_feed.subscribe("orders", broken)
+    change_feed.subscribe("orders", async_handler)
+    change_feed.subscribe("orders", lambda event: calls.append(("sync", event.doc_id)))
+    await change_feed.dispatch(change_feed.ChangeEvent("orders", change_feed.UPDATE, "o1"))
+    await change_feed.dispatch(change_feed.ChangeEvent("users", change_feed.UPDATE, "u1"))
+    assert calls == [("async", "o1"), ("sync", "o1")]
+
+
+def test_from_change_strips_the_object_id():
+    event = change_feed.from_change(change("orders", "update", {"id": "o1", "status": "ASSIGNED"}))
+    assert (event.collection, event.operation, event.doc_id) == ("orders", "update", "o1")
+    assert event.document == {"id": "o1", "status": "ASSIGNED"} and event.updated_fields == {"status": "ASSIGNED"}
+
+    deleted = change_feed.from_change(change("users", "delete"))
+    assert (deleted.operation, deleted.doc_id, deleted.document) == ("delete", None, None)
+
+
+async def test_watch_resumes_from_the_checkpoint_and_saves_the_latest(db, monkeypatch):
+    monkeypatch.setattr(change_feed, "CHANGE_FEED_CONSUMER", "worker-1")
+    monkeypatch.setattr(change_feed, "CHANGE_FEED_CHECKPOINT_SECONDS", 0)
+    await db.change_feed_state.insert_one({"id": "worker-1", "resume_token": {"_data": "t1"}})
+    fake = WatchableDb(db, [
+        change("orders", "insert", {"id": "o1"}, token={"_data": "t2"}),
+        change("users", "update", {"id": "u1", "status": "ACTIVE"}, token={"_data": "t3"}),
+    ])
+    monkeypatch.setattr(change_feed, "db", fake)
+    recorder = subscribe_all()
+
+    with pytest.raises(StreamEnded):
+        await change_feed._watch()
+
+    assert fake.resumed_after == [{"_data": "t1"}]
+    assert recorder.events == [("orders", "insert", "o1"), ("users", "update", "u1")]
+    state = await db.change_feed_state.find_one({"id": "worker-1"})
+    assert state["resume_token"] == {"_data": "t3"}
+
+
+async def test_lost_resume_point_flushes_caches_and_starts_from_now(db, monkeypatch):
+    monkeypatch.setattr(change_feed, "CHANGE_FEED_CONSUMER", "worker-1")
+    await db.change_feed_state.insert_one({"id": "worker-1", "resume_token": {"_data": "gone"}})
+    fake = WatchableDb(db, OperationFailure("resume point lost", code=286), [])
+    monkeypatch.setattr(change_feed, "db", fake)
+    recorder = subscribe_all()
+
+    with pytest.raises(StreamEnded):
+        await change_feed._watch()
+
+    assert fake.resumed_after == [{"_data": "gone"}, None]
+    assert sorted(recorder.events) == sorted(
+        (collection, change_feed.INVALIDATE, None) for collection in change_feed.CHANGE_FEED_COLLECTIONS
+    )
+
+
+async def test_without_a_consumer_name_nothing_is_checkpointed(db, monkeypatch):
+    monkeypatch.setattr(change_feed, "CHANGE_FEED_CONSUMER", "")
+    monkeypatch.setattr(change_feed, "CHANGE_FEED_CHECKPOINT_SECONDS", 0)
+    fake = WatchableDb(db, [change("orders", "insert", {"id": "o1"}, token={"_data": "t2"})])
+    monkeypatch.setattr(change_feed, "db", fake)
+
+    with pytest.raises(StreamEnded):
+        await change_feed._watch()
+
+    assert fake.resumed_after == [None]
+    assert await db.change_feed_state.count_documents({}) == 0
+
+
+async def test_poll_delivers_late_commits_inside_the_overlap_once(db):
+    recorder = subscribe_all(["orders"])
+    state = {"watermark": iso(), "seen": set()}
+    await db.orders.insert_one({"id": "o1", "updated_at": iso(1)})
+    await change_feed._poll_collection("orders", "updated_at", "id", state)
+    assert recorder.events == [("orders", "update", "o1")]
+
+    # Stamped before the watermark by a slower worker's clock, committed after the last poll
+    await db.orders.insert_one({"id": "o2", "updated_at": iso(-2)})
+    await change_feed._poll_collection("orders", "updated_at", "id", state)
+    assert recorder.events == [("orders", "update", "o1"), ("orders", "update", "o2")]
+
+    # A new version of o1 is a new event; re-reading the overlap is not
+    await db.orders.update_one({"id": "o1"}, {"$set": {"updated_at": iso(2)}})
+    await change_feed._poll_collection("orders", "updated_at", "id", state)
+    await change_feed._poll_collection("orders", "updated_at", "id", state)
+    assert recorder.events[2:] == [("orders", "update", "o1")]
+
+
+async def test_poll_pages_through_a_shared_timestamp(db, monkeypatch):
+    monkeypatch.setattr(change_feed, "POLL_PAGE_SIZE", 2)
+    recorder = subscribe_all(["catalog"])
+    stamp = iso(1)
+    await db.catalog.insert_many([{"key": f"Onion_{n} kg", "updated_at": stamp} for n in range(5)])
+
+    await change_feed._poll_collection("catalog", "updated_at", "key", {"watermark": iso(), "seen": set()})
+    assert len(recorder.events) == 5
+
+
+async def test_poll_loop_polls_users_and_catalog_instead_of_invalidating(db, monkeypatch):
+    monkeypatch.setattr(change_feed, "CHANGE_FEED_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(change_feed, "CHANGE_FEED_INVALIDATE_SECONDS", 0.05)
+    recorder = subscribe_all()
+    task = asyncio.ensure_future(change_feed._poll())
+    try:
+        await asyncio.sleep(0.05)
+        await db.users.insert_one({"id": "u1", "phone": "1", "role": "SELLER", "updated_at": iso(1)})
+        await asyncio.sleep(0.15)
+    finally:
+        task.cancel()
+
+    invalidated = {collection for collection, operation, _ in recorder.events if operation == change_feed.INVALIDATE}
+    assert invalidated == {"products"}
+    assert ("users", "update", "u1") in recorder.events
@@ -0,0 +1,158 @@
+import math
+
+import pytest
+
+from services import dispatch
+
+pytestmark = pytest.mark.anyio
+
+PUNE = (18.52, 73.85)
+
+
+def km_east(origin, km):
+    latitude, longitude = origin
+    return latitude, longitude + km / (111.32 * math.cos(math.radians(latitude)))
+
+
+class GeoDb:
+    """The test database with a users collection that answers ``$near``, which mongomock lacks."""
+
+    def __init__(self, db):
+        self._db = db
+        self.users = GeoUsers(db.users)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+class GeoUsers:
+    def __init__(self, users):
+        self._users = users
+
+    def __getattr__(self, name):
+        return getattr(self._users, name)
+
+    def find(self, query, projection=None):
+        if "location" not in query:
+            return self._users.find(query, projection)
+        return NearCursor(self._users, query)
+
+
+class NearCursor:
+    # Nearest first by great-circle distance, like a 2dsphere $near
+    def __init__(self, users, query):
+        self._users = users
+        self.query = query
+        self.count = None
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    async def to_list(self, length=None):
+        near = self.query["location"]["$near"]
+        rest = {k: v for k, v in self.query.items() if k != "location"}
+        docs = await self._users.find(rest, {"_id": 0}).to_list(None)
+        ranked = sorted((distance_m(near["$geometry"], d["location"]), d["id"]) for d in docs if d.get("location"))
+        return [{"id": doc_id} for meters, doc_id in ranked if meters <= near["$maxDistance"]][:self.count]
+
+
+def distance_m(a, b):
+    (lon1, lat1), (lon2, lat2) = a["coordinates"], b["coordinates"]
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    h = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h))
+
+
+@pytest.fixture
+def geo(db, monkeypatch):
+    monkeypatch.setattr(dispatch, "db", GeoDb(db))
+    monkeypatch.setattr(dispatch, "DISPATCH_RADII_KM", [3, 8])
+
+
+async def add_partner(db, partner_id, city="Pune", at=None, **fields):
+    point = dispatch.geo_point(*at) if at else None
+    await db.users.insert_one({
+        "id": partner_id, "phone": f"phone-{partner_id}", "role": "DELIVERY", "approval_status": "APPROVED",
+        "status": "ACTIVE", "is_available": True, "city": city, **({"location": point} if point else {}), **fields,
+    })
+
+
+async def add_order(db, order_id="ORD-1"):
+    await db.orders.insert_one({"id": order_id, "status": "READY_FOR_PICKUP", "delivery_partner_id": ""})
+
+
+def seller(city="Pune", at=PUNE):
+    return {"id": "s1", "city": city, **({"location": dispatch.geo_point(*at)} if at else {})}
+
+
+async def partner(db, partner_id):
+    return await db.users.find_one({"id": partner_id}, {"_id": 0})
+
+
+async def test_nearest_partner_in_the_first_ring_wins(db, geo):
+    await add_partner(db, "far", at=km_east(PUNE, 6))
+    await add_partner(db, "near", at=km_east(PUNE, 1))
+    await add_partner(db, "nearer", at=km_east(PUNE, 0.5), city="Mumbai")
+    await add_order(db)
+
+    assert (await dispatch.dispatch_order("ORD-1", seller()))["id"] == "near"
+    order = await db.orders.find_one({"id": "ORD-1"})
+    assert order["delivery_partner_id"] == "near" and order["delivery_otp"]
+    claimed = await partner(db, "near")
+    assert not claimed["is_available"] and claimed["current_order_id"] == "ORD-1"
+
+
+async def test_rings_widen_then_fall_back_to_the_city(db, geo):
+    await add_partner(db, "outer", at=km_east(PUNE, 6))
+    assert (await dispatch.claim_partner("ORD-1", seller()))["id"] == "outer"
+
+    # Beyond every ring, and one with no coordinates at all: the city fallback takes them
+    await add_partner(db, "unmapped")
+    assert (await dispatch.claim_partner("ORD-2", seller()))["id"] == "unmapped"
+
+
+async def test_busy_unapproved_and_other_city_partners_are_skipped(db, monkeypatch):
+    monkeypatch.setattr(dispatch, "DISPATCH_RADII_KM", [])
+    await add_partner(db, "busy", is_available=False)
+    await add_partner(db, "pending", approval_status="PENDING")
+    await add_partner(db, "suspended", status="SUSPENDED")
+    await add_partner(db, "elsewhere", city="Mumbai")
+    assert await dispatch.claim_partner("ORD-1", seller(at=None)) is None
+
+    await add_partner(db, "free")
+    assert (await dispatch.claim_partner("ORD-1", seller(at=None)))["id"] == "free"
+
+
+async def test_a_partner_is_claimed_once(db, monkeypatch):
+    monkeypatch.setattr(dispatch, "DISPATCH_RADII_KM", [])
+    await add_partner(db, "only")
+    assert (await dispatch.claim_partner("ORD-1", seller(at=None)))["id"] == "only"
+    assert await dispatch.claim_partner("ORD-2", seller(at=None)) is None
+    assert (await partner(db, "only"))["current_order_id"] == "ORD-1"
+
+
+async def test_no_partner_queues_the_order_for_the_city(db, monkeypatch):
+    monkeypatch.setattr(dispatch, "DISPATCH_RADII_KM", [])
+    await add_order(db, "ORD-1")
+    await add_order(db, "ORD-2")
+    assert await dispatch.dispatch_order("ORD-1", seller(at=None)) is None
+    assert await dispatch.dispatch_order("ORD-2", seller(at=None)) is None
+    await db.dispatch_queue.insert_one({"order_id": "ORD-X", "seller_id": "s9", "city": "Mumbai", "created_at": "0"})
+
+    # A partner coming online in Pune takes the oldest Pune order, never Mumbai's
+    await add_partner(db, "p1")
+    assert await dispatch.assign_queued("p1") == "ORD-1"
+    assert (await db.orders.find_one({"id": "ORD-1"}))["delivery_partner_id"] == "p1"
+    assert sorted(e["order_id"] for e in await db.dispatch_queue.find({}).to_list(None)) == ["ORD-2", "ORD-X"]
+
+    # Already busy with ORD-1: nothing more is handed over
+    assert await dispatch.assign_queued("p1") is None
+
+
+async def test_queue_can_be_turned_off(db, monkeypatch):
+    monkeypatch.setattr(dispatch, "DISPATCH_RADII_KM", [])
+    monkeypatch.setattr(dispatch, "DISPATCH_QUEUE", False)
+    assert await dispatch.dispatch_order("ORD-1", seller(at=None)) is None
+    assert await db.dispatch_queue.count_documents({}) == 0
@@ -0,0 +1,82 @@
+import pytest
+
+from services import earnings
+
+pytestmark = pytest.mark.anyio
+
+
+def row(row_id, user_id, role, amount, created_at="2024-01-02T10:00:00"):
+    return {"id": row_id, "user_id": user_id, "role": role, "amount": amount, "status": "PENDING",
+            "order_id": f"order-{row_id}", "created_at": created_at}
+
+
+@pytest.fixture
+async def ledger(db):
+    await earnings.record_earnings([
+        row("e1", "s1", "SELLER", 80.0, "2024-01-01T10:00:00"),
+        row("e2", "s1", "SELLER", 40.5),
+        row("e3", "s2", "SELLER", 10.0),
+        row("e4", "d1", "DELIVERY", 12.25, "2024-01-01T10:00:00"),
+        row("e5", "d1", "DELIVERY", 7.75),
+    ])
+
+
+async def statuses(db):
+    return {r["id"]: r["status"] for r in await db.earnings.find({}).to_list(None)}
+
+
+async def test_recording_the_same_rows_again_credits_once(db, ledger):
+    # A retried delivery settles the same earnings ids
+    await earnings.record_earnings([row("e2", "s1", "SELLER", 40.5), row("e6", "s1", "SELLER", 5.0)])
+    assert await earnings.get_balance("s1") == {"total": 125.5, "paid": 0, "pending": 125.5}
+    assert await db.earnings.count_documents({}) == 6
+
+
+async def test_payout_needs_a_filter(db, ledger):
+    with pytest.raises(ValueError):
+        await earnings.payout()
+    assert set((await statuses(db)).values()) == {"PENDING"}
+    assert await db.payout_batches.count_documents({}) == 0
+
+
+async def test_payout_by_role_moves_only_that_roles_balances(db, ledger):
+    batch = await earnings.payout(role="DELIVERY")
+    assert (batch["transactions"], batch["payees"], batch["amount"]) == (2, 1, 20.0)
+
+    assert await earnings.get_balance("d1") == {"total": 20.0, "paid": 20.0, "pending": 0}
+    assert await earnings.get_balance("s1") == {"total": 120.5, "paid": 0, "pending": 120.5}
+    assert await statuses(db) == {"e1": "PENDING", "e2": "PENDING", "e3": "PENDING", "e4": "PAID", "e5": "PAID"}
+
+
+async def test_payout_by_user_and_cutoff(db, ledger):
+    batch = await earnings.payout(user_ids=["s1", "d1"], created_before="2024-01-02")
+    assert (batch["transactions"], batch["payees"], batch["amount"]) == (2, 2, 92.25)
+    assert batch["user_ids"] == ["s1", "d1"] and batch["created_before"] == "2024-01-02"
+
+    assert await earnings.get_balance("s1") == {"total": 120.5, "paid": 80.0, "pending": 40.5}
+    assert await earnings.get_balance("d1") == {"total": 20.0, "paid": 12.25, "pending": 7.75}
+    assert await earnings.get_balance("s2") == {"total": 10.0, "paid": 0, "pending": 10.0}
+    paid = await db.earnings.find({"payout_batch_id": batch["id"]}, {"_id": 0, "id": 1}).to_list(None)
+    assert sorted(r["id"] for r in paid) == ["e1", "e4"]
+
+
+async def test_replayed_payout_pays_nothing_twice(db, ledger):
+    first = await earnings.payout(role="SELLER")
+    assert await earnings.payout(role="SELLER") is None
+
+    assert await db.payout_batches.count_documents({}) == 1
+    assert (await db.payout_batches.find_one({}, {"_id": 0}))["id"] == first["id"]
+    assert await earnings.get_balance("s1") == {"total": 120.5, "paid": 120.5, "pending": 0}
+
+
+async def test_pay_everything_then_summaries_agree_with_a_rebuild(db, ledger):
+    await earnings.payout(user_ids=["s2"])
+    await earnings.payout(all_pending=True)
+    summary = await earnings.summarize_by_role()
+    assert (summary["total"], summary["paid"], summary["pending"]) == (150.5, 150.5, 0)
+    assert summary["by_role"]["SELLER"]["payees"] == 2
+
+    incremental = await db.balances.find({}, {"_id": 0, "updated_at": 0}).sort("user_id", 1).to_list(None)
+    await db.balances.delete_many({})
+    await earnings.rebuild_balances()
+    assert await db.balances.find({}, {"_id": 0, "updated_at": 0}).sort("user_id", 1).to_list(None) == incremental
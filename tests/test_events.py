@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import pytest
+
+from routes import events as events_route
+from services import events
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+@pytest.fixture(autouse=True)
+async def memory_backend(monkeypatch):
+    monkeypatch.setattr(events, "_subscribers", {})
+    await events.start(None)
+    yield
+    await events.stop()
+
+
+def drain(sub):
+    items = []
+    while not sub.queue.empty():
+        items.append(sub.queue.get_nowait())
+    return items
+
+
+def order(**fields):
+    return {"id": "ORD-1", "status": "ASSIGNED", "customer_id": "c1", "seller_id": "s1", "updated_at": "t", **fields}
+
+
+async def test_order_events_reach_each_party_once():
+    customer = events.subscribe([events.user_channel("c1")])
+    seller = events.subscribe([events.user_channel("s1")])
+    bystander = events.subscribe([events.user_channel("c2")])
+    # An admin who is also the customer still gets one copy
+    admin = events.subscribe([events.user_channel("c1"), events.ADMIN_CHANNEL])
+
+    await events.publish_order(order())
+
+    for sub in (customer, seller, admin):
+        assert [(e["order_id"], e["status"]) for e in drain(sub)] == [("ORD-1", "ASSIGNED")]
+    assert drain(bystander) == []
+
+
+async def test_slow_subscriber_drops_its_oldest_events(monkeypatch):
+    monkeypatch.setattr(events, "EVENTS_QUEUE_SIZE", 2)
+    sub = events.subscribe([events.ADMIN_CHANNEL])
+    for status in ("ASSIGNED", "ACCEPTED", "READY_FOR_PICKUP"):
+        await events.publish_order(order(status=status))
+
+    assert [e["status"] for e in drain(sub)] == ["ACCEPTED", "READY_FOR_PICKUP"]
+    assert sub.dropped == 1
+
+
+async def test_unsubscribe_removes_empty_channels():
+    first = events.subscribe([events.user_channel("c1"), events.ADMIN_CHANNEL])
+    second = events.subscribe([events.ADMIN_CHANNEL])
+    events.unsubscribe(first)
+    assert events._subscribers == {events.ADMIN_CHANNEL: {second}}
+    events.unsubscribe(second)
+    assert events._subscribers == {}
+
+
+async def test_stream_keeps_events_across_heartbeats_and_cleans_up(monkeypatch):
+    monkeypatch.setattr(events_route, "EVENTS_HEARTBEAT_SECONDS", 0.01)
+    sub = events.subscribe([events.user_channel("c1")])
+    stream = events_route._event_stream(FakeRequest(), sub)
+
+    assert await stream.__anext__() == "retry: 3000\n\n"
+    assert await stream.__anext__() == ": keepalive\n\n"
+    assert await stream.__anext__() == ": keepalive\n\n"
+
+    await events.publish_order(order())
+    frame = await stream.__anext__()
+    assert frame.startswith("event: order\ndata: ")
+    assert json.loads(frame.split("data: ", 1)[1])["order_id"] == "ORD-1"
+
+    await stream.aclose()
+    assert events._subscribers == {}
+
+
+async def test_stream_ends_when_the_client_goes_away(monkeypatch):
+    monkeypatch.setattr(events_route, "EVENTS_HEARTBEAT_SECONDS", 0.01)
+    request = FakeRequest()
+    sub = events.subscribe([events.user_channel("c1")])
+    stream = events_route._event_stream(request, sub)
+    await stream.__anext__()
+
+    request.disconnected = True
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(stream.__anext__(), 1)
+    assert events._subscribers == {}
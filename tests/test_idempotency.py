@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services import idempotency
+
+pytestmark = pytest.mark.anyio
+
+
+def counting(result=None, delay=0):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result if result is not None else {"n": len(calls)}
+
+    return compute, calls
+
+
+async def test_replay_returns_stored_response(db):
+    compute, calls = counting()
+    assert await idempotency.run("r1", "fp", compute) == ({"n": 1}, False)
+    assert await idempotency.run("r1", "fp", compute) == ({"n": 1}, True)
+
+    # From the collection, as another worker would see it
+    idempotency._results.clear()
+    assert await idempotency.run("r1", "fp", compute) == ({"n": 1}, True)
+    assert calls == [1]
+
+
+async def test_same_key_different_body_is_refused(db):
+    compute, calls = counting()
+    await idempotency.run("r1", "fp-a", compute)
+    with pytest.raises(HTTPException) as err:
+        await idempotency.run("r1", "fp-b", compute)
+    assert err.value.status_code == 422
+
+    idempotency._results.clear()
+    with pytest.raises(HTTPException) as err:
+        await idempotency.run("r1", "fp-b", compute)
+    assert err.value.status_code == 422
+    assert calls == [1]
+
+
+async def test_concurrent_duplicates_coalesce(db):
+    compute, calls = counting(delay=0.05)
+    results = await asyncio.gather(*(idempotency.run("r1", "fp", compute) for _ in range(5)))
+    assert calls == [1]
+    assert {tuple(body.items()) for body, _ in results} == {(("n", 1),)}
+    assert sorted(replayed for _, replayed in results) == [False, True, True, True, True]
+
+
+async def test_failed_request_releases_the_claim(db):
+    async def boom():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await idempotency.run("r1", "fp", boom)
+    compute, calls = counting()
+    assert await idempotency.run("r1", "fp", compute) == ({"n": 1}, False)
+
+
+async def test_slow_request_keeps_its_claim(db, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LOCK_SECONDS", 0.06)
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 1)
+    compute, calls = counting(delay=0.3)
+    first = asyncio.ensure_future(idempotency.run("r1", "fp", compute))
+    await asyncio.sleep(0.15)
+
+    # Past several lock lengths, but the heartbeat renewed it: a retry waits rather than taking over
+    assert await idempotency._claim("r1", "fp", idempotency.datetime.now(idempotency.timezone.utc)) is None
+    assert await first == ({"n": 1}, False)
+    assert calls == [1]
+
+
+async def test_lost_claim_does_not_overwrite_the_new_owner(db):
+    compute, _ = counting(result={"who": "first"}, delay=0.05)
+    task = asyncio.ensure_future(idempotency._resolve("r1", "fp", compute))
+    await asyncio.sleep(0.01)
+    # Another worker takes the record over, as if our claim had lapsed
+    await db.idempotency_keys.update_one({"id": "r1"}, {"$set": {"owner": "other"}})
+    await task
+
+    record = await db.idempotency_keys.find_one({"id": "r1"})
+    assert record["status"] == "pending" and "response" not in record
@@ -0,0 +1,93 @@
+import pytest
+
+from models import now_iso
+from services import matching
+
+pytestmark = pytest.mark.anyio
+
+TODAY = now_iso()[:10]
+
+
+async def add_seller(db, seller_id, stock, **fields):
+    """``stock``: {(name, unit): quantity} for the seller's approved listings."""
+    await db.users.insert_one({
+        "id": seller_id, "phone": f"phone-{seller_id}", "role": "SELLER", "approval_status": "APPROVED",
+        "status": "ACTIVE", "daily_stock_date": TODAY, **fields,
+    })
+    await db.products.insert_many([
+        {"id": f"{seller_id}-{name}-{unit}", "seller_id": seller_id, "name": name, "unit": unit,
+         "status": "APPROVED", "stock": quantity}
+        for (name, unit), quantity in stock.items()
+    ])
+
+
+def cart(*lines):
+    return [{"name": name, "unit": unit, "quantity": quantity} for name, unit, quantity in lines]
+
+
+async def match(items, **kwargs):
+    seller_id, products = await matching.find_matching_seller(items, TODAY, **kwargs)
+    return seller_id, {key: p["id"] for key, p in products.items()}
+
+
+def test_repeated_lines_are_combined():
+    items = cart(("Onion", "1 kg", 2), ("Tomato", "1 kg", 1), ("Onion", "1 kg", 3))
+    assert matching.required_quantities(items) == {("Onion", "1 kg"): 5, ("Tomato", "1 kg"): 1}
+
+
+async def test_only_a_seller_with_every_line_in_stock_matches(db):
+    await add_seller(db, "partial", {("Onion", "1 kg"): 10})
+    await add_seller(db, "short", {("Onion", "1 kg"): 10, ("Tomato", "1 kg"): 1})
+    await add_seller(db, "full", {("Onion", "1 kg"): 5, ("Tomato", "1 kg"): 2, ("Garlic", "250 g"): 1})
+
+    items = cart(("Onion", "1 kg", 3), ("Tomato", "1 kg", 1), ("Tomato", "1 kg", 1))
+    assert await match(items) == ("full", {
+        ("Onion", "1 kg"): "full-Onion-1 kg", ("Tomato", "1 kg"): "full-Tomato-1 kg",
+    })
+
+
+async def test_combined_quantity_must_fit_one_listing(db):
+    await add_seller(db, "s1", {("Onion", "1 kg"): 4})
+    assert await match(cart(("Onion", "1 kg", 3), ("Onion", "1 kg", 2))) == (None, {})
+    assert await match(cart(("Onion", "1 kg", 2), ("Onion", "1 kg", 2))) == ("s1", {("Onion", "1 kg"): "s1-Onion-1 kg"})
+
+
+async def test_unit_is_part_of_the_match(db):
+    await add_seller(db, "s1", {("Onion", "500 g"): 10})
+    assert await match(cart(("Onion", "1 kg", 1))) == (None, {})
+
+
+@pytest.mark.parametrize("fields", [
+    {"daily_stock_date": "2000-01-01"},
+    {"approval_status": "PENDING"},
+    {"status": "SUSPENDED"},
+])
+async def test_ineligible_sellers_never_match(db, fields):
+    await add_seller(db, "s1", {("Onion", "1 kg"): 10}, **fields)
+    assert await match(cart(("Onion", "1 kg", 1))) == (None, {})
+
+
+async def test_unapproved_listing_does_not_count(db):
+    await add_seller(db, "s1", {("Onion", "1 kg"): 10})
+    await db.products.update_many({}, {"$set": {"status": "PENDING"}})
+    assert await match(cart(("Onion", "1 kg", 1))) == (None, {})
+
+
+async def test_tie_goes_to_one_seller_for_every_line_and_exclusion_moves_on(db):
+    stock = {("Onion", "1 kg"): 5, ("Tomato", "1 kg"): 5}
+    await add_seller(db, "a", stock)
+    await add_seller(db, "b", stock)
+    items = cart(("Onion", "1 kg", 1), ("Tomato", "1 kg", 1))
+
+    winner, products = await match(items)
+    assert winner in ("a", "b")
+    assert set(products.values()) == {f"{winner}-Onion-1 kg", f"{winner}-Tomato-1 kg"}
+
+    other = "b" if winner == "a" else "a"
+    assert (await match(items, exclude_seller_ids=[winner]))[0] == other
+    assert await match(items, exclude_seller_ids=["a", "b"]) == (None, {})
+
+
+async def test_empty_cart_matches_nobody(db):
+    await add_seller(db, "s1", {("Onion", "1 kg"): 10})
+    assert await match([]) == (None, {})
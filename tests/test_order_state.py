@@ -0,0 +1,63 @@
+import pytest
+
+from services import order_state
+
+pytestmark = pytest.mark.anyio
+
+
+async def insert_order(db, status="ASSIGNED", **fields):
+    order = {"id": "ORD-1", "status": status, "seller_id": "s1", "items": [], "updated_at": "", **fields}
+    await db.orders.insert_one({**order})
+    return order
+
+
+async def test_illegal_transition_is_refused(db):
+    await insert_order(db, status="CREATED")
+    with pytest.raises(ValueError):
+        await order_state.transition("ORD-1", "CREATED", "DELIVERED")
+    assert (await db.orders.find_one({"id": "ORD-1"}))["status"] == "CREATED"
+
+
+async def test_applied_then_guard_misses(db):
+    await insert_order(db)
+
+    order, applied = await order_state.transition("ORD-1", "ASSIGNED", "ACCEPTED", changes={"accepted_by": "s1"})
+    assert applied and order["status"] == "ACCEPTED" and order["accepted_by"] == "s1"
+
+    # Status guard: a second accept finds nothing and is not a replay without a key
+    order, applied = await order_state.transition("ORD-1", "ASSIGNED", "ACCEPTED")
+    assert (order, applied) == (None, False)
+
+
+async def test_match_guard(db):
+    await insert_order(db)
+    order, applied = await order_state.transition("ORD-1", "ASSIGNED", "ACCEPTED", match={"seller_id": "other"})
+    assert (order, applied) == (None, False)
+    assert (await db.orders.find_one({"id": "ORD-1"}))["status"] == "ASSIGNED"
+
+
+async def test_duplicate_transition_key_replays_effects(db):
+    await insert_order(db)
+    calls = []
+
+    async def effects(order, session):
+        calls.append(order["status"])
+
+    first, applied = await order_state.transition("ORD-1", "ASSIGNED", "ACCEPTED", idempotency_key="k1", effects=effects)
+    assert applied
+
+    again, applied = await order_state.transition("ORD-1", "ASSIGNED", "ACCEPTED", idempotency_key="k1", effects=effects)
+    assert not applied
+    assert again["id"] == first["id"] and again["status"] == "ACCEPTED"
+    # Effects run again on replay so a crash between status change and effects gets finished
+    assert calls == ["ACCEPTED", "ACCEPTED"]
+
+    other, applied = await order_state.transition("ORD-1", "ASSIGNED", "ACCEPTED", idempotency_key="k2")
+    assert (other, applied) == (None, False)
+
+
+async def test_transition_moves_status_counters(db):
+    await insert_order(db)
+    await order_state.transition("ORD-1", "ASSIGNED", "ACCEPTED")
+    counters = await db.stats.find_one({"id": "global"})
+    assert counters["orders"] == {"ASSIGNED": -1, "ACCEPTED": 1}
@@ -0,0 +1,61 @@
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from routes import auth
+from services import otp
+
+pytestmark = pytest.mark.anyio
+
+PHONE = "9000000001"
+
+
+async def test_code_verifies_once(db):
+    code = await otp.issue(PHONE)
+    stored = await db.otp_store.find_one({"phone": PHONE})
+    assert code not in str(stored)
+
+    assert await otp.verify(PHONE, code) == otp.VERIFIED
+    assert await otp.verify(PHONE, code) == otp.EXPIRED
+
+
+async def test_expired_code_is_refused(db):
+    code = await otp.issue(PHONE)
+    await db.otp_store.update_one(
+        {"phone": PHONE}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+    )
+    assert await otp.verify(PHONE, code) == otp.EXPIRED
+
+
+async def test_attempts_cap_locks_the_code(db):
+    code = await otp.issue(PHONE)
+    wrong = "000000" if code != "000000" else "111111"
+    for _ in range(otp.OTP_MAX_ATTEMPTS):
+        assert await otp.verify(PHONE, wrong) == otp.INVALID
+    # The right code no longer works once the cap is reached; a new one must be sent
+    assert await otp.verify(PHONE, code) == otp.EXPIRED
+
+    code = await otp.issue(PHONE)
+    assert await otp.verify(PHONE, code) == otp.VERIFIED
+
+
+def request(forwarded=None, peer="10.0.0.9"):
+    headers = {"x-forwarded-for": forwarded} if forwarded else {}
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host=peer))
+
+
+def test_client_ip_ignores_forwarded_for_by_default(monkeypatch):
+    monkeypatch.setattr(auth, "TRUST_FORWARDED_FOR", False)
+    assert auth.client_ip(request("1.2.3.4")) == "10.0.0.9"
+
+
+def test_client_ip_takes_the_proxy_added_hop(monkeypatch):
+    monkeypatch.setattr(auth, "TRUST_FORWARDED_FOR", True)
+    monkeypatch.setattr(auth, "TRUSTED_PROXY_HOPS", 1)
+    # The client wrote "6.6.6.6"; the ingress appended the address it actually saw
+    assert auth.client_ip(request("6.6.6.6, 1.2.3.4")) == "1.2.3.4"
+
+    monkeypatch.setattr(auth, "TRUSTED_PROXY_HOPS", 2)
+    assert auth.client_ip(request("6.6.6.6, 1.2.3.4, 10.0.0.2")) == "1.2.3.4"
+    assert auth.client_ip(request("1.2.3.4")) == "10.0.0.9"
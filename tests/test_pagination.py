@@ -0,0 +1,89 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from services.pagination import PageParams, decode_cursor, encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def rejected(call, *args, **kwargs):
+    with pytest.raises(HTTPException) as err:
+        call(*args, **kwargs)
+    return err.value.status_code, err.value.detail
+
+
+@pytest.fixture
+async def orders(db):
+    # Three orders share a created_at, so the cursor has to break the tie on id
+    await db.orders.insert_many([
+        {"id": f"o{n}", "customer_id": "c1", "created_at": created_at, "items": [{"name": "Onion", "quantity": n}]}
+        for n, created_at in enumerate(["2024-01-01", "2024-01-02", "2024-01-02", "2024-01-02", "2024-01-03"])
+    ])
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("2024-01-02", "o3")) == ("2024-01-02", "o3")
+    assert decode_cursor(encode_cursor(None, "o3")) == (None, "o3")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    raw_cursor({"value": 1, "id": 2}),
+    raw_cursor(["2024-01-02"]),
+    raw_cursor([{"$ne": None}, "o3"]),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_malformed_cursor_is_a_400(cursor):
+    assert rejected(decode_cursor, cursor) == (400, "Invalid cursor")
+
+
+@pytest.mark.parametrize("fields", ["_id", "_id.x", "items..name", "items.", "items,$where", "a-b"])
+def test_invalid_fields_are_a_400(fields):
+    status, detail = rejected(PageParams, fields=fields)
+    assert status == 400 and detail.startswith("Invalid field")
+
+
+def test_projection_drops_paths_inside_listed_parents():
+    assert PageParams().projection("created_at") == {"_id": 0}
+    assert PageParams(fields="items,items.name, id").projection("created_at") == {
+        "_id": 0, "created_at": 1, "id": 1, "items": 1,
+    }
+    assert PageParams(fields="created_at.date,status").projection("created_at") == {
+        "_id": 0, "created_at": 1, "id": 1, "status": 1,
+    }
+
+
+async def test_pages_cover_every_row_once_across_ties(db, orders):
+    seen, cursor = [], None
+    while True:
+        items, cursor = await PageParams(cursor=cursor, limit=2).fetch(db.orders, {"customer_id": "c1"})
+        seen += [(o["created_at"], o["id"]) for o in items]
+        if not cursor:
+            break
+    assert seen == [
+        ("2024-01-03", "o4"), ("2024-01-02", "o3"), ("2024-01-02", "o2"), ("2024-01-02", "o1"), ("2024-01-01", "o0"),
+    ]
+
+
+async def test_last_full_page_has_no_cursor(db, orders):
+    items, cursor = await PageParams(limit=5).fetch(db.orders, {})
+    assert len(items) == 5 and cursor is None
+
+
+async def test_fields_limit_the_rows(db, orders):
+    items, _ = await PageParams(limit=1, fields="items.quantity").fetch(db.orders, {})
+    assert items == [{"id": "o4", "created_at": "2024-01-03", "items": [{"quantity": 4}]}]
+
+
+async def test_ndjson_streams_the_rest_after_the_cursor(db, orders):
+    _, cursor = await PageParams(limit=2).fetch(db.orders, {})
+    response = PageParams(cursor=cursor, format="ndjson", fields="id").stream(db.orders, {})
+    rows = [json.loads(line) async for line in response.body_iterator]
+    assert [row["id"] for row in rows] == ["o2", "o1", "o0"]
@@ -0,0 +1,114 @@
+import itertools
+
+import pytest
+
+from services import product_ingest
+
+pytestmark = pytest.mark.anyio
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+def csv_upload(body, chunk_size=7):
+    data = body.encode()
+    parts = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    return product_ingest.iter_csv_rows(product_ingest.iter_lines(chunks(*parts)))
+
+
+def ndjson_upload(body):
+    return product_ingest.iter_ndjson_rows(product_ingest.iter_lines(chunks(body.encode())))
+
+
+async def test_lines_survive_arbitrary_chunk_boundaries():
+    body = "name,unit\r\nPyaaz ₹,1 kg\r\n\nlast line without newline".encode()
+    # Every split point, including inside the multi-byte rupee sign
+    for cut in range(1, len(body)):
+        lines = await collect(product_ingest.iter_lines(chunks(body[:cut], body[cut:])))
+        assert lines == ["name,unit", "Pyaaz ₹,1 kg", "", "last line without newline"]
+
+
+async def test_csv_header_in_any_order():
+    rows = await collect(csv_upload('\nPrice, Name ,unit\n40,"Onion, red",1 kg\n\n30,Potato,500 g\n'))
+    assert rows == [
+        (1, {"price": "40", "name": "Onion, red", "unit": "1 kg"}),
+        (2, {"price": "30", "name": "Potato", "unit": "500 g"}),
+    ]
+
+
+async def test_csv_missing_columns_is_refused():
+    with pytest.raises(ValueError, match="missing columns: price"):
+        await collect(csv_upload("name,unit\nOnion,1 kg\n"))
+
+
+async def test_malformed_rows_are_reported_and_the_rest_inserted(db):
+    body = "\n".join([
+        "name,unit,price",
+        "Onion,1 kg,40",
+        "Potato,500 g,abc",
+        "Tomato,1 kg",
+        ",1 kg,20",
+        "Garlic,250 g,-5",
+        "Ginger,250 g,25",
+    ])
+    report = (await product_ingest.ingest("s1", csv_upload(body))).to_dict()
+
+    assert (report["rows"], report["inserted"], report["failed"]) == (6, 2, 4)
+    assert [e["row"] for e in report["errors"]] == [2, 3, 4, 5]
+    assert report["errors"][0]["error"].startswith("price:")
+    assert report["errors"][1]["error"].startswith("price:")
+    assert report["errors"][2]["error"] == "name and unit are required"
+    assert report["errors"][3]["error"] == "price must be positive"
+
+    products = await db.products.find({}, {"_id": 0}).sort("name", 1).to_list(None)
+    assert [(p["name"], p["seller_price"], p["status"], p["seller_id"]) for p in products] == [
+        ("Ginger", 25.0, "PENDING", "s1"), ("Onion", 40.0, "PENDING", "s1"),
+    ]
+
+
+async def test_ndjson_bad_json_and_wrong_shapes(db):
+    body = "\n".join([
+        '{"name": "Onion", "unit": "1 kg", "price": 40}',
+        '{"name": "Potato", "unit": "1 kg", "price": 30',
+        '["Tomato", "1 kg", 20]',
+        '{"name": "Garlic", "price": 20}',
+    ])
+    report = (await product_ingest.ingest("s1", ndjson_upload(body))).to_dict()
+
+    assert (report["rows"], report["inserted"], report["failed"]) == (4, 1, 3)
+    assert report["errors"][0]["row"] == 2 and report["errors"][0]["error"].startswith("Invalid JSON")
+    assert report["errors"][2] == {"row": 4, "error": "unit: Field required"}
+
+
+async def test_duplicate_keys_fail_only_their_rows(db, monkeypatch):
+    monkeypatch.setattr(product_ingest, "INGEST_CHUNK_SIZE", 3)
+    await db.products.insert_one({"id": "p2", "name": "Existing"})
+    # Row 2 collides with a stored product, row 5 with row 4 in the same chunk
+    ids = iter(["p1", "p2", "p3", "p4", "p4"])
+    monkeypatch.setattr(product_ingest, "gen_id", lambda: next(ids))
+    body = "name,unit,price\n" + "".join(f"Item {n},1 kg,10\n" for n in range(1, 6))
+
+    report = (await product_ingest.ingest("s1", csv_upload(body))).to_dict()
+
+    assert (report["rows"], report["inserted"], report["failed"]) == (5, 3, 2)
+    assert [e["row"] for e in report["errors"]] == [2, 5]
+    assert all("duplicate key" in e["error"].lower() for e in report["errors"])
+    assert await db.products.count_documents({"seller_id": "s1"}) == 3
+
+
+async def test_row_cap_and_error_list_cap(db, monkeypatch):
+    monkeypatch.setattr(product_ingest, "INGEST_MAX_ROWS", 5)
+    monkeypatch.setattr(product_ingest, "INGEST_MAX_REPORTED_ERRORS", 2)
+    body = "name,unit,price\n" + "".join(itertools.repeat("Onion,1 kg,0\n", 8))
+
+    report = (await product_ingest.ingest("s1", csv_upload(body, chunk_size=64))).to_dict()
+
+    # Five rejected rows plus the cap notice, but only the first two listed
+    assert (report["rows"], report["inserted"], report["failed"]) == (5, 0, 6)
+    assert len(report["errors"]) == 2 and report["errors_truncated"]
@@ -0,0 +1,190 @@
+"""Mongo round trips per request on the hot read endpoints, held to ``query_budget`` markers.
+
+mongomock has no command monitoring, so ``TracedDb`` reports each collection call to
+``query_trace.trace_listener`` the way pymongo would. Budgets are the counts the endpoints
+make today; a new query, or a per-row lookup, fails the test.
+"""
+import itertools
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import middleware
+import server
+from models import now_iso
+from routes import admin, auth, customer, delivery, seller
+from services import catalog, earnings, order_ids, query_trace, stats, stock, user_cache
+
+pytestmark = pytest.mark.anyio
+
+ROWS = 12
+
+
+def _query(args, kwargs, key="filter"):
+    return args[0] if args else kwargs.get(key, {})
+
+
+COMMANDS = {
+    "find": lambda name, a, k: ("find", {"find": name, "filter": _query(a, k)}),
+    "find_one": lambda name, a, k: ("find", {"find": name, "filter": _query(a, k)}),
+    "count_documents": lambda name, a, k: ("aggregate", {"aggregate": name, "pipeline": [{"$match": _query(a, k)}]}),
+    "estimated_document_count": lambda name, a, k: ("count", {"count": name}),
+    "distinct": lambda name, a, k: ("distinct", {"distinct": name, "query": a[1] if len(a) > 1 else k.get("filter", {})}),
+    "aggregate": lambda name, a, k: ("aggregate", {"aggregate": name, "pipeline": _query(a, k, "pipeline")}),
+    "insert_one": lambda name, a, k: ("insert", {"insert": name}),
+    "insert_many": lambda name, a, k: ("insert", {"insert": name}),
+    "update_one": lambda name, a, k: ("update", {"update": name, "updates": [{"q": _query(a, k)}]}),
+    "update_many": lambda name, a, k: ("update", {"update": name, "updates": [{"q": _query(a, k)}]}),
+    "replace_one": lambda name, a, k: ("update", {"update": name, "updates": [{"q": _query(a, k)}]}),
+    "bulk_write": lambda name, a, k: ("update", {"update": name, "updates": [{"q": {}} for _ in _query(a, k, "requests")]}),
+    "delete_one": lambda name, a, k: ("delete", {"delete": name, "deletes": [{"q": _query(a, k)}]}),
+    "delete_many": lambda name, a, k: ("delete", {"delete": name, "deletes": [{"q": _query(a, k)}]}),
+    "find_one_and_update": lambda name, a, k: ("findAndModify", {"findAndModify": name, "query": _query(a, k)}),
+    "find_one_and_replace": lambda name, a, k: ("findAndModify", {"findAndModify": name, "query": _query(a, k)}),
+    "find_one_and_delete": lambda name, a, k: ("findAndModify", {"findAndModify": name, "query": _query(a, k)}),
+}
+
+_request_ids = itertools.count(1)
+
+
+def report(command_name, command):
+    event = SimpleNamespace(command_name=command_name, command=command, request_id=next(_request_ids), duration_micros=0)
+    query_trace.trace_listener.started(event)
+    query_trace.trace_listener.succeeded(event)
+
+
+class TracedCollection:
+    def __init__(self, collection, name):
+        self._collection = collection
+        self._name = name
+
+    def __getattr__(self, attr):
+        method = getattr(self._collection, attr)
+        if attr not in COMMANDS:
+            return method
+
+        def traced(*args, **kwargs):
+            report(*COMMANDS[attr](self._name, args, kwargs))
+            return method(*args, **kwargs)
+        return traced
+
+
+class TracedDb:
+    """The test database, with every collection call reported as one round trip."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return TracedCollection(getattr(self._db, name), name)
+
+    def __getitem__(self, name):
+        return TracedCollection(self._db[name], name)
+
+
+WIRED = [admin, auth, customer, delivery, seller, catalog, earnings, order_ids, stats, stock, user_cache]
+
+
+@pytest.fixture
+async def client(db, monkeypatch):
+    traced = TracedDb(db)
+    for module in WIRED:
+        monkeypatch.setattr(module, "db", traced)
+    user_cache.clear()
+    catalog._page_cache.clear()
+    seller._dashboard_cache.clear()
+    await seed(db)
+    await stats.reconcile(days=None)
+    await catalog.rebuild()
+    # Without the lifespan: the tests wire the database themselves
+    return TestClient(server.app)
+
+
+async def seed(db):
+    today = now_iso()
+    await db.users.insert_many([
+        {"id": "c1", "phone": "9000000001", "role": "CUSTOMER", "status": "ACTIVE", "city": "Pune", "location_set": True},
+        {"id": "s1", "phone": "9000000002", "role": "SELLER", "status": "ACTIVE", "city": "Pune",
+         "approval_status": "APPROVED", "daily_stock_date": today[:10]},
+        {"id": "a1", "phone": "9000000003", "role": "ADMIN", "status": "ACTIVE", "city": ""},
+    ])
+    await db.products.insert_many([
+        {"id": f"p{n}", "seller_id": "s1", "name": f"Item {n}", "unit": "1 kg", "status": "APPROVED",
+         "stock": n, "seller_price": 10 + n, "created_at": today}
+        for n in range(ROWS)
+    ])
+    await db.orders.insert_many([
+        {"id": f"o{n}", "customer_id": "c1", "seller_id": "s1", "delivery_partner_id": "",
+         "status": ["ASSIGNED", "ACCEPTED", "READY_FOR_PICKUP", "DELIVERED"][n % 4],
+         "items": [], "total_amount": 100, "created_at": f"{today[:10]}T00:00:{n:02d}", "updated_at": today}
+        for n in range(ROWS)
+    ])
+    await db.earnings.insert_many([
+        {"id": f"e{n}", "user_id": "s1", "order_id": f"o{n}", "amount": 50, "status": "PENDING", "created_at": today}
+        for n in range(ROWS)
+    ])
+    await db.audit_logs.insert_many([
+        {"id": f"log{n}", "actor_id": "a1", "action": "TEST", "created_at": f"{today[:10]}T00:00:{n:02d}"}
+        for n in range(ROWS)
+    ])
+
+
+def login(user_id, role):
+    return {"Authorization": f"Bearer {middleware.create_token(user_id, role, 'Pune', 'ACTIVE', user_id)}"}
+
+
+def get(client, path, user_id, role, **params):
+    response = client.get(path, headers=login(user_id, role), params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.mark.query_budget(2)
+async def test_catalog_page(client, query_budget):
+    body = get(client, "/api/customer/products", "c1", "CUSTOMER")
+    assert len(body["products"]) == ROWS
+
+    # The cached page costs only the user lookup, which is cached too
+    get(client, "/api/customer/products", "c1", "CUSTOMER")
+    assert [trace.count for _, _, trace in query_budget.requests] == [2, 0]
+
+
+@pytest.mark.query_budget(1)
+async def test_customer_orders(client, query_budget):
+    assert len(get(client, "/api/customer/orders", "c1", "CUSTOMER")["orders"]) == ROWS
+    assert len(get(client, "/api/customer/orders", "c1", "CUSTOMER", limit=5)["orders"]) == 5
+
+
+@pytest.mark.query_budget(5)
+async def test_seller_dashboard(client, query_budget):
+    body = get(client, "/api/seller/dashboard", "s1", "SELLER")
+    assert body["today_orders"]["total"] == ROWS
+    assert body["earnings"]["today"] == ROWS * 50
+
+    get(client, "/api/seller/dashboard", "s1", "SELLER")
+    assert query_budget.requests[-1][2].count == 0
+
+
+@pytest.mark.query_budget(1)
+async def test_seller_orders(client, query_budget):
+    body = get(client, "/api/seller/orders", "s1", "SELLER")
+    assert len(body["orders"]) == ROWS - ROWS // 4
+
+
+@pytest.mark.query_budget(2)
+async def test_admin_dashboard(client, query_budget):
+    body = get(client, "/api/admin/dashboard", "a1", "ADMIN")
+    assert len(body["recent_activity"]) == 10
+    assert body["delivered_orders"] == ROWS // 4
+
+
+def test_a_per_row_lookup_is_reported():
+    trace = query_trace.QueryTrace()
+    token = query_trace._current.set(trace)
+    try:
+        for n in range(ROWS):
+            report("find", {"find": "products", "filter": {"id": f"p{n}"}})
+    finally:
+        query_trace._current.reset(token)
+    assert trace.count == ROWS and list(trace.repeated().values()) == [ROWS]
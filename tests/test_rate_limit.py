@@ -0,0 +1,48 @@
+import pytest
+
+from services import rate_limit
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_parse_limit():
+    assert rate_limit.parse_limit("5/900") == (5.0, 5.0 / 900)
+    assert rate_limit.parse_limit("10") == (10.0, 10.0)
+
+
+async def test_burst_then_refused_with_retry_after(clock):
+    bucket = rate_limit.MemoryTokenBucket("t", *rate_limit.parse_limit("3/30"))
+    assert [await bucket.hit("a") for _ in range(3)] == [(True, 0)] * 3
+    assert await bucket.hit("a") == (False, 10)
+    # Other callers have their own bucket
+    assert await bucket.hit("b") == (True, 0)
+
+
+async def test_refills_over_time(clock):
+    bucket = rate_limit.MemoryTokenBucket("t", *rate_limit.parse_limit("2/20"))
+    await bucket.hit("a")
+    await bucket.hit("a")
+    assert (await bucket.hit("a"))[0] is False
+
+    clock.now += 10
+    assert await bucket.hit("a") == (True, 0)
+    assert (await bucket.hit("a"))[0] is False
+
+    # Never refills past capacity
+    clock.now += 1000
+    assert [(await bucket.hit("a"))[0] for _ in range(3)] == [True, True, False]
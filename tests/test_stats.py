@@ -0,0 +1,94 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from services import stats
+
+pytestmark = pytest.mark.anyio
+
+
+def days_ago(n):
+    return (datetime.now(timezone.utc) - timedelta(days=n)).isoformat()
+
+
+@pytest.fixture
+async def history(db):
+    await db.orders.insert_many([
+        {"id": "o1", "status": "CREATED", "created_at": days_ago(0)},
+        {"id": "o2", "status": "DELIVERED", "created_at": days_ago(0)},
+        {"id": "o3", "status": "DELIVERED", "created_at": days_ago(1)},
+        {"id": "o4", "status": "CANCELLED", "created_at": days_ago(10)},
+    ])
+    await db.users.insert_many([
+        {"id": "s1", "phone": "1", "role": "SELLER", "approval_status": "APPROVED", "status": "ACTIVE"},
+        {"id": "s2", "phone": "2", "role": "SELLER", "approval_status": "PENDING", "status": "ACTIVE"},
+        {"id": "d1", "phone": "3", "role": "DELIVERY", "approval_status": "APPROVED", "status": "SUSPENDED"},
+    ])
+
+
+async def stats_doc(db, doc_id):
+    return await db.stats.find_one({"id": doc_id}, {"_id": 0}) or {}
+
+
+async def test_full_reconcile_backfills_every_counter(db, history):
+    await stats.reconcile(days=None)
+
+    global_doc = await stats_doc(db, stats.GLOBAL_ID)
+    assert global_doc["orders"] == {"CREATED": 1, "DELIVERED": 2, "CANCELLED": 1}
+    assert global_doc["users"] == {"active_sellers": 1, "pending_approvals": 1}
+    assert (await stats_doc(db, stats.day_id(days_ago(0)[:10])))["orders_created"] == 2
+    assert (await stats_doc(db, stats.day_id(days_ago(10)[:10])))["orders_created"] == 1
+
+
+async def test_drift_is_corrected_for_recent_days_only(db, history):
+    await stats.reconcile(days=None)
+    today, old = stats.day_id(days_ago(0)[:10]), stats.day_id(days_ago(10)[:10])
+    await db.stats.update_one({"id": stats.GLOBAL_ID}, {"$inc": {
+        "orders.CREATED": 3, "orders.ASSIGNED": 2, "users.active_sellers": -1,
+    }})
+    await db.stats.update_one({"id": today}, {"$inc": {"orders_created": 5, "transitions.CREATED": 1}})
+    await db.stats.update_one({"id": old}, {"$inc": {"orders_created": 5}})
+
+    await stats.reconcile(days=2)
+
+    global_doc = await stats_doc(db, stats.GLOBAL_ID)
+    # A status with no orders left is brought back to zero rather than dropped
+    assert global_doc["orders"] == {"CREATED": 1, "ASSIGNED": 0, "DELIVERED": 2, "CANCELLED": 1}
+    assert global_doc["users"]["active_sellers"] == 1
+    assert (await stats_doc(db, today))["orders_created"] == 2
+    # Outside the window: left as it was
+    assert (await stats_doc(db, old))["orders_created"] == 6
+
+
+async def test_counters_updated_during_the_recount_are_left_alone(db, history, monkeypatch):
+    await db.stats.insert_one({"id": stats.GLOBAL_ID, "orders": {"CREATED": 7, "DELIVERED": 9}})
+    read_counters = stats._read_counters
+    reads = []
+
+    async def read_with_a_concurrent_checkout(since):
+        counters = await read_counters(since)
+        if not reads:
+            # An order placed between the two reads: its $inc must survive
+            await db.orders.insert_one({"id": "o5", "status": "CREATED", "created_at": days_ago(0)})
+            await stats.record_order_created("CREATED")
+        reads.append(since)
+        return counters
+
+    monkeypatch.setattr(stats, "_read_counters", read_with_a_concurrent_checkout)
+    await stats.reconcile(days=2)
+
+    orders = (await stats_doc(db, stats.GLOBAL_ID))["orders"]
+    assert orders["CREATED"] == 8 and orders["DELIVERED"] == 2
+
+    # The next run, with nothing in flight, settles it
+    monkeypatch.setattr(stats, "_read_counters", read_counters)
+    await stats.reconcile(days=2)
+    assert (await stats_doc(db, stats.GLOBAL_ID))["orders"]["CREATED"] == 2
+
+
+async def test_one_worker_per_interval(db):
+    now = datetime.now(timezone.utc)
+    assert await stats._acquire_run(now)
+    assert not await stats._acquire_run(now)
+    assert not await stats._acquire_run(now + timedelta(seconds=stats.STATS_RECONCILE_SECONDS - 1))
+    assert await stats._acquire_run(now + timedelta(seconds=stats.STATS_RECONCILE_SECONDS))
@@ -0,0 +1,125 @@
+import pytest
+
+from services import stock
+
+pytestmark = pytest.mark.anyio
+
+
+async def stock_levels(db):
+    return {p["id"]: (p["stock"], p.get("stock_holds", [])) for p in await db.products.find({}).to_list(None)}
+
+
+@pytest.fixture
+async def products(db):
+    await db.products.insert_many([{"id": "p1", "stock": 5}, {"id": "p2", "stock": 1}])
+
+
+async def test_reserve_all_lines(db, products):
+    assert await stock.reserve_stock("h1", [{"product_id": "p1", "quantity": 2}, {"product_id": "p2", "quantity": 1}])
+    assert await stock_levels(db) == {"p1": (3, ["h1"]), "p2": (0, ["h1"])}
+
+
+async def test_partial_failure_releases_only_its_own_hold(db, products):
+    assert await stock.reserve_stock("other", [{"product_id": "p1", "quantity": 1}])
+
+    # p2 can't cover 2, so the p1 line that did succeed is handed back
+    assert not await stock.reserve_stock("h1", [{"product_id": "p1", "quantity": 2}, {"product_id": "p2", "quantity": 2}])
+    assert await stock_levels(db) == {"p1": (4, ["other"]), "p2": (1, [])}
+
+
+async def test_release_is_per_hold_and_idempotent(db, products):
+    items = [{"product_id": "p1", "quantity": 2}]
+    assert await stock.reserve_stock("h1", items)
+    assert await stock.reserve_stock("h2", items)
+
+    await stock.release_stock("h1", items)
+    await stock.release_stock("h1", items)
+    assert (await stock_levels(db))["p1"] == (3, ["h2"])
+
+    await stock.commit_stock("h2", items)
+    assert (await stock_levels(db))["p1"] == (3, [])
+
+
+def test_hold_ids():
+    assert stock.new_hold_id("ORD-1") != stock.new_hold_id("ORD-1")
+    assert stock.hold_id({"id": "ORD-1"}) == "ORD-1"
+    assert stock.hold_id({"id": "ORD-1", "stock_hold_id": "ORD-1:x"}) == "ORD-1:x"
+
+
+class WriteRacedBy:
+    """Stands in for ``stock.db`` and runs ``race`` just before the first products bulk write."""
+
+    def __init__(self, db, race):
+        self._db = db
+        self._race = race
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    @property
+    def products(self):
+        return self
+
+    def find(self, *args, **kwargs):
+        return self._db.products.find(*args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        race, self._race = self._race, None
+        if race:
+            await race()
+        return await self._db.products.bulk_write(*args, **kwargs)
+
+
+@pytest.fixture
+async def seller_products(db):
+    await db.products.insert_many([{"id": "p1", "seller_id": "s1", "stock": 5}, {"id": "p2", "seller_id": "s1", "stock": 1}])
+
+
+async def test_confirm_nets_off_open_holds_so_a_release_restores_the_count(db, seller_products):
+    items = [{"product_id": "p1", "quantity": 2}]
+    assert await stock.reserve_stock("h1", items)
+
+    # The seller counts 6 on the shelf, the 2 held units among them
+    assert await stock.confirm_levels("s1", {"p1": 6, "p2": 0}) == []
+    assert await stock_levels(db) == {"p1": (4, ["h1"]), "p2": (0, [])}
+
+    await stock.release_stock("h1", items)
+    assert (await stock_levels(db))["p1"] == (6, [])
+
+
+async def test_confirm_then_commit_keeps_the_netted_level(db, seller_products):
+    items = [{"product_id": "p1", "quantity": 2}]
+    assert await stock.reserve_stock("h1", items)
+    await stock.confirm_levels("s1", {"p1": 6})
+
+    await stock.commit_stock("h1", items)
+    await stock.release_stock("h1", items)
+    assert (await stock_levels(db))["p1"] == (4, [])
+
+
+async def test_confirm_only_touches_the_sellers_products(db, seller_products):
+    await db.products.insert_one({"id": "other", "seller_id": "s2", "stock": 3})
+    await stock.confirm_levels("s1", {"other": 9})
+    assert (await stock_levels(db))["other"] == (3, [])
+
+
+async def test_confirm_retries_when_a_reservation_lands_in_between(db, seller_products, monkeypatch):
+    items = [{"product_id": "p1", "quantity": 2}]
+
+    async def reserve():
+        assert await stock.reserve_stock("h1", items)
+
+    monkeypatch.setattr(stock, "db", WriteRacedBy(db, reserve))
+    assert await stock.confirm_levels("s1", {"p1": 6, "p2": 1}) == []
+    assert await stock_levels(db) == {"p1": (4, ["h1"]), "p2": (1, [])}
+
+
+async def test_confirm_gives_up_on_a_product_that_never_settles(db, seller_products, monkeypatch):
+    monkeypatch.setattr(stock, "STOCK_CONFIRM_ATTEMPTS", 1)
+
+    async def reserve():
+        assert await stock.reserve_stock("h1", [{"product_id": "p1", "quantity": 1}])
+
+    monkeypatch.setattr(stock, "db", WriteRacedBy(db, reserve))
+    assert await stock.confirm_levels("s1", {"p1": 6, "p2": 3}) == ["p1"]
+    assert await stock_levels(db) == {"p1": (4, ["h1"]), "p2": (3, [])}